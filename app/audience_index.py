@@ -0,0 +1,349 @@
+"""
+In-memory audience index of subscriber ids per location
+"""
+import os
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, select
+
+from .db_helper import session_local
+from .logger import Logger
+from .models import Person
+from .regions import LEVELS, TARGETS, normalize
+from .settings import settings
+
+try:
+    import numpy as np
+except ImportError:  # optional, see the audience-index extra
+    np = None
+
+Key = Tuple[str, str]  # (region kind, normalized key)
+COLUMNS = [getattr(Person, column) for _, column in LEVELS]
+CHUNK_SIZE = 10000  # subscribers read at a time
+# updates stamped this long before a catch up started are read again by the
+# next one, in case their transaction committed after it
+UPDATE_OVERLAP = timedelta(minutes=1)
+
+
+class AudienceIndex:
+    """
+    Subscriber ids per pincode, city, state and country, held in memory.
+
+    Every location has a roaring style container: a sorted uint32 array of
+    ids while it is small, a packed bitset once the array would be larger
+    (more than one subscriber in 32 of all ids). The audience of an alert
+    is the union of the containers of its targets, computed with NumPy
+    without going to the database.
+
+    Every subscriber's location is kept as a code into the distinct
+    locations, so subscribers can be moved or removed. The index is saved
+    to a snapshot on shutdown and loaded from it on startup. Before each
+    lookup, subscribers added since, by any process, are read by id range
+    and subscribers updated since (e.g. moved by an import) by updated_at.
+    Removals are only seen by the process that makes them, but recipients
+    are read back from people by id, so removed subscribers are skipped.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError(
+                "AUDIENCE_INDEX needs NumPy, install the audience-index extra"
+            )
+        self.sets: Dict[Key, "np.ndarray"] = {}
+        self.locations: List[Tuple[str, ...]] = []  # normalized, in LEVELS order
+        self.location_codes: Dict[Tuple[str, ...], int] = {}
+        self.person_locations = np.full(0, -1, dtype=np.int32)
+        self.high_water = 0  # highest subscriber id indexed
+        self.updated_at: Optional[datetime] = None  # start of the last catch up
+        self.ready = False
+        self.lock = threading.RLock()
+
+    def _dense(self, ids) -> bool:
+        return len(ids) * 32 > self.high_water + 1
+
+    @staticmethod
+    def _to_bits(ids, size) -> "np.ndarray":
+        bits = np.zeros(size + 1, dtype=bool)
+        bits[ids] = True
+        return np.packbits(bits, bitorder="little")
+
+    @staticmethod
+    def _ids(container) -> "np.ndarray":
+        if container.dtype == np.uint32:
+            return container
+        return np.flatnonzero(np.unpackbits(container, bitorder="little")).astype(
+            np.uint32
+        )
+
+    def _add(self, key, person_id):
+        container = self.sets.get(key)
+        if container is None:
+            self.sets[key] = np.array([person_id], dtype=np.uint32)
+        elif container.dtype == np.uint32:
+            position = np.searchsorted(container, person_id)
+            if position < len(container) and container[position] == person_id:
+                return
+            container = np.insert(container, position, person_id)
+            self.sets[key] = (
+                self._to_bits(container, self.high_water)
+                if self._dense(container)
+                else container
+            )
+        else:
+            byte = person_id >> 3
+            if byte >= len(container):
+                container = self.sets[key] = np.concatenate(
+                    [container, np.zeros(byte + 1 - len(container), dtype=np.uint8)]
+                )
+            container[byte] |= 1 << (person_id & 7)
+
+    def _remove(self, key, person_id):
+        container = self.sets.get(key)
+        if container is None:
+            return
+        if container.dtype == np.uint32:
+            position = np.searchsorted(container, person_id)
+            if position < len(container) and container[position] == person_id:
+                self.sets[key] = np.delete(container, position)
+        elif (person_id >> 3) < len(container):
+            container[person_id >> 3] &= ~np.uint8(1 << (person_id & 7))
+
+    def _location(self, row) -> int:
+        location = tuple(normalize(getattr(row, column.key)) for column in COLUMNS)
+        if (code := self.location_codes.get(location)) is None:
+            code = self.location_codes[location] = len(self.locations)
+            self.locations.append(location)
+        return code
+
+    def _keys(self, code) -> Iterable[Key]:
+        return zip((kind for kind, _ in LEVELS), self.locations[code])
+
+    def subscribe(self, person):
+        """
+        Add a subscriber, or move it to its current location
+        :param person: row or model with id and the location columns
+        :return: None
+        """
+        with self.lock:
+            self.unsubscribe(person.id)
+            code = self._location(person)
+            if person.id >= len(self.person_locations):
+                grown = np.full(
+                    max(person.id + 1, 2 * len(self.person_locations)),
+                    -1,
+                    dtype=np.int32,
+                )
+                grown[: len(self.person_locations)] = self.person_locations
+                self.person_locations = grown
+            self.person_locations[person.id] = code
+            self.high_water = max(self.high_water, person.id)
+            for key in self._keys(code):
+                self._add(key, person.id)
+
+    def unsubscribe(self, person_id):
+        """
+        Remove a subscriber
+        :param person_id: subscriber id
+        :return: None
+        """
+        with self.lock:
+            if person_id >= len(self.person_locations):
+                return
+            code = int(self.person_locations[person_id])
+            if code < 0:
+                return
+            for key in self._keys(code):
+                self._remove(key, person_id)
+            self.person_locations[person_id] = -1
+
+    def catch_up(self, db, person_ids=None):
+        """
+        Index subscribers added or updated since the last lookup, or the
+        given ones (e.g. updated by an import)
+        :param db: database session
+        :param person_ids: ids to re-index, the subscribers above the high
+            water mark or updated since the last catch up if None
+        :return: number of subscribers indexed
+        """
+        query = select(Person.id, *COLUMNS)
+        if person_ids is None:
+            changed = Person.id > self.high_water
+            if self.updated_at is not None:
+                changed = or_(
+                    changed, Person.updated_at >= self.updated_at - UPDATE_OVERLAP
+                )
+            self.updated_at = db.scalar(select(func.now()))
+            queries = [query.where(changed).order_by(Person.id)]
+        else:
+            person_ids = list(person_ids)
+            queries = [
+                query.where(Person.id.in_(person_ids[start : start + CHUNK_SIZE]))
+                for start in range(0, len(person_ids), CHUNK_SIZE)
+            ]
+        count = 0
+        for query in queries:
+            for row in db.execute(query.execution_options(yield_per=CHUNK_SIZE)):
+                self.subscribe(row)
+                count += 1
+        return count
+
+    def lookup(self, alert) -> "np.ndarray":
+        """
+        Ids of the subscribers targeted by an alert's locations
+        :param alert: alert create request
+        :return: sorted uint32 ids
+        """
+        with self.lock:
+            containers = [
+                container
+                for field, kind in TARGETS.items()
+                for value in getattr(alert, field) or []
+                if (container := self.sets.get((kind, normalize(value)))) is not None
+            ]
+        sparse = [c for c in containers if c.dtype == np.uint32]
+        dense = [c for c in containers if c.dtype != np.uint32]
+        if len(containers) == 1:
+            return self._ids(containers[0])
+        if dense:
+            bits = np.zeros(max(len(c) for c in dense), dtype=np.uint8)
+            for container in dense:
+                bits[: len(container)] |= container
+            return np.union1d(self._ids(bits), np.concatenate(sparse or [bits[:0]]))
+        return np.unique(np.concatenate(sparse or [np.zeros(0, dtype=np.uint32)]))
+
+    def build(self, db):
+        """
+        Index every subscriber, grouping ids per location with NumPy
+        :param db: database session
+        :return: None
+        """
+        ids, codes = array("I"), array("i")
+        with self.lock:
+            self.updated_at = db.scalar(select(func.now()))
+            for row in db.execute(
+                select(Person.id, *COLUMNS)
+                .order_by(Person.id)
+                .execution_options(yield_per=CHUNK_SIZE)
+            ):
+                ids.append(row.id)
+                codes.append(self._location(row))
+            ids_, codes_ = np.frombuffer(ids, np.uint32), np.frombuffer(codes, np.int32)
+            self.high_water = int(ids_[-1]) if len(ids_) else 0
+            self.person_locations = np.full(self.high_water + 1, -1, dtype=np.int32)
+            self.person_locations[ids_] = codes_
+            locations = np.array(self.locations, dtype=object).reshape(-1, len(LEVELS))
+            for level, (kind, _) in enumerate(LEVELS):
+                keys = locations[codes_, level] if len(ids_) else np.array([])
+                order = np.argsort(keys, kind="stable")
+                names, starts = np.unique(keys[order], return_index=True)
+                for name, members in zip(names, np.split(ids_[order], starts[1:])):
+                    members = np.sort(members)
+                    self.sets[(kind, name)] = (
+                        self._to_bits(members, self.high_water)
+                        if self._dense(members)
+                        else members
+                    )
+            self.ready = True
+
+    def save(self, path):
+        """
+        Write the index to a snapshot file, atomically
+        :param path: snapshot file
+        :return: None
+        """
+        with self.lock:
+            keys = list(self.sets)
+            data = [self.sets[key].view(np.uint8) for key in keys]
+            snapshot = {
+                "keys": np.array([f"{kind}\t{name}" for kind, name in keys]),
+                "dense": np.array([self.sets[key].dtype == np.uint8 for key in keys]),
+                "offsets": np.cumsum([0] + [len(d) for d in data]),
+                "data": np.concatenate(data or [np.zeros(0, dtype=np.uint8)]),
+                "locations": np.array(["\t".join(l) for l in self.locations]),
+                "person_locations": self.person_locations,
+                "high_water": np.array(self.high_water),
+                "updated_at": np.array(
+                    self.updated_at.isoformat() if self.updated_at else ""
+                ),
+            }
+        with open(f"{path}.tmp", "wb") as file:
+            np.savez(file, **snapshot)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self, path):
+        """
+        Read the index from a snapshot file
+        :param path: snapshot file
+        :return: None
+        """
+        with np.load(path) as snapshot, self.lock:
+            offsets, data = snapshot["offsets"], snapshot["data"]
+            for index, (key, dense) in enumerate(
+                zip(snapshot["keys"], snapshot["dense"])
+            ):
+                chunk = data[offsets[index] : offsets[index + 1]].copy()
+                self.sets[tuple(key.split("\t", 1))] = (
+                    chunk if dense else chunk.view(np.uint32)
+                )
+            self.locations = [
+                tuple(location.split("\t")) for location in snapshot["locations"]
+            ]
+            self.location_codes = {
+                location: code for code, location in enumerate(self.locations)
+            }
+            self.person_locations = snapshot["person_locations"]
+            self.high_water = int(snapshot["high_water"])
+            updated_at = str(snapshot["updated_at"])
+            self.updated_at = datetime.fromisoformat(updated_at) if updated_at else None
+            self.ready = True
+
+    def start(self, db, path):
+        """
+        Load the index from its snapshot and catch up with the subscribers
+        added or updated since, or build it from the database if there is
+        no snapshot
+        :param db: database session
+        :param path: snapshot file
+        :return: None
+        """
+        if os.path.exists(path):
+            self.load(path)
+            changed = self.catch_up(db)
+            self.logger.info(
+                "Audience index loaded, %s subscribers added or updated", changed
+            )
+        else:
+            self.build(db)
+            self.logger.info("Audience index built up to id %s", self.high_water)
+
+
+audience_index: Optional[AudienceIndex] = (
+    AudienceIndex() if settings().AUDIENCE_INDEX else None
+)
+
+
+async def start_audience_index():
+    """
+    Load or build the audience index in the threadpool, at startup
+    :return: None
+    """
+
+    def start():
+        with session_local() as db:
+            audience_index.start(db, settings().AUDIENCE_INDEX_SNAPSHOT)
+
+    await run_in_threadpool(start)
+
+
+def save_audience_index():
+    """
+    Snapshot the audience index, at shutdown
+    :return: None
+    """
+    audience_index.save(settings().AUDIENCE_INDEX_SNAPSHOT)
@@ -2,15 +2,44 @@
 This file contains the database helper functions.
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from .replicas import ReplicaRouter
 from .settings import settings
 
 settings = settings()
 DB_URL = f"postgresql://{settings.USERNAME}:{settings.PASSWORD}@{settings.HOST}/{settings.DATABASE}"
+ASYNC_DB_URL = DB_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
 
-engine = create_engine(DB_URL)
+# background jobs, bulk imports (COPY) and migrations use the sync engine
+engine = create_engine(DB_URL, **POOL_OPTIONS)
 session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# request handlers use the async engine so queries do not block the event loop
+async_engine = create_async_engine(ASYNC_DB_URL, **POOL_OPTIONS)
+async_session_local = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+# read-only handlers use the replicas, falling back to the primary
+read_router = ReplicaRouter(
+    async_engine,
+    [
+        create_async_engine(
+            f"postgresql+asyncpg://{settings.USERNAME}:{settings.PASSWORD}@{host.strip()}/{settings.DATABASE}",
+            **POOL_OPTIONS,
+        )
+        for host in settings.DB_REPLICAS.split(",")
+        if host.strip()
+    ],
+    max_lag=settings.DB_REPLICA_MAX_LAG,
+)
 Base = declarative_base()
 
 
@@ -24,3 +53,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """
+    Returns an async database session
+    :return: async database session
+    """
+    async with async_session_local() as db:
+        yield db
+
+
+async def get_read_db():
+    """
+    Returns an async database session for read-only queries,
+    on a read replica when one is configured and healthy
+    :return: async database session
+    """
+    async with await read_router.session() as db:
+        yield db
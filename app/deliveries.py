@@ -0,0 +1,103 @@
+"""
+Per recipient delivery state of alerts
+"""
+import threading
+from typing import Dict, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exists, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import Delivery, Person
+
+INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def sent(alert_id, channel):
+    """
+    Predicate matching subscribers the alert was already sent to over a channel
+    :param alert_id: id of the stored alert
+    :param channel: text or email
+    :return: SQL expression correlated with people
+    """
+    return exists().where(
+        Delivery.alert_id == alert_id,
+        Delivery.channel == channel,
+        Delivery.person_id == Person.id,
+        Delivery.status == "sent",
+    )
+
+
+class DeliveryRecorder:
+    """
+    Records the outcome of every send of an alert in the deliveries table.
+
+    Outcomes are buffered and upserted batch_size at a time on their own
+    session, so recording neither costs a round trip per message nor
+    disturbs the cursor the recipients are streamed from. Writes run in
+    the threadpool, one at a time. A recipient recorded again (a retry)
+    has its status replaced and attempts counted.
+    """
+
+    def __init__(self, db, alert_id, batch_size=1000):
+        """
+        :param db: database session used only for recording
+        :param alert_id: id of the stored alert
+        :param batch_size: outcomes written per statement
+        """
+        self.db = db
+        self.alert_id = alert_id
+        self.batch_size = batch_size
+        self.pending: Dict[Tuple[str, int], str] = {}
+        self.lock = threading.Lock()
+
+    async def record(self, channel, recipient, delivered):
+        """
+        Buffer the outcome of one send
+        :param channel: text or email
+        :param recipient: row with the subscriber id
+        :param delivered: whether the send succeeded
+        :return: None
+        """
+        self.pending[(channel, recipient.id)] = "sent" if delivered else "failed"
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Upsert the buffered outcomes
+        :return: None
+        """
+        pending, self.pending = self.pending, {}
+        if pending:
+            await run_in_threadpool(self.write, pending)
+
+    def write(self, pending):
+        """
+        Upsert outcomes, one write at a time
+        :param pending: (channel, subscriber id) -> status
+        :return: None
+        """
+        with self.lock:  # concurrent sends share the session
+            insert = INSERTS[self.db.get_bind().dialect.name](Delivery)
+            self.db.execute(
+                insert.values(
+                    [
+                        {
+                            "alert_id": self.alert_id,
+                            "channel": channel,
+                            "person_id": person_id,
+                            "status": status,
+                        }
+                        for (channel, person_id), status in pending.items()
+                    ]
+                ).on_conflict_do_update(
+                    index_elements=["alert_id", "channel", "person_id"],
+                    set_={
+                        "status": insert.excluded.status,
+                        "attempts": Delivery.attempts + 1,
+                        "updated_at": func.now(),
+                    },
+                )
+            )
+            self.db.commit()
@@ -0,0 +1,276 @@
+"""
+Concurrent fan-out of alerts to recipients
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List
+
+from fastapi.concurrency import run_in_threadpool
+
+from .logger import Logger, LogSampler
+
+
+@dataclass
+class DeliveryReport:
+    """
+    Outcome of a fan-out over a single channel
+    """
+
+    channel: str
+    queued: int = 0
+    sent: int = 0
+    failed: List[Any] = field(default_factory=list)
+    skipped: int = 0  # already delivered by an earlier attempt
+
+
+@dataclass
+class BatchSend:
+    """
+    A send that delivers to up to size recipients with one blocking call
+    """
+
+    send: Callable[[List[Any]], Any]
+    size: int
+
+
+class PriorityGate:
+    """
+    Grants a fixed number of slots, always to the highest priority waiter.
+    Waiters of equal priority are served in arrival order.
+    """
+
+    def __init__(self, slots):
+        """
+        :param slots: number of slots that can be held at once
+        """
+        self.free = slots
+        self.waiters: List = []  # heap of (-priority, arrival, future)
+        self.arrivals = itertools.count()
+
+    async def acquire(self, priority=0):
+        """
+        Wait for a slot
+        :param priority: higher is served first
+        :return: None
+        """
+        if self.free and not self.waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.arrivals), future))
+        try:
+            await future  # the slot is handed over by release
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # handed over just as the waiter was cancelled
+            raise
+
+    def release(self):
+        """
+        Hand the slot to the highest priority waiter, or free it
+        :return: None
+        """
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+    @asynccontextmanager
+    async def slot(self, priority=0):
+        """
+        Hold a slot for the duration of the block
+        :param priority: higher is served first
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def _send_one(send, batch):
+    return send(batch[0])
+
+
+class DeliveryEngine:
+    """
+    Delivers messages concurrently over a fixed set of channels.
+
+    The provider clients are blocking, so every channel gets its own
+    thread pool. The size of that pool is the concurrency limit of the
+    channel and is shared by all alerts being sent at the same time,
+    which keeps the event loop free while one large alert is fanned out.
+    Threads are handed out by a priority gate, so a higher priority
+    alert takes every thread that frees up from a lower priority
+    fan-out already in flight, which resumes once it is done.
+    Recipients usually come from a database cursor, so they are read a
+    chunk at a time in the threadpool, off the event loop.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self, limits: Dict[str, int], chunk_size=1000):
+        """
+        Set up a thread pool for every channel
+        :param limits: maximum number of concurrent sends per channel
+        :param chunk_size: recipients read at a time
+        """
+        self.limits = limits
+        self.chunk_size = chunk_size
+        self.executors = {
+            channel: ThreadPoolExecutor(
+                max_workers=limit, thread_name_prefix=f"dora-{channel}"
+            )
+            for channel, limit in limits.items()
+        }
+        self.gates = {channel: PriorityGate(limit) for channel, limit in limits.items()}
+
+    async def fan_out(
+        self,
+        channel: str,
+        send: Callable[[Any], Any],
+        recipients: Iterable[Any],
+        progress=None,
+        priority=0,
+    ) -> DeliveryReport:
+        """
+        Call send once for every recipient over the given channel.
+        Failures are reported instead of aborting the fan-out, and a
+        sample of them is logged.
+        :param channel: name of the channel, e.g. text or email
+        :param send: blocking callable that delivers to a single recipient
+        :param recipients: recipients to deliver to
+        :param progress: optional tracker notified as the report changes
+        :param priority: higher priority sends are served first
+        :return: delivery report for the channel
+        """
+        reports = await self.broadcast({channel: send}, recipients, progress, priority)
+        return reports[channel]
+
+    async def broadcast(
+        self,
+        sends: Dict[str, Callable[[Any], Any]],
+        recipients: Iterable[Any],
+        progress=None,
+        priority=0,
+        recorder=None,
+    ) -> Dict[str, DeliveryReport]:
+        """
+        Deliver to every recipient over several channels at once.
+        Recipients are read a single time and handed to the workers of every
+        channel through bounded queues, so the recipients are never held in
+        memory as a whole. Recipients flagged sent_<channel> are skipped
+        on that channel.
+        :param sends: channel -> blocking callable that delivers to a single
+            recipient, or a BatchSend
+        :param recipients: recipients to deliver to
+        :param progress: optional tracker notified as the reports change
+        :param priority: higher priority sends are served first
+        :param recorder: optional DeliveryRecorder told the outcome of every send
+        :return: delivery report per channel
+        """
+        loop = asyncio.get_running_loop()
+        # a provider outage fails every send, log a sample of the failures
+        failures = LogSampler(self.logger, logging.ERROR)
+        queues: Dict[str, asyncio.Queue] = {}
+        reports: Dict[str, DeliveryReport] = {}
+        workers = []
+
+        async def deliver(channel, send, batch, report):
+            try:
+                async with self.gates[channel].slot(priority):
+                    await loop.run_in_executor(self.executors[channel], send, batch)
+                report.sent += len(batch)
+                delivered = True
+            except Exception as e:
+                report.failed.extend(batch)
+                failures.log(channel, "Delivery over %s failed: %s", channel, e)
+                delivered = False
+            if recorder:
+                for recipient in batch:
+                    await recorder.record(channel, recipient, delivered)
+            if progress:
+                await progress.update()
+
+        async def worker(channel, send, queue, report):
+            if isinstance(send, BatchSend):
+                size, send = send.size, send.send
+            else:
+                size, send = 1, partial(_send_one, send)
+            done = False
+            while not done:
+                batch = []
+                while len(batch) < size:
+                    if (recipient := await queue.get()) is None:
+                        done = True
+                        break
+                    batch.append(recipient)
+                if batch:
+                    await deliver(channel, send, batch, report)
+
+        async def put(queue, item):
+            # a worker that died, e.g. on a recorder error, would leave its
+            # queue full forever: fail with its error instead of waiting
+            if not queue.full():
+                queue.put_nowait(item)
+                return
+            putter = asyncio.ensure_future(queue.put(item))
+            await asyncio.wait([putter, *workers], return_when=asyncio.FIRST_COMPLETED)
+            if putter.done():
+                return
+            putter.cancel()
+            for task in workers:
+                if task.done():
+                    task.result()
+
+        for channel, send in sends.items():
+            limit = self.limits[channel]
+            queues[channel] = asyncio.Queue(maxsize=limit * 2)
+            reports[channel] = DeliveryReport(channel)
+            if progress:
+                progress.track(reports[channel])
+            workers += [
+                asyncio.create_task(
+                    worker(channel, send, queues[channel], reports[channel])
+                )
+                for _ in range(limit)
+            ]
+        recipients = iter(recipients)
+        try:
+            while chunk := await run_in_threadpool(
+                list, itertools.islice(recipients, self.chunk_size)
+            ):
+                for recipient in chunk:
+                    for channel, queue in queues.items():
+                        if getattr(recipient, f"sent_{channel}", False):
+                            reports[channel].skipped += 1
+                            continue
+                        await put(queue, recipient)
+                        reports[channel].queued += 1
+            for channel, queue in queues.items():  # one sentinel per worker
+                for _ in range(self.limits[channel]):
+                    await put(queue, None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if recorder:  # keep what was delivered even if the fan-out failed
+                await recorder.flush()
+            failures.summary("%s more failed deliveries over %s not logged")
+        return reports
+
+    def shutdown(self):
+        """
+        Stop all channel thread pools
+        :return: None
+        """
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
@@ -0,0 +1,267 @@
+"""
+Geographic areas and the grid used to index subscriber coordinates.
+
+Coordinates are indexed by geocell: a 52 bit Z-order (Morton) code that
+interleaves 26 bits of longitude with 26 bits of latitude, the integer
+form of a geohash. Every prefix of a geocell is a grid cell, and all
+points in a cell form one contiguous range of geocells, so an area can
+be looked up with a few integer range scans on an ordinary index.
+"""
+import heapq
+import math
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+BITS = 26  # bits per axis
+LEVELS = BITS  # cell levels, each one splits both axes in two
+KM_PER_DEGREE = 111.2
+
+INSIDE, PARTIAL, OUTSIDE = "inside", "partial", "outside"
+
+
+def geocell(latitude, longitude) -> int:
+    """
+    Encode a coordinate into its geocell
+    :param latitude: latitude in degrees
+    :param longitude: longitude in degrees
+    :return: 52 bit Morton code
+    """
+    x = min(int((longitude + 180) / 360 * (1 << BITS)), (1 << BITS) - 1)
+    y = min(int((latitude + 90) / 180 * (1 << BITS)), (1 << BITS) - 1)
+    code = 0
+    for bit in range(BITS - 1, -1, -1):
+        code = (code << 2) | (((x >> bit) & 1) << 1) | ((y >> bit) & 1)
+    return code
+
+
+def locate(latitude, longitude) -> Optional[int]:
+    """
+    Geocell of a subscriber's coordinates, if they are known
+    :return: geocell or None
+    """
+    if latitude is None or longitude is None:
+        return None
+    return geocell(latitude, longitude)
+
+
+def cell_bounds(level, prefix) -> Tuple[float, float, float, float]:
+    """
+    Bounding box of a grid cell
+    :param level: number of bits per axis in the prefix
+    :param prefix: first 2 * level bits of the geocells in the cell
+    :return: (min longitude, min latitude, max longitude, max latitude)
+    """
+    x = y = 0
+    for bit in range(level - 1, -1, -1):
+        x = (x << 1) | ((prefix >> (2 * bit + 1)) & 1)
+        y = (y << 1) | ((prefix >> (2 * bit)) & 1)
+    width, height = 360 / (1 << level), 180 / (1 << level)
+    return (
+        x * width - 180,
+        y * height - 90,
+        (x + 1) * width - 180,
+        (y + 1) * height - 90,
+    )
+
+
+def cell_range(level, prefix) -> Tuple[int, int]:
+    """
+    Geocells in a grid cell
+    :param level: number of bits per axis in the prefix
+    :param prefix: first 2 * level bits of the geocells in the cell
+    :return: half open range [start, end)
+    """
+    shift = 2 * (LEVELS - level)
+    return prefix << shift, (prefix + 1) << shift
+
+
+def merge_ranges(ranges):
+    """
+    Merge overlapping and adjacent ranges
+    :param ranges: half open ranges
+    :return: sorted, disjoint ranges
+    """
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+class Circle:
+    """
+    Points within radius_km of a center.
+    Distances use an equirectangular projection around the center,
+    accurate for the radius of a regional emergency.
+    """
+
+    def __init__(self, latitude, longitude, radius_km):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.scale = math.cos(math.radians(latitude)) * KM_PER_DEGREE
+
+    def _project(self, longitude, latitude):
+        return (
+            (longitude - self.longitude) * self.scale,
+            (latitude - self.latitude) * KM_PER_DEGREE,
+        )
+
+    def contains(self, latitude, longitude) -> bool:
+        x, y = self._project(longitude, latitude)
+        return x * x + y * y <= self.radius_km**2
+
+    def classify(self, bounds) -> str:
+        min_x, min_y = self._project(bounds[0], bounds[1])
+        max_x, max_y = self._project(bounds[2], bounds[3])
+        near_x = max(min_x, min(0.0, max_x))
+        near_y = max(min_y, min(0.0, max_y))
+        if near_x * near_x + near_y * near_y > self.radius_km**2:
+            return OUTSIDE
+        far_x = max(abs(min_x), abs(max_x))
+        far_y = max(abs(min_y), abs(max_y))
+        if far_x * far_x + far_y * far_y <= self.radius_km**2:
+            return INSIDE
+        return PARTIAL
+
+
+class Polygon:
+    """
+    Points inside a GeoJSON polygon (outer ring and optional holes),
+    treated as planar in longitude/latitude as GeoJSON specifies.
+    """
+
+    def __init__(self, rings):
+        """
+        :param rings: GeoJSON coordinates, lists of [longitude, latitude]
+        """
+        self.edges = [
+            (ring[i][0], ring[i][1], ring[i + 1][0], ring[i + 1][1])
+            for ring in rings
+            for i in range(len(ring) - 1)
+        ]
+        points = [point for ring in rings for point in ring]
+        self.bounds = (
+            min(p[0] for p in points),
+            min(p[1] for p in points),
+            max(p[0] for p in points),
+            max(p[1] for p in points),
+        )
+
+    def contains(self, latitude, longitude) -> bool:
+        inside = False  # even-odd ray casting
+        for x1, y1, x2, y2 in self.edges:
+            if (y1 > latitude) != (y2 > latitude):
+                if longitude < (x2 - x1) * (latitude - y1) / (y2 - y1) + x1:
+                    inside = not inside
+        return inside
+
+    def _crosses(self, bounds) -> bool:
+        """
+        Whether any edge of the polygon passes through the box
+        """
+        return any(_clips(bounds, edge) for edge in self.edges)
+
+    def classify(self, bounds) -> str:
+        if (
+            bounds[0] > self.bounds[2]
+            or bounds[2] < self.bounds[0]
+            or bounds[1] > self.bounds[3]
+            or bounds[3] < self.bounds[1]
+        ):
+            return OUTSIDE
+        if self._crosses(bounds):
+            return PARTIAL
+        center = ((bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2)
+        return INSIDE if self.contains(*center) else OUTSIDE
+
+
+def _clips(bounds, edge) -> bool:
+    """
+    Whether a segment passes through a box (Liang-Barsky clipping)
+    :param bounds: (min x, min y, max x, max y)
+    :param edge: (x1, y1, x2, y2)
+    :return: True if part of the segment lies in the box
+    """
+    min_x, min_y, max_x, max_y = bounds
+    x1, y1, x2, y2 = edge
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in (
+        (-dx, x1 - min_x),
+        (dx, max_x - x1),
+        (-dy, y1 - min_y),
+        (dy, max_y - y1),
+    ):
+        if p == 0:
+            if q < 0:  # parallel to and outside of this side
+                return False
+            continue
+        r = q / p
+        if p < 0:
+            t0 = max(t0, r)
+        else:
+            t1 = min(t1, r)
+    return t0 <= t1
+
+
+class Cover:
+    """
+    Grid cells covering an area: cells entirely inside it and cells on
+    its boundary, whose points still have to be tested one by one.
+    """
+
+    def __init__(self, shape, max_cells=256, max_level=20):
+        """
+        Subdivide boundary cells, coarsest first, until max_cells is reached
+        :param shape: Circle or Polygon
+        :param max_cells: maximum number of cells in the cover
+        :param max_level: finest level to subdivide to
+        """
+        self.shape = shape
+        inside, partial = [], []
+        queue = [(0, 0)]
+        while queue:
+            level, prefix = heapq.heappop(queue)
+            kind = shape.classify(cell_bounds(level, prefix))
+            if kind == INSIDE:
+                inside.append(cell_range(level, prefix))
+            elif kind == PARTIAL:
+                budget = len(inside) + len(partial) + len(queue) + 4
+                if level >= max_level or budget > max_cells:
+                    partial.append(cell_range(level, prefix))
+                else:
+                    for child in range(4):
+                        heapq.heappush(queue, (level + 1, (prefix << 2) | child))
+        self.inside = merge_ranges(inside)
+        self.ranges = merge_ranges(inside + partial)
+        self._starts = [start for start, _ in self.inside]
+
+    def is_inside(self, cell) -> bool:
+        """
+        Whether a geocell lies in a cell entirely inside the area
+        :param cell: geocell
+        :return: True if the point needs no exact test
+        """
+        index = bisect_right(self._starts, cell) - 1
+        return index >= 0 and cell < self.inside[index][1]
+
+    def contains(self, latitude, longitude, cell) -> bool:
+        """
+        Whether a point lies in the area, testing it exactly only on the boundary
+        :return: True if the point is in the area
+        """
+        return self.is_inside(cell) or self.shape.contains(latitude, longitude)
+
+
+def area_shape(area):
+    """
+    Build the shape of an alert's area
+    :param area: Area schema
+    :return: Circle or Polygon
+    """
+    if area.polygon is not None:
+        return Polygon(area.polygon["coordinates"])
+    return Circle(area.latitude, area.longitude, area.radius_km)
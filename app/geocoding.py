@@ -0,0 +1,81 @@
+"""
+Backfills subscriber coordinates from the geocodes of their pincodes.
+
+Subscribers that registered without coordinates are placed at the centre
+of their pincode so that they can still be reached by area alerts.
+Run with: python -m app.geocoding
+"""
+from geopy.extra.rate_limiter import RateLimiter
+from geopy.geocoders import Nominatim
+from sqlalchemy import select, update
+from sqlalchemy.orm import aliased
+
+from .db_helper import session_local
+from .geo import geocell
+from .logger import Logger
+from .models import Person, Region
+
+
+class PincodeGeocoder:
+    """
+    Geocodes pincode regions once and copies their coordinates
+    to the subscribers under them that have none of their own.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self, geocode):
+        """
+        :param geocode: callable resolving a structured query to a location
+        """
+        self.geocode = geocode
+
+    @staticmethod
+    def pending(db):
+        """
+        Pincode regions without a geocode, with the name of their country
+        :param db: database session
+        :return: rows of (region, country name)
+        """
+        city, state, country = (aliased(Region) for _ in range(3))
+        return db.execute(
+            select(Region, country.name)
+            .join(city, city.id == Region.parent_id)
+            .join(state, state.id == city.parent_id)
+            .join(country, country.id == state.parent_id)
+            .where(Region.kind == "pincode", Region.geocode.is_(None))
+        ).all()
+
+    def run(self, db):
+        """
+        Geocode pending pincodes and backfill subscriber coordinates
+        :param db: database session
+        :return: number of subscribers updated
+        """
+        updated = 0
+        for region, country in self.pending(db):
+            location = self.geocode({"postalcode": region.name, "country": country})
+            if location is None:
+                self.logger.warning("Could not geocode pincode %s", region.name)
+                continue
+            region.geocode = f"{location.latitude},{location.longitude}"
+            updated += db.execute(
+                update(Person)
+                .where(Person.region_id == region.id, Person.latitude.is_(None))
+                .values(
+                    latitude=location.latitude,
+                    longitude=location.longitude,
+                    geocell=geocell(location.latitude, location.longitude),
+                )
+            ).rowcount
+            db.commit()
+        self.logger.info("Backfilled coordinates of %s subscribers", updated)
+        return updated
+
+
+if __name__ == "__main__":
+    geolocator = Nominatim(user_agent="dora")
+    # Nominatim's usage policy allows one request per second
+    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
+    with session_local() as session:
+        PincodeGeocoder(geocode).run(session)
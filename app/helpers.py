@@ -7,24 +7,28 @@ from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from jose import JWTError, jwt
 
+from .passwords import PasswordHasher
 from .settings import settings
+from .token_cache import TokenCache
 
 settings = settings()
 SCHEME = settings.OAUTH2_SCHEME
 EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
-PASSWORD_CONTEXT = settings.PASSWORD_CONTEXT
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
+password_hasher = PasswordHasher(
+    settings.PASSWORD_ROUNDS, settings.PASSWORD_WORKERS, settings.PASSWORD_MAX_PENDING
+)
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
 
 
-def hash_password(password: str):
-    """Hashes the password using bcrypt."""
-    return PASSWORD_CONTEXT.hash(password)
-
-
-def validate_password(password, hashed_password):
-    """Validates the password using bcrypt."""
-    return PASSWORD_CONTEXT.verify(password, hashed_password)
+def password_pool_busy():
+    """Returns the HTTP exception for an overloaded password pool."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent logins, try again shortly.",
+        headers={"Retry-After": "1"},
+    )
 
 
 def create_jwt_token(data: dict):
@@ -39,14 +43,18 @@ def create_jwt_token(data: dict):
 def _validate_jwt_token(token, invalid_credentials_exception):
     """
     Validates the JWT token.
+    Verified tokens are cached until they expire, see TokenCache.
     :param token: JWT token
     :param invalid_credentials_exception: Exception to raise if the token is invalid
     :return: username for valid token
     """
 
+    if username := token_cache.get(token):
+        return username
     try:
         data = jwt.decode(token, SECRET_KEY)
         if username := data.get("username"):
+            token_cache.put(token, username, data.get("exp"))
             return username
         else:
             raise invalid_credentials_exception
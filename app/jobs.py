@@ -0,0 +1,234 @@
+"""
+Durable background queue for alert dispatch
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_
+
+from .db_helper import session_local
+from .logger import Logger
+from .models import AlertJob
+
+
+class JobProgress:
+    """
+    Mirrors the delivery reports of a running job into its row.
+    Writes are throttled to one commit per flush_interval seconds,
+    which also keeps the job's lease fresh, and run in the threadpool.
+    """
+
+    def __init__(self, db, job, flush_interval=1.0):
+        """
+        :param db: database session the job was claimed with
+        :param job: job being dispatched
+        :param flush_interval: minimum seconds between two writes
+        """
+        self.db = db
+        self.job = job
+        self.flush_interval = flush_interval
+        self.reports: List = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def track(self, report):
+        """
+        Include a delivery report in the job's counts
+        :param report: delivery report of one channel fan-out
+        :return: None
+        """
+        self.reports.append(report)
+
+    async def update(self):
+        """
+        Write the counts if the last write is old enough
+        :return: None
+        """
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.last_flush = time.monotonic()  # skip until this write is done
+            await run_in_threadpool(self.flush)
+
+    def flush(self):
+        """
+        Write the current counts to the job row
+        :return: None
+        """
+        with self.lock:  # a slow write may still be running
+            self.job.queued = sum(report.queued for report in self.reports)
+            self.job.sent = sum(report.sent for report in self.reports)
+            self.job.failed = sum(len(report.failed) for report in self.reports)
+            self.job.updated_at = func.now()
+            self.db.commit()
+            self.last_flush = time.monotonic()
+
+
+class JobQueue:
+    """
+    Alert dispatch jobs stored in the alert_jobs table.
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+    of workers in any number of processes can share the table. A running
+    job whose lease expired (e.g. its worker died) is claimed again.
+    Jobs are claimed by priority first. One extra worker only claims
+    jobs of at least urgent_priority, so an urgent job starts right away
+    even while every other worker is busy with a long, less urgent one.
+    Workers share the event loop, so their database calls run in the
+    threadpool. Their sessions keep jobs loaded after a commit, so reading
+    a job on the event loop never queries the database.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(
+        self,
+        dispatch,
+        workers=1,
+        poll_interval=1.0,
+        max_attempts=3,
+        lease_seconds=300,
+        urgent_priority=None,
+    ):
+        """
+        :param dispatch: coroutine function called with (payload, db, progress)
+        :param workers: number of concurrent workers in this process
+        :param poll_interval: seconds to wait when the queue is empty
+        :param max_attempts: attempts before a job is marked as failed
+        :param lease_seconds: seconds without progress before a running job is reclaimed
+        :param urgent_priority: minimum priority served by the extra worker, None for no extra worker
+        """
+        self.dispatch = dispatch
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.urgent_priority = urgent_priority
+        self.tasks: List[asyncio.Task] = []
+
+    @staticmethod
+    async def enqueue(db, payload, username, priority=0) -> AlertJob:
+        """
+        Store a new job
+        :param db: async database session
+        :param payload: JSON serializable alert request
+        :param username: user that requested the alerts
+        :param priority: jobs with a higher priority are claimed first
+        :return: the queued job
+        """
+        job = AlertJob(
+            status="queued", payload=payload, requested_by=username, priority=priority
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        return job
+
+    def claim(self, db, min_priority=0) -> Optional[AlertJob]:
+        """
+        Lock the most urgent, then oldest, available job and mark it as running
+        :param db: database session
+        :param min_priority: lowest priority of the jobs to claim
+        :return: claimed job, or None if there is nothing to do
+        """
+        stale = datetime.now(timezone.utc) - timedelta(seconds=self.lease_seconds)
+        job = (
+            db.query(AlertJob)
+            .filter(
+                or_(
+                    AlertJob.status == "queued",
+                    and_(AlertJob.status == "running", AlertJob.updated_at < stale),
+                ),
+                AlertJob.priority >= min_priority,
+            )
+            .order_by(AlertJob.priority.desc(), AlertJob.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == "running":  # previous worker lost the job
+            job.retried += 1
+        job.status = "running"
+        job.attempts += 1
+        job.updated_at = func.now()
+        db.commit()
+        return job
+
+    async def run(self, job, db):
+        """
+        Dispatch a claimed job and record the outcome
+        :param job: claimed job
+        :param db: database session the job was claimed with
+        :return: None
+        """
+        job_id, payload = job.id, job.payload  # loaded by claim
+        progress = JobProgress(db, job)
+        try:
+            # recipients are streamed from a server-side cursor, which a
+            # progress commit on the same session would close
+            with session_local() as dispatch_db:
+                await self.dispatch(payload, dispatch_db, progress)
+            await run_in_threadpool(progress.flush)
+            job.status = "done"
+            job.updated_at = func.now()
+            await run_in_threadpool(db.commit)
+        except Exception as e:
+            self.logger.error("Alert job %s failed: %s", job_id, e)
+            await run_in_threadpool(self.fail, job, db, e)
+
+    def fail(self, job, db, error):
+        """
+        Roll back the failed dispatch and queue the job again, or mark it
+        as failed once it is out of attempts
+        :param job: claimed job, reloaded after the rollback
+        :param db: database session the job was claimed with
+        :param error: exception the dispatch failed with
+        :return: None
+        """
+        db.rollback()
+        job.error = str(error)
+        if job.attempts < self.max_attempts:
+            job.status = "queued"
+            job.retried += 1
+        else:
+            job.status = "failed"
+        job.updated_at = func.now()
+        db.commit()
+
+    async def work(self, min_priority=0):
+        """
+        Claim and run jobs until cancelled
+        :param min_priority: lowest priority of the jobs to claim
+        :return: None
+        """
+        while True:
+            db = session_local(expire_on_commit=False)
+            try:
+                while job := await run_in_threadpool(self.claim, db, min_priority):
+                    await self.run(job, db)
+            except Exception as e:
+                self.logger.error("Alert job worker error: %s", e)
+            finally:
+                await run_in_threadpool(db.close)
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """
+        Start the workers on the running event loop
+        :return: None
+        """
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        if self.urgent_priority is not None:
+            self.tasks.append(asyncio.create_task(self.work(self.urgent_priority)))
+
+    async def stop(self):
+        """
+        Cancel the workers. Interrupted jobs are picked up again once their lease expires.
+        :return: None
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
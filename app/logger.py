@@ -1,37 +1,190 @@
 """
 Handles logging for the application.
+
+Loggers put their records on a queue and a single listener thread
+writes them to stderr, so a log call never blocks on the write.
+Records are written as colorized text or as JSON lines.
 """
+import atexit
+import json
 import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
 import colorlog
 
+# attributes every LogRecord has; any other attribute came from extra=
+RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime"}
 
-class Logger(logging.Logger):
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as a JSON object on a single line, with the fields
+    passed in extra= next to the message.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are. QueueHandler.prepare merges the
+    message and drops exc_info, so the listener's formatter would never
+    see the exception.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+FORMATTERS = {
+    "text": colorlog.ColoredFormatter(  # set up the formatter
+        "%(log_color)s%(levelname)-10s%(reset)s[%(name)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        log_colors={  # setup colors for each log level
+            "DEBUG": "cyan",
+            "INFO": "green",
+            "WARNING": "yellow",
+            "ERROR": "red",
+            "CRITICAL": "bold_red",
+        },
+    ),
+    "json": JSONFormatter(),
+}
+
+
+_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler(sys.stderr)
+_stream_handler.setFormatter(FORMATTERS["text"])
+_queue_handler = RecordQueueHandler(_queue)
+_listener = QueueListener(_queue, _stream_handler)
+_listener.start()
+atexit.register(_listener.stop)  # write what is still queued
+_level = logging.INFO
+
+
+def configure_logging(level="INFO", format_="text", stream=None):
+    """
+    Set the level and output format of every logger, e.g. from the settings
+    :param level: name of the lowest level written, e.g. INFO
+    :param format_: text or json
+    :param stream: stream to write to, stderr if None
+    :return: None
+    """
+    global _level
+    number = logging.getLevelName(level.upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Unknown log level {level}")
+    if format_ not in FORMATTERS:
+        raise ValueError(f"Unknown log format {format_}")
+    _level = number
+    _stream_handler.setFormatter(FORMATTERS[format_])
+    if stream is not None:
+        _stream_handler.setStream(stream)
+
+
+def flush_logs():
     """
-    Custom logger class that uses colorlog to colorize the output.
+    Wait until every queued record is written
+    :return: None
     """
+    _listener.stop()
+    _listener.start()
+
 
-    log_colors = {  # setup colors for each log level
-        "DEBUG": "cyan",
-        "INFO": "green",
-        "WARNING": "yellow",
-        "ERROR": "red",
-        "CRITICAL": "bold_red",
-    }
+class Logger(logging.Logger):
+    """
+    Custom logger class that hands its records to the logging thread.
+    Unless a level is given, records below the configured level are
+    dropped before their message is formatted, so pass arguments to be
+    merged (logger.info("sent %s", count)) rather than f-strings.
+    """
 
     def __init__(self, name, level=0):
         """
         Initialize the logger.
         :param name: name of the logger
-        :param level: logging level
+        :param level: logging level, the configured one if 0
         """
         super().__init__(name, level)
-        handler = logging.StreamHandler()
-        handler.setLevel(level)
-        formatter = colorlog.ColoredFormatter(  # set up the formatter
-            "%(log_color)s%(levelname)-10s%(reset)s[%(name)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-            log_colors=self.log_colors,
-        )
-        handler.setFormatter(formatter)
-        self.addHandler(handler)
+        self.addHandler(_queue_handler)
+
+    def getEffectiveLevel(self):
+        return self.level or _level
+
+    def isEnabledFor(self, level):
+        return level >= self.getEffectiveLevel()
+
+
+class LogSampler:
+    """
+    Logs a repeated event, e.g. one per recipient, without flooding the log.
+    The first occurrences of every key are logged, then one in every `every`
+    with the number left out since; summary logs what is left out at the end.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, logger, level=logging.INFO, first=10, every=1000):
+        """
+        :param logger: logger to write to
+        :param level: level of the events
+        :param first: occurrences of a key that are always logged
+        :param every: one in this many later occurrences is logged
+        """
+        self.logger = logger
+        self.level = level
+        self.first = first
+        self.every = every
+        self.counts = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def log(self, key, message, *args, **kwargs):
+        """
+        Count an occurrence of an event and log it if it is sampled
+        :param key: what makes events similar, e.g. the channel
+        :param message: message, merged with args if logged
+        :return: None
+        """
+        if not self.logger.isEnabledFor(self.level):
+            return
+        with self.lock:
+            count = self.counts[key] = self.counts.get(key, 0) + 1
+            if count > self.first and (count - self.first) % self.every:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            message += " (%s similar not logged)"
+            args += (suppressed,)
+        self.logger.log(self.level, message, *args, **kwargs)
+
+    def summary(self, message="%s more %s events not logged"):
+        """
+        Log how many occurrences of every key were left out, and reset
+        :param message: merged with the count and the key
+        :return: None
+        """
+        with self.lock:
+            suppressed, self.suppressed, self.counts = self.suppressed, {}, {}
+        for key, count in suppressed.items():
+            self.logger.log(self.level, message, count, key)
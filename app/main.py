@@ -3,10 +3,15 @@ Main file for the Dora API.
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from . import models
-from .db_helper import engine
+from .audience_index import audience_index, save_audience_index, start_audience_index
+from .helpers import password_hasher
+from .jobs import JobQueue
+from .metrics import metrics
 from .routers import alerts, auth, subscriber, user
+from .schemas import SEVERITIES
+from .settings import reload_on_sighup, settings
 
 
 def app_factory():
@@ -23,13 +28,30 @@ def app_factory():
         allow_headers=["*"],
     )
 
-    # include all routers
-    models.Base.metadata.create_all(bind=engine)
+    # include all routers (the schema is managed by alembic migrations)
     app_.include_router(user.DoraUser.router)
     app_.include_router(auth.DoraAuth.router)
     app_.include_router(alerts.DoraAlert.router)
     app_.include_router(subscriber.DoraSubscriber.router)
 
+    # dispatch queued alerts in the background
+    config = settings()
+    job_queue = JobQueue(
+        alerts.DoraAlert.dispatch,
+        workers=config.JOB_WORKERS,
+        poll_interval=config.JOB_POLL_INTERVAL,
+        max_attempts=config.JOB_MAX_ATTEMPTS,
+        lease_seconds=config.JOB_LEASE_SECONDS,
+        urgent_priority=SEVERITIES.index(config.JOB_URGENT_SEVERITY),
+    )
+    app_.add_event_handler("startup", job_queue.start)
+    app_.add_event_handler("shutdown", job_queue.stop)
+    app_.add_event_handler("startup", reload_on_sighup)
+    app_.add_event_handler("shutdown", password_hasher.shutdown)
+    if audience_index:
+        app_.add_event_handler("startup", start_audience_index)
+        app_.add_event_handler("shutdown", save_audience_index)
+
     return app_
 
 
@@ -39,3 +61,8 @@ app = app_factory()
 @app.get("/")
 async def index():
     return {"message": "Welcome to Dora!"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_():
+    return metrics.render()
@@ -0,0 +1,93 @@
+"""
+Process-wide counters and gauges, exported in the Prometheus text format
+"""
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+# default histogram buckets, in seconds
+BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _labels(labels) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+    A minimal metrics registry.
+
+    Counters are incremented from any thread. Gauges are callables read
+    when the metrics are rendered, so components report their current
+    state (e.g. queue depth) without pushing updates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increment a counter
+        :param name: metric name
+        :param value: amount to add
+        :param labels: metric labels
+        :return: None
+        """
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] += value
+
+    def value(self, name, **labels) -> float:
+        """
+        Current value of a counter
+        :param name: metric name
+        :param labels: metric labels
+        :return: counter value
+        """
+        return self.counters.get((name, _labels(labels)), 0)
+
+    def observe(self, name, value, buckets=BUCKETS, **labels):
+        """
+        Record an observation in a histogram: cumulative bucket counters,
+        plus the count and sum of all observations
+        :param name: metric name
+        :param value: observed value
+        :param buckets: upper bounds of the buckets
+        :param labels: metric labels
+        :return: None
+        """
+        for bound in (*buckets, "+Inf"):
+            if bound == "+Inf" or value <= bound:
+                self.inc(f"{name}_bucket", le=bound, **labels)
+        self.inc(f"{name}_count", **labels)
+        self.inc(f"{name}_sum", value, **labels)
+
+    def gauge(self, name, read):
+        """
+        Register a gauge
+        :param name: metric name
+        :param read: callable returning the current value
+        :return: None
+        """
+        self.gauges[name] = read
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        :return: metrics text
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+        lines = []
+        for (name, labels), value in counters:
+            label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels)
+            lines.append(
+                f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}"
+            )
+        lines.extend(f"{name} {read()}" for name, read in sorted(self.gauges.items()))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
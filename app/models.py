@@ -1,7 +1,18 @@
 """
 This file contains the models for the database
 """
-from sqlalchemy import Column, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    func,
+)
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
@@ -42,6 +53,43 @@ class Person(Base):
     city = Column(String, nullable=False)
     state = Column(String, nullable=False)
     country = Column(String, nullable=False)
+    # pincode region of the subscriber, NULL until indexed
+    region_id = Column(Integer, ForeignKey("regions.id"), nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geocell = Column(BigInteger, nullable=True, index=True)  # see app.geo
+    # read by the audience indexes of other processes to see moves
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
+    )
+    # location lookups only read contact details: allow index-only scans
+    __table_args__ = (
+        *(
+            Index(
+                f"ix_people_{column}",
+                column,
+                postgresql_include=["email", "phone_number"],
+            )
+            for column in ("pin_code", "city", "state", "country")
+        ),
+        # alerts to everyone stream subscribers grouped by language
+        Index(
+            "ix_people_language",
+            "language",
+            "id",
+            postgresql_include=["email", "phone_number"],
+        ),
+        Index(
+            "ix_people_unindexed",
+            "id",
+            postgresql_where=region_id.is_(None),
+            sqlite_where=region_id.is_(None),
+        ),
+    )
 
 
 class Region(Base):
@@ -52,7 +100,28 @@ class Region(Base):
     __tablename__ = "regions"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String, nullable=False)
-    geocode = Column(String, nullable=False)
+    geocode = Column(String, nullable=True)
+    kind = Column(String, nullable=False)  # country, state, city or pincode
+    key = Column(String, nullable=False)  # normalized name
+    parent_id = Column(Integer, ForeignKey("regions.id"), nullable=True)
+    # subscribers under the region, kept up to date by RegionIndex.refresh
+    subscribers = Column(Integer, nullable=False, default=0, server_default="0")
+    __table_args__ = (
+        Index("uix_regions_path", kind, key, func.coalesce(parent_id, 0), unique=True),
+    )
+
+
+class RegionAudience(Base):
+    """
+    Subscribers under every region, from their pincode up to their country
+    """
+
+    __tablename__ = "region_audience"
+    region_id = Column(Integer, ForeignKey("regions.id"), primary_key=True)
+    person_id = Column(
+        Integer, ForeignKey("people.id", ondelete="CASCADE"), primary_key=True
+    )
+    __table_args__ = (Index("ix_region_audience_person_id", "person_id"),)
 
 
 class Alert(Base):
@@ -71,4 +140,52 @@ class Alert(Base):
     )
     __table_args__ = (
         UniqueConstraint("title", "description", "severity", name="uix_1"),
+        Index("ix_alerts_created_at", "created_at"),
+    )
+
+
+class Delivery(Base):
+    """
+    Outcome of sending an alert to a subscriber over a channel
+    """
+
+    __tablename__ = "deliveries"
+    alert_id = Column(Integer, ForeignKey("alerts.id"), primary_key=True)
+    channel = Column(String, primary_key=True)  # text or email
+    person_id = Column(
+        Integer, ForeignKey("people.id", ondelete="CASCADE"), primary_key=True
+    )
+    status = Column(String, nullable=False)  # sent or failed
+    attempts = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+    )
+    __table_args__ = (
+        Index("ix_deliveries_status", "alert_id", "channel", "status"),
+        Index("ix_deliveries_person_id", "person_id"),
+    )
+
+
+class AlertJob(Base):
+    """
+    Background dispatch jobs for alert requests
+    """
+
+    __tablename__ = "alert_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String, nullable=False, default="queued", index=True)
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    payload = Column(JSON, nullable=False)
+    requested_by = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    queued = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    retried = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+    )
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
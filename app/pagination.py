@@ -0,0 +1,83 @@
+"""
+Keyset pagination, field projection and NDJSON exports for list endpoints
+"""
+import json
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """
+    Parse a comma separated field projection
+    :param fields: requested fields, e.g. "email,city"; all fields if empty
+    :param allowed: fields that can be requested
+    :return: list of fields to return
+    """
+    if not fields:
+        return allowed
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    if unknown := [field for field in requested if field not in allowed]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(allowed)}",
+        )
+    return requested
+
+
+async def keyset_page(db, query, key, fields, cursor=None, limit=100, descending=False):
+    """
+    Fetch one page of a query ordered by a unique key.
+    Pages continue from the key of the last row instead of an offset,
+    so every page costs the same no matter how deep it is.
+    :param db: async database session
+    :param query: select that includes the key column
+    :param key: unique column to order and paginate by
+    :param fields: fields of each row to return
+    :param cursor: key of the last row of the previous page
+    :param limit: maximum number of rows in the page
+    :param descending: paginate from the highest key down
+    :return: rows of the page and the cursor of the next page (None on the last page)
+    """
+    if cursor is not None:
+        query = query.where(key < cursor if descending else key > cursor)
+    query = query.order_by(key.desc() if descending else key).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    next_cursor = getattr(rows[limit - 1], key.key) if len(rows) > limit else None
+    return [
+        {field: getattr(row, field) for field in fields} for row in rows[:limit]
+    ], next_cursor
+
+
+def _encode(value):
+    """
+    JSON encoder for values the json module does not support
+    :param value: value to encode
+    :return: JSON compatible value
+    """
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_export(db, query, fields, chunk_size=1000):
+    """
+    Stream every row of a query as newline delimited JSON.
+    Rows are read from a server-side cursor, so memory stays constant.
+    :param db: async database session
+    :param query: select to export
+    :param fields: fields of each row to export
+    :param chunk_size: rows fetched at a time
+    :return: streaming response
+    """
+
+    async def lines():
+        rows = await db.stream(query.execution_options(yield_per=chunk_size))
+        async for row in rows:
+            yield json.dumps(
+                {field: getattr(row, field) for field in fields}, default=_encode
+            ) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,100 @@
+"""
+Password hashing off the event loop
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from .logger import Logger
+from .metrics import metrics
+
+
+class PasswordQueueFull(Exception):
+    """
+    Raised when too many password operations are already waiting
+    """
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with bcrypt in a bounded thread pool.
+
+    bcrypt releases the GIL while it works, so a few threads keep the CPU
+    busy without blocking the event loop. At most max_pending operations
+    may wait for a thread; beyond that, callers get PasswordQueueFull so a
+    login storm is shed instead of queueing without limit.
+    Hashes made with a different cost factor are flagged for rehashing
+    when they are verified.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(self, rounds=12, workers=4, max_pending=64):
+        """
+        :param rounds: bcrypt cost factor (log2 of the number of rounds)
+        :param workers: number of hashing threads
+        :param max_pending: maximum number of queued and running operations
+        """
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,  # hashes outside these bounds need an update
+            bcrypt__max_rounds=rounds,
+        )
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="dora-bcrypt")
+        metrics.gauge("dora_password_pending", lambda: self.pending)
+
+    async def _run(self, operation, *args):
+        """
+        Run a password operation in the pool
+        :param operation: context method to call
+        :param args: its arguments
+        :return: its result
+        """
+        if self.pending >= self.max_pending:
+            metrics.inc("dora_password_rejected_total")
+            raise PasswordQueueFull()
+        self.pending += 1  # only changed on the event loop thread
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, operation, *args
+            )
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password) -> str:
+        """
+        Hash a password with the configured cost factor
+        :param password: plain text password
+        :return: bcrypt hash
+        """
+        metrics.inc("dora_password_operations_total", operation="hash")
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and rehash it if its cost factor is outdated
+        :param password: plain text password
+        :param hashed: stored hash
+        :return: whether it matches, and a new hash to store or None
+        """
+        metrics.inc("dora_password_operations_total", operation="verify")
+        valid, new_hash = await self._run(
+            self.context.verify_and_update, password, hashed
+        )
+        if new_hash:
+            metrics.inc("dora_password_rehashed_total")
+        return valid, new_hash
+
+    def shutdown(self):
+        """
+        Stop the hashing threads
+        :return: None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+"""
+Token bucket rate limiting for provider sends
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from .logger import Logger, LogSampler
+from .metrics import metrics
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket that adapts its rate to provider push back.
+
+    Tokens are reserved ahead of time: a caller takes a token even when
+    the bucket is empty and is told how long to wait before using it, so
+    waiting callers are served in order. After a 429 the rate is halved
+    and it then climbs back to the configured rate as sends succeed
+    (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: tokens per second
+        :param burst: maximum number of tokens saved up, at least one
+        """
+        self.max_rate = self.rate = rate
+        self.min_rate = rate / 16
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a token is available, without taking it
+        :return: seconds to wait
+        """
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self) -> float:
+        """
+        Take a token
+        :return: seconds to wait before using it
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def throttle(self):
+        """
+        Halve the rate after the provider rejected a send
+        :return: None
+        """
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        """
+        Raise the rate towards the configured one after a successful send
+        :return: None
+        """
+        if self.rate < self.max_rate:
+            with self.lock:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 32)
+
+
+class RateLimiter:
+    """
+    Spreads the sends of a channel over its senders (e.g. phone numbers),
+    each limited by its own token bucket. Sends rejected with a retryable
+    error (rate limited or a provider failure) slow their sender down and
+    are retried with exponential backoff.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(
+        self,
+        channel,
+        rates: Dict[str, float],
+        retryable: Callable[[Exception], bool],
+        retries=3,
+        backoff=1.0,
+    ):
+        """
+        :param channel: channel name used in logs and metrics
+        :param rates: sender -> sends per second
+        :param retryable: whether an error of a send is worth retrying
+        :param retries: retries of a send before giving up
+        :param backoff: seconds before the first retry, doubled for each retry
+        """
+        self.channel = channel
+        self.buckets = {sender: TokenBucket(rate) for sender, rate in rates.items()}
+        self.retryable = retryable
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        # every push back is counted in dora_send_throttled_total, few logged
+        self.pushbacks = LogSampler(self.logger, logging.WARNING)
+
+    def acquire(self) -> Tuple[str, TokenBucket, float]:
+        """
+        Reserve a token from the sender that can send the soonest
+        :return: sender, its bucket and the seconds to wait before sending
+        """
+        with self.lock:
+            sender, bucket = min(
+                self.buckets.items(), key=lambda item: item[1].wait_time()
+            )
+            return sender, bucket, bucket.reserve()
+
+    def send(self, deliver: Callable[[str], object]):
+        """
+        Deliver one message within the rate limits, blocking until it is sent
+        :param deliver: callable sending the message from the given sender
+        :return: result of deliver
+        """
+        for attempt in range(self.retries + 1):
+            sender, bucket, delay = self.acquire()
+            if delay:
+                time.sleep(delay)
+            try:
+                result = deliver(sender)
+            except Exception as e:
+                if attempt == self.retries or not self.retryable(e):
+                    raise
+                bucket.throttle()
+                metrics.inc("dora_send_throttled_total", channel=self.channel)
+                self.pushbacks.log(
+                    sender,
+                    "%s send from %s pushed back (%s), rate lowered to %.2f/s",
+                    self.channel,
+                    sender,
+                    e,
+                    bucket.rate,
+                )
+                time.sleep(self.backoff * 2**attempt)
+                continue
+            bucket.recover()
+            return result
@@ -0,0 +1,259 @@
+"""
+Resolves the subscribers that an alert has to reach
+"""
+from collections import Counter
+from itertools import groupby
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import and_, func, literal, not_, or_, select, true, union
+
+from .deliveries import sent
+from .geo import Cover, area_shape
+from .models import Person
+from .regions import RegionIndex
+
+
+class RecipientResolver:
+    """
+    Turns the location targets of alerts into streams of recipients.
+
+    All targeted alerts of a request are resolved with a single query:
+    one SELECT per alert that looks up its targeted regions in the region
+    audience index, combined with UNION so recipients are distinct per
+    alert, and ordered by alert.
+    Alerts sent to all subscribers stream the whole people table instead,
+    and alerts with a geographic area are resolved through the geocell index.
+    Rows are streamed from a server-side cursor in chunks of chunk_size,
+    so memory use does not grow with the number of subscribers.
+    For stored alerts, recipients that were already sent the alert over
+    every channel are left out, and rows carry a sent_<channel> flag per
+    channel, so a retried dispatch only reaches the rest.
+    Recipients of an alert come grouped by language, so every message
+    variant is sent to its recipients in a row.
+    With an AudienceIndex, location targets are resolved in memory and
+    only the contact details of the targeted ids are read.
+    """
+
+    def __init__(self, chunk_size=1000, index=None):
+        """
+        :param chunk_size: rows fetched from the server-side cursor at a time
+        :param index: optional AudienceIndex
+        """
+        self.chunk_size = chunk_size
+        self.index = index
+
+    def audience_filter(self, alert):
+        """
+        Build the predicate matching every subscriber targeted by the alert
+        :param alert: alert create request
+        :return: SQL expression
+        """
+        return RegionIndex.audience_filter(alert)
+
+    @staticmethod
+    def progress(alert_id, channels):
+        """
+        Delivery flags of recipients and the filter leaving out those done
+        :param alert_id: id of the stored alert, None if not stored
+        :param channels: channels the alert is sent over
+        :return: sent_<channel> columns and a where clause
+        """
+        if alert_id is None or not channels:
+            return [], true()
+        flags = {channel: sent(alert_id, channel) for channel in channels}
+        columns = [flag.label(f"sent_{channel}") for channel, flag in flags.items()]
+        return columns, not_(and_(*flags.values()))
+
+    def recipients(self, *columns):
+        """
+        Select the columns every recipient row has, plus extra ones
+        :return: select on people
+        """
+        return select(
+            *columns, Person.id, Person.email, Person.phone_number, Person.language
+        )
+
+    def audience_query(self, alerts, alert_ids=None, channels=()):
+        """
+        Build the query resolving the recipients of several alerts at once
+        :param alerts: mapping of alert index -> alert create request
+        :param alert_ids: mapping of alert index -> stored alert id
+        :param channels: channels the alerts are sent over
+        :return: select of (alert, id, email, phone_number, language, sent flags)
+            ordered by alert and language
+        """
+        selects = []
+        for index, alert in alerts.items():
+            flags, pending = self.progress((alert_ids or {}).get(index), channels)
+            selects.append(
+                self.recipients(literal(index).label("alert"), *flags)
+                .where(self.audience_filter(alert), pending)
+                .distinct()
+            )
+        audience = union(*selects).subquery()
+        return select(audience).order_by(audience.c.alert, audience.c.language)
+
+    def everyone(self, db, alert_id=None, channels=()):
+        """
+        Stream every subscriber in chunks, for alerts sent to all
+        :param db: database session
+        :param alert_id: id of the stored alert
+        :param channels: channels the alert is sent over
+        :return: iterator of rows with id, email, phone_number and language
+        """
+        flags, pending = self.progress(alert_id, channels)
+        return db.execute(
+            self.recipients(*flags)
+            .where(pending)
+            .order_by(Person.language, Person.id)
+            .execution_options(yield_per=self.chunk_size)
+        )
+
+    def by_ids(self, db, person_ids, alert_id=None, channels=()):
+        """
+        Stream the recipients with the given ids, a chunk at a time,
+        grouped by language within every chunk
+        :param db: database session
+        :param person_ids: sorted subscriber ids
+        :param alert_id: id of the stored alert
+        :param channels: channels the alert is sent over
+        :return: iterator of rows with id, email, phone_number and language
+        """
+        flags, pending = self.progress(alert_id, channels)
+        for start in range(0, len(person_ids), self.chunk_size):
+            chunk = person_ids[start : start + self.chunk_size].tolist()
+            yield from db.execute(
+                self.recipients(*flags)
+                .where(Person.id.in_(chunk), pending)
+                .order_by(Person.language)
+            )
+
+    def within_area(self, db, alert, alert_id=None, channels=()):
+        """
+        Stream the recipients of an alert that targets a geographic area.
+        Subscribers are looked up by the grid cells covering the area and
+        only those on its boundary are tested exactly. Subscribers in the
+        alert's targeted regions are included as well.
+        :param db: database session
+        :param alert: alert create request with an area
+        :param alert_id: id of the stored alert
+        :param channels: channels the alert is sent over
+        :return: iterator of rows with id, email, phone_number and language
+        """
+        cover = Cover(area_shape(alert.area))
+        targeted = self.audience_filter(alert)
+        flags, pending = self.progress(alert_id, channels)
+        rows = db.execute(
+            self.recipients(
+                Person.latitude,
+                Person.longitude,
+                Person.geocell,
+                targeted.label("targeted"),
+                *flags,
+            )
+            .where(
+                or_(
+                    targeted,
+                    *(
+                        Person.geocell.between(start, end - 1)
+                        for start, end in cover.ranges
+                    ),
+                ),
+                pending,
+            )
+            .order_by(Person.language)
+            .execution_options(yield_per=self.chunk_size)
+        )
+        return (
+            row
+            for row in rows
+            if row.targeted or cover.contains(row.latitude, row.longitude, row.geocell)
+        )
+
+    def language_counts(self, db, alerts) -> List[Counter]:
+        """
+        Count the recipients of every alert per language without reading them,
+        except for area alerts whose boundary is tested row by row
+        :param db: database session
+        :param alerts: alert create requests
+        :return: counter of language -> recipients, per alert in order
+        """
+        counts = [Counter() for _ in alerts]
+        targeted = {
+            index: alert
+            for index, alert in enumerate(alerts)
+            if not alert.inform_all and not alert.area
+        }
+        if targeted:
+            audience = self.audience_query(targeted).subquery()
+            for index, language, count in db.execute(
+                select(audience.c.alert, audience.c.language, func.count()).group_by(
+                    audience.c.alert, audience.c.language
+                )
+            ):
+                counts[index][language] = count
+        for index, alert in enumerate(alerts):
+            if alert.inform_all:
+                counts[index].update(
+                    dict(
+                        db.execute(
+                            select(Person.language, func.count()).group_by(
+                                Person.language
+                            )
+                        ).all()
+                    )
+                )
+            elif alert.area:
+                counts[index].update(
+                    row.language for row in self.within_area(db, alert)
+                )
+        return counts
+
+    def resolve(
+        self, db, alerts, alert_ids=None, channels=()
+    ) -> Iterator[Tuple[object, Iterator]]:
+        """
+        Yield every alert together with an iterator over its recipients.
+        Each recipient iterator must be consumed before asking for the next alert.
+        :param db: database session
+        :param alerts: alert create requests
+        :param alert_ids: ids of the stored alerts, in the same order, to skip
+            recipients that already got them
+        :param channels: channels the alerts are sent over
+        :return: iterator of (alert, recipients); recipients have id, email,
+            phone_number and language
+        """
+        ids = dict(enumerate(alert_ids or []))
+        indexed = self.index is not None and self.index.ready
+        if indexed:
+            self.index.catch_up(db)  # subscribers added or moved by other processes
+        targeted = {
+            index: alert
+            for index, alert in enumerate(alerts)
+            if not alert.inform_all and not alert.area and not indexed
+        }
+        rows = (
+            db.execute(
+                self.audience_query(targeted, ids, channels).execution_options(
+                    yield_per=self.chunk_size
+                )
+            )
+            if targeted
+            else iter(())
+        )
+        groups = groupby(rows, key=lambda row: row.alert)
+        pending = next(groups, None)
+        for index, alert in enumerate(alerts):
+            if alert.inform_all:
+                yield alert, self.everyone(db, ids.get(index), channels)
+            elif alert.area:
+                yield alert, self.within_area(db, alert, ids.get(index), channels)
+            elif indexed:
+                yield alert, self.by_ids(
+                    db, self.index.lookup(alert), ids.get(index), channels
+                )
+            elif pending and pending[0] == index:
+                yield alert, pending[1]
+                pending = next(groups, None)
+            else:  # nobody subscribed in the targeted locations
+                yield alert, iter(())
@@ -0,0 +1,274 @@
+"""
+Region hierarchy and the audience index built on top of it
+"""
+from typing import Dict, Tuple
+
+from sqlalchemy import Connection, and_, delete, false, func, or_, select, text, update
+
+from .models import Person, Region, RegionAudience
+
+# hierarchy from the top down: (region kind, subscriber column)
+LEVELS = [
+    ("country", "country"),
+    ("state", "state"),
+    ("city", "city"),
+    ("pincode", "pin_code"),
+]
+# alert request field -> region kind
+TARGETS = {
+    "pincodes": "pincode",
+    "cities": "city",
+    "states": "state",
+    "countries": "country",
+}
+
+
+def normalize(name) -> str:
+    """
+    Normalize a location name so spelling variants share one region.
+    Must match _key, its SQL counterpart.
+    :param name: location name or pincode
+    :return: region key
+    """
+    return str(name).strip(" ").lower()
+
+
+def _key(column):
+    """
+    SQL expression normalizing a subscriber location column
+    :param column: column of people
+    :return: SQL expression
+    """
+    return f"lower(trim(CAST(p.{column} AS VARCHAR)))"
+
+
+def _path(depth):
+    """
+    Joins matching the regions r0 .. r{depth - 1} on the path of subscriber p
+    :param depth: number of levels to join
+    :return: SQL joins
+    """
+    joins = []
+    for level, (kind, column) in enumerate(LEVELS[:depth]):
+        parent = (
+            f"r{level}.parent_id = r{level - 1}.id"
+            if level
+            else (f"r{level}.parent_id IS NULL")
+        )
+        joins.append(
+            f"JOIN regions r{level} ON r{level}.kind = '{kind}' "
+            f"AND r{level}.key = {_key(column)} AND {parent}"
+        )
+    return " ".join(joins)
+
+
+class RegionIndex:
+    """
+    Maintains the region hierarchy (pincode -> city -> state -> country)
+    and the region_audience table, which lists every subscriber under
+    every region of its path. Targeting a region then becomes an integer
+    key lookup in region_audience instead of string matching on people.
+
+    Subscribers are indexed while their region_id is NULL; set it to NULL
+    when a subscriber's location changes and call refresh again.
+    Every region also counts its subscribers, updated by the same refresh,
+    so audiences are sized without reading people.
+    """
+
+    @staticmethod
+    def _pending(person_ids, alias="p"):
+        """
+        SQL condition on the subscribers being indexed
+        :param person_ids: subscriber ids, every unindexed subscriber if None
+        :param alias: alias of people in the statement
+        :return: SQL condition
+        """
+        condition = f"{alias}.region_id IS NULL"
+        if person_ids is not None:
+            ids = ", ".join(str(int(person_id)) for person_id in person_ids)
+            condition += f" AND {alias}.id IN ({ids or 'NULL'})"
+        return condition
+
+    @staticmethod
+    def _count_pending(db, sign, pending):
+        """
+        Add (sign 1) or remove (sign -1) the audience rows of subscribers
+        being indexed to the subscriber counts of their regions.
+        Only the rows of the affected regions are updated.
+        :param db: database session or connection
+        :param sign: 1 or -1
+        :param pending: condition on the subscribers being indexed
+        :return: None
+        """
+        rows = (
+            "FROM region_audience a JOIN people p ON p.id = a.person_id "
+            f"WHERE {pending}"
+        )
+        db.execute(
+            text(
+                f"UPDATE regions SET subscribers = subscribers + {sign} * "
+                f"(SELECT count(*) {rows} AND a.region_id = regions.id) "
+                f"WHERE id IN (SELECT a.region_id {rows})"
+            )
+        )
+
+    @staticmethod
+    def refresh(db, person_ids=None):
+        """
+        Index every subscriber whose region_id is NULL, or only the given
+        ones (e.g. a subscriber added in this transaction).
+        Creates missing regions level by level, replaces the subscribers'
+        audience rows, updates the counts of their regions and links them
+        to their pincode region.
+        :param db: database session or connection
+        :param person_ids: subscriber ids to index, all unindexed if None
+        :return: None
+        """
+        bind = db if isinstance(db, Connection) else db.get_bind()
+        if person_ids is None and bind.dialect.name == "postgresql":
+            # concurrent full refreshes would count the same subscribers
+            # twice; given subscribers are only indexed by their own
+            # transaction and lock just the rows of their regions
+            db.execute(text("SELECT pg_advisory_xact_lock(hashtext('regions'))"))
+        pending = RegionIndex._pending(person_ids)
+        RegionIndex._count_pending(db, -1, pending)
+        db.execute(
+            text(
+                "DELETE FROM region_audience WHERE person_id IN "
+                f"(SELECT p.id FROM people p WHERE {pending})"
+            )
+        )
+        for depth, (kind, column) in enumerate(LEVELS):
+            parent = f"r{depth - 1}.id" if depth else "NULL"
+            group = f"{_key(column)}, {parent}" if depth else _key(column)
+            db.execute(
+                text(
+                    "INSERT INTO regions (kind, key, name, parent_id) "
+                    f"SELECT '{kind}', {_key(column)}, "
+                    f"min(trim(CAST(p.{column} AS VARCHAR))), {parent} "
+                    f"FROM people p {_path(depth)} WHERE {pending} "
+                    f"GROUP BY {group} "
+                    "ON CONFLICT (kind, key, (coalesce(parent_id, 0))) DO NOTHING"
+                )
+            )
+        audience = " UNION ALL ".join(
+            f"SELECT r{level}.id, p.id FROM people p {_path(len(LEVELS))} "
+            f"WHERE {pending}"
+            for level in range(len(LEVELS))
+        )
+        db.execute(
+            text(
+                "INSERT INTO region_audience (region_id, person_id) "
+                f"{audience} ON CONFLICT DO NOTHING"
+            )
+        )
+        RegionIndex._count_pending(db, 1, pending)
+        db.execute(
+            text(
+                f"UPDATE people SET region_id = (SELECT r{len(LEVELS) - 1}.id "
+                f"FROM people p {_path(len(LEVELS))} WHERE p.id = people.id) "
+                f"WHERE {RegionIndex._pending(person_ids, 'people')}"
+            )
+        )
+
+    @staticmethod
+    def remove(db, person_ids):
+        """
+        Take subscribers out of the subscriber counts and the audience of
+        their regions, before they are deleted
+        :param db: database session or connection
+        :param person_ids: subscriber ids
+        :return: None
+        """
+        removed = RegionAudience.person_id.in_(person_ids)
+        db.execute(
+            update(Region)
+            .where(Region.id.in_(select(RegionAudience.region_id).where(removed)))
+            .values(
+                subscribers=Region.subscribers
+                - select(func.count())
+                .select_from(RegionAudience)
+                .where(RegionAudience.region_id == Region.id, removed)
+                .scalar_subquery()
+            )
+        )
+        db.execute(delete(RegionAudience).where(removed))
+
+    @staticmethod
+    def preview(db, alert) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """
+        Size the audience of an alert's location targets from the subscriber
+        counts of the regions, with a few lookups per target level and
+        without reading people. A region under another targeted region
+        adds nobody, and regions that are not nested share no subscribers,
+        so the total is exact.
+        :param db: database session
+        :param alert: alert create request
+        :return: subscribers targeted, and subscribers per target field and location
+        """
+        locations = {}
+        targeted = {}  # region id -> subscribers
+        parents = {}  # region id -> parent id
+        for field, kind in TARGETS.items():
+            if not (values := getattr(alert, field)):
+                continue
+            names = {normalize(value): str(value) for value in values}
+            counts = dict.fromkeys(names.values(), 0)
+            for row in db.execute(
+                select(
+                    Region.id, Region.key, Region.parent_id, Region.subscribers
+                ).where(Region.kind == kind, Region.key.in_(names))
+            ):
+                counts[names[row.key]] += row.subscribers
+                targeted[row.id] = row.subscribers
+                parents[row.id] = row.parent_id
+            locations[field] = counts
+        # walk the hierarchy up from the targeted regions, a level at a time
+        missing = {parent for parent in parents.values() if parent} - parents.keys()
+        while missing:
+            rows = db.execute(
+                select(Region.id, Region.parent_id).where(Region.id.in_(missing))
+            ).all()
+            parents.update(rows)
+            missing = {parent for _, parent in rows if parent} - parents.keys()
+
+        def covered(region_id):
+            parent = parents.get(region_id)
+            while parent and parent not in targeted:
+                parent = parents.get(parent)
+            return parent is not None
+
+        if alert.inform_all:
+            total = db.scalar(
+                select(func.coalesce(func.sum(Region.subscribers), 0)).where(
+                    Region.kind == LEVELS[0][0]
+                )
+            )
+        else:
+            total = sum(
+                subscribers
+                for region_id, subscribers in targeted.items()
+                if not covered(region_id)
+            )
+        return total, locations
+
+    @staticmethod
+    def audience_filter(alert):
+        """
+        Build the predicate matching every subscriber under the regions
+        targeted by an alert
+        :param alert: alert create request
+        :return: SQL expression on people
+        """
+        regions = [
+            and_(Region.kind == kind, Region.key.in_([normalize(v) for v in values]))
+            for field, kind in TARGETS.items()
+            if (values := getattr(alert, field))
+        ]
+        if not regions:
+            return false()
+        return Person.id.in_(
+            select(RegionAudience.person_id)
+            .join(Region, Region.id == RegionAudience.region_id)
+            .where(or_(*regions))
+        )
@@ -0,0 +1,103 @@
+"""
+Routes read-only database sessions to read replicas
+"""
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .logger import Logger
+
+# seconds the replica is behind; 0 when it has replayed everything it received,
+# so an idle primary does not make its replicas look lagged
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+class ReplicaRouter:
+    """
+    Hands out sessions for read-only endpoints.
+
+    Replicas are used in turn. A replica that cannot be reached is skipped
+    for retry_after seconds, and one that lags more than max_lag seconds
+    behind the primary is skipped until its lag is measured again, every
+    lag_interval seconds. When no replica is usable, reads go to the primary.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(
+        self, primary, replicas, max_lag=5.0, lag_interval=5.0, retry_after=30.0
+    ):
+        """
+        :param primary: async engine of the primary
+        :param replicas: async engines of the read replicas
+        :param max_lag: seconds of replication lag tolerated
+        :param lag_interval: seconds between lag measurements of a replica
+        :param retry_after: seconds an unreachable replica is skipped for
+        """
+        self.primary: AsyncEngine = primary
+        self.replicas: List[AsyncEngine] = replicas
+        self.max_lag = max_lag
+        self.lag_interval = lag_interval
+        self.retry_after = retry_after
+        self.down_until: Dict[AsyncEngine, float] = {}
+        self.lag: Dict[AsyncEngine, Tuple[float, float]] = {}  # (measured at, lag)
+        self._turn = 0
+
+    def _candidates(self) -> List[AsyncEngine]:
+        """
+        Replicas to try, in turn, leaving out those known to be unusable
+        :return: async engines
+        """
+        now = time.monotonic()
+        self._turn += 1
+        start = self._turn % len(self.replicas) if self.replicas else 0
+        candidates = []
+        for engine in self.replicas[start:] + self.replicas[:start]:
+            if self.down_until.get(engine, 0) > now:
+                continue
+            measured_at, lag = self.lag.get(engine, (0.0, 0.0))
+            if lag > self.max_lag and now - measured_at < self.lag_interval:
+                continue
+            candidates.append(engine)
+        return candidates
+
+    async def _lag_of(self, engine, session) -> float:
+        """
+        Replication lag of a replica, measured at most every lag_interval seconds
+        :param engine: replica engine
+        :param session: session connected to the replica
+        :return: lag in seconds
+        """
+        now = time.monotonic()
+        measured_at, lag = self.lag.get(engine, (0.0, 0.0))
+        if now - measured_at < self.lag_interval:
+            return lag
+        if engine.dialect.name == "postgresql":
+            lag = float(await session.scalar(LAG_QUERY))
+        self.lag[engine] = (now, lag)
+        return lag
+
+    async def session(self) -> AsyncSession:
+        """
+        Open a session on a usable replica, or on the primary
+        :return: async session for read-only queries
+        """
+        for engine in self._candidates():
+            session = AsyncSession(engine, autoflush=False, expire_on_commit=False)
+            try:
+                if await self._lag_of(engine, session) <= self.max_lag:
+                    await session.connection()
+                    return session
+                self.logger.warning("Replica %r is lagging", engine.url)
+            except (DBAPIError, OSError) as e:
+                self.logger.warning("Replica %r unavailable: %s", engine.url, e)
+                self.down_until[engine] = time.monotonic() + self.retry_after
+            await session.close()
+        return AsyncSession(self.primary, autoflush=False, expire_on_commit=False)
@@ -2,17 +2,41 @@
 Handles alert endpoints
 """
 import datetime
-from typing import Set
+import time
+from functools import partial
+from itertools import groupby
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db_helper import get_db
+from app.audience_index import audience_index
+from app.db_helper import get_async_db, get_read_db, session_local
+from app.deliveries import DeliveryRecorder
+from app.delivery import BatchSend, DeliveryEngine
 from app.helpers import get_user
+from app.jobs import JobQueue
 from app.logger import Logger
-from app.models import Alert, Person
-from app.schemas import AlertsCreateRequest
+from app.metrics import metrics
+from app.models import Alert, AlertJob, Delivery
+from app.pagination import keyset_page, ndjson_export, parse_fields
+from app.recipients import RecipientResolver
+from app.regions import RegionIndex
+from app.schemas import (
+    AlertDeliveries,
+    AlertFields,
+    AlertJobStatus,
+    Alerts,
+    AlertsCreateRequest,
+    AlertsEstimate,
+    AudiencePreviews,
+)
 from app.settings import settings
+from app.sms import sms_channel
+from app.sms_encoding import encoding, segments
+from app.templates import MessageRenderer, language_of
 from app.twilio_client import TwilioClient
 
 
@@ -21,59 +45,207 @@ class DoraAlert:
     Handles alert endpoints
     """
 
-    # setup router, logger, and twilio client
+    # setup router, logger, twilio client and delivery pipeline
     router = APIRouter(tags=["Alerts"])
     logger = Logger(__name__)
-    MAPPER = {
-        "pincode": Person.pin_code,
-        "city": Person.city,
-        "state": Person.state,
-        "country": Person.country,
-    }
     twilio_client = TwilioClient()
-
-    def __init__(self):
-        self.numbers: Set[int] = set()
-        self.emails: Set[str] = set()
+    sms = sms_channel(twilio_client)  # per number or bulk, per SMS_BACKEND
+    delivery_engine = DeliveryEngine(
+        {
+            "text": settings().TEXT_CONCURRENCY,
+            "email": settings().EMAIL_CONCURRENCY,
+        },
+        settings().RECIPIENT_CHUNK_SIZE,
+    )
+    resolver = RecipientResolver(settings().RECIPIENT_CHUNK_SIZE, audience_index)
+    # alerts per INSERT or SELECT, 3 bind parameters each: asyncpg allows 32767
+    STORE_CHUNK_SIZE = 5000
+    # longest alert id: estimated texts are shortened for the longest link
+    ESTIMATE_ALERT_ID = 2**31 - 1
 
     @staticmethod
-    @router.post("/alerts", status_code=status.HTTP_201_CREATED)
+    @router.post("/alerts", status_code=status.HTTP_202_ACCEPTED)
     async def create_alert(
         request: AlertsCreateRequest,
-        db: Session = Depends(get_db),
+        response: Response,
+        dry_run: bool = Query(False),
+        db: AsyncSession = Depends(get_async_db),
+        username: str = Depends(get_user),
+    ):
+        """
+        Create alerts and queue them for dispatch.
+        With dry_run, nothing is stored or sent and the SMS cost of the
+        alerts is estimated instead.
+        :param request: request body
+        :param response: response, to set the status of dry runs
+        :param dry_run: only estimate the segments and dispatch time of texts
+        :param db: database session
+        :param username: username of current user
+        :return: id of the dispatch job and list of alerts created,
+            or the estimate of a dry run
+        """
+        dora_alert = DoraAlert()
+        dora_alert.logger.info("User %s requested to create alerts", username)
+        await dora_alert._validate_alerts(request)
+        if dry_run:
+            response.status_code = status.HTTP_200_OK
+            return AlertsEstimate(**await dora_alert.estimate(request, db))
+        alerts = await dora_alert.store_alerts(request, db)
+        job = await JobQueue.enqueue(
+            db,
+            {
+                **request.dict(),
+                "requested_at": time.time(),
+                "alert_ids": [alert["id"] for alert in alerts],
+            },
+            username,
+            priority=max(alert.priority for alert in request.alerts),
+        )
+        dora_alert.logger.info("Queued alert job %s", job.id)
+        return {"job_id": job.id, "alerts": alerts}
+
+    @staticmethod
+    @router.post(
+        "/alerts/preview",
+        response_model=AudiencePreviews,
+        status_code=status.HTTP_200_OK,
+    )
+    async def preview_alert(
+        request: AlertsCreateRequest,
+        db: AsyncSession = Depends(get_read_db),
         username: str = Depends(get_user),
     ):
         """
-        Create alerts
+        Count the recipients of alerts per channel and per targeted location,
+        without storing or sending them
         :param request: request body
         :param db: database session
         :param username: username of current user
-        :return: list of alerts created
+        :return: audience per alert
         """
         dora_alert = DoraAlert()
-        dora_alert.logger.info(f"User {username} requested to create alerts")
+        dora_alert.logger.info("User %s requested an audience preview", username)
         await dora_alert._validate_alerts(request)
-        response = await dora_alert.store_alerts(request, db)
-        await dora_alert.send_alerts(request, db)
-        dora_alert.logger.info("DONE")
-        return response
+        return {"alerts": await db.run_sync(dora_alert.preview, request.alerts)}
+
+    @staticmethod
+    @router.get(
+        "/alerts/jobs/{job_id}",
+        response_model=AlertJobStatus,
+        status_code=status.HTTP_200_OK,
+    )
+    async def get_alert_job(
+        job_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        username: str = Depends(get_user),
+    ):
+        """
+        Get the progress of an alert dispatch job
+        :param job_id: id of the job
+        :param db: database session
+        :param username: username of current user
+        :return: job status and delivery counts
+        """
+        if job := await db.get(AlertJob, job_id):
+            return job
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Alert job {job_id} does not exist.",
+        )
+
+    @staticmethod
+    @router.get(
+        "/alerts/{alert_id}/deliveries",
+        response_model=AlertDeliveries,
+        status_code=status.HTTP_200_OK,
+    )
+    async def get_alert_deliveries(
+        alert_id: int,
+        db: AsyncSession = Depends(get_read_db),
+        username: str = Depends(get_user),
+    ):
+        """
+        Count the recipients of an alert per channel and delivery status
+        :param alert_id: id of the alert
+        :param db: database session
+        :param username: username of current user
+        :return: delivery counts
+        """
+        if not await db.get(Alert, alert_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Alert {alert_id} does not exist.",
+            )
+        counts = {}
+        for channel, status_, count in await db.execute(
+            select(Delivery.channel, Delivery.status, func.count())
+            .where(Delivery.alert_id == alert_id)
+            .group_by(Delivery.channel, Delivery.status)
+        ):
+            counts.setdefault(channel, {})[status_] = count
+        return {"alert_id": alert_id, "counts": counts}
 
     @staticmethod
-    @router.get("/alerts", status_code=status.HTTP_200_OK)
+    async def dispatch(payload, db, progress=None):
+        """
+        Send the alerts of a queued job. Called by the job workers.
+        :param payload: alert request stored with the job
+        :param db: database session
+        :param progress: tracker for the job's delivery counts
+        :return: None
+        """
+        await DoraAlert().send_alerts(
+            AlertsCreateRequest(**payload),
+            db,
+            progress,
+            payload.get("requested_at"),
+            payload.get("alert_ids"),
+        )
+
+    @staticmethod
+    @router.get(
+        "/alerts",
+        response_model=Alerts,
+        response_model_exclude_unset=True,
+        status_code=status.HTTP_200_OK,
+    )
     async def get_alerts(
-        days: int = 1, db: Session = Depends(get_db), username: str = Depends(get_user)
+        days: int = 1,
+        cursor: int = Query(None),
+        limit: int = Query(settings().PAGE_SIZE, ge=1, le=settings().MAX_PAGE_SIZE),
+        fields: str = Query(None),
+        format: str = Query("json", regex="^(json|ndjson)$"),
+        db: AsyncSession = Depends(get_read_db),
+        username: str = Depends(get_user),
     ):
         """
-        Get alerts within the last n days
+        Get alerts within the last n days, newest first.
+        Pass the next_cursor of a page as cursor to get the next one.
+        With format=ndjson, every matching alert is streamed instead.
         :param days: number of days
+        :param cursor: next_cursor of the previous page
+        :param limit: maximum number of alerts in the page
+        :param fields: comma separated fields to return, all by default
+        :param format: json for a page, ndjson for a full export
         :param db: database session
         :param username: username of current user
-        :return: list of alerts
+        :return: page of alerts
         """
-        DoraAlert.logger.info(f"User {username} requested alerts")
+        DoraAlert.logger.info("User %s requested alerts", username)
+        fields_ = parse_fields(fields, list(AlertFields.__fields__))
         now = datetime.datetime.now()
         from_ = now - datetime.timedelta(days=days)
-        return db.query(Alert).filter(Alert.created_at.between(from_, now)).all()
+        columns = {
+            "id": Alert.id,
+            **{field: getattr(Alert, field) for field in fields_},
+        }
+        query = select(*columns.values()).where(Alert.created_at.between(from_, now))
+        if format == "ndjson":
+            return ndjson_export(db, query.order_by(Alert.id.desc()), fields_)
+        alerts, next_cursor = await keyset_page(
+            db, query, Alert.id, fields_, cursor, limit, descending=True
+        )
+        return {"alerts": alerts, "next_cursor": next_cursor}
 
     async def _validate_alerts(self, request):
         """
@@ -81,6 +253,11 @@ class DoraAlert:
         :param request: list of alerts
         :return: None
         """
+        if not request.alerts:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No alerts provided",
+            )
         for alert in request.alerts:
             validation_detail = self._validate_alert(alert)
 
@@ -97,141 +274,292 @@ class DoraAlert:
         :param alert: alert to validate
         :return: True if valid, False otherwise
         """
-        is_severity_valid = alert.severity.lower() in [
-            "low",
-            "medium",
-            "high",
-            "critical",
-        ]
+        is_severity_valid = alert.severity.lower() in SEVERITIES
         if not is_severity_valid:
             return "Invalid severity, must be one of: low, medium, high, critical"
         has_locations = (
-            alert.cities or alert.countries or alert.states or alert.pincodes
+            alert.cities
+            or alert.countries
+            or alert.states
+            or alert.pincodes
+            or alert.area
         )
         return (
             True
             if has_locations
-            else "No locations provided. Must provide at least one of: cities, countries, states, pincodes"
+            else "No locations provided. Must provide at least one of: cities, countries, states, pincodes, area"
+        )
+
+    def preview(self, db, alerts):
+        """
+        Size the audience of alerts from the region subscriber counts.
+        Subscribers within an area have no counts, they are read instead.
+        :param db: database session
+        :param alerts: alert create requests
+        :return: audience per alert
+        """
+        channels = self.channels()
+        previews = []
+        for alert in alerts:
+            recipients, locations = RegionIndex.preview(db, alert)
+            if alert.area:
+                recipients = sum(1 for _ in self.resolver.within_area(db, alert))
+            previews.append(
+                {
+                    "title": alert.title,
+                    "recipients": recipients,
+                    # every subscriber has both a phone number and an email
+                    "channels": dict.fromkeys(channels, recipients),
+                    "locations": locations,
+                }
+            )
+        return previews
+
+    async def estimate(self, request, db):
+        """
+        Estimate the SMS segments of alerts for their current audience, and
+        the time the SMS backend takes to send them within its rate limits
+        :param request: request body
+        :param db: database session
+        :return: estimate per alert and in total
+        """
+        counts = await db.run_sync(
+            lambda session: self.resolver.language_counts(session, request.alerts)
         )
+        estimates = []
+        for alert, languages in zip(request.alerts, counts):
+            renderer = self.renderer(alert, self.ESTIMATE_ALERT_ID)
+            variants = {}
+            for language, recipients in languages.items():
+                text = renderer.text(language)
+                variant = variants.setdefault(
+                    language_of(language),
+                    {
+                        "encoding": encoding(text),
+                        "segments": segments(text),
+                        "recipients": 0,
+                    },
+                )
+                variant["recipients"] += recipients
+            estimates.append(
+                {
+                    "title": alert.title,
+                    "recipients": sum(languages.values()),
+                    "segments": sum(
+                        variant["segments"] * variant["recipients"]
+                        for variant in variants.values()
+                    ),
+                    "variants": variants,
+                }
+            )
+        total = sum(estimate["segments"] for estimate in estimates)
+        recipients = sum(estimate["recipients"] for estimate in estimates)
+        return {
+            "alerts": estimates,
+            "segments": total,
+            "estimated_seconds": round(self.sms.send_time(recipients, total), 1),
+        }
 
     async def store_alerts(self, request, db):
         """
-        Store alerts in the database
+        Store alerts in the database in a single transaction.
+        New alerts are inserted with INSERT ... ON CONFLICT DO NOTHING and
+        alerts that already exist (uix_1) are read back with SELECT, each
+        statement taking STORE_CHUNK_SIZE alerts, so their bind parameters
+        stay within the driver's limit.
         :param request: request body
         :param db: database session
-        :return: list of alerts created
+        :return: list of stored alerts, in request order
         """
-        response = []
+        keys = [
+            (alert.title, alert.description, alert.severity) for alert in request.alerts
+        ]
+        unique_keys = list(dict.fromkeys(keys))
+        if not unique_keys:  # an empty VALUES list inserts DEFAULT VALUES
+            return []
+        columns = Alert.__table__.c
+        stored = {}
         try:
-            for alert in request.alerts:
-                if existing_alert := (  # alert already exists
-                    db.query(Alert)
-                    .filter_by(
-                        title=alert.title,
-                        description=alert.description,
-                        severity=alert.severity,
-                    )
-                    .first()
-                ):  # append and log
-                    response.append(existing_alert)
-                    self.logger.warning(
-                        "Alert already exists in the database. Skipping storage..."
+            for start in range(0, len(unique_keys), self.STORE_CHUNK_SIZE):
+                for row in await db.execute(
+                    insert(Alert)
+                    .values(
+                        [
+                            {
+                                "title": title,
+                                "description": description,
+                                "severity": severity,
+                            }
+                            for title, description, severity in unique_keys[
+                                start : start + self.STORE_CHUNK_SIZE
+                            ]
+                        ]
                     )
-                    continue
-                # otherwise create new alerts
-                alert_ = Alert(
-                    title=alert.title,
-                    description=alert.description,
-                    severity=alert.severity,
+                    .on_conflict_do_nothing(constraint="uix_1")
+                    .returning(*columns)
+                ):
+                    stored[(row.title, row.description, row.severity)] = row
+            if existing := [key for key in unique_keys if key not in stored]:
+                self.logger.warning(
+                    "%s alerts already exist in the database. Skipping storage...",
+                    len(existing),
                 )
-                db.add(alert_)
-                db.commit()
-                db.refresh(alert_)
-                response.append(alert_)
-            return response
+                for start in range(0, len(existing), self.STORE_CHUNK_SIZE):
+                    for row in await db.execute(
+                        select(*columns).where(
+                            tuple_(Alert.title, Alert.description, Alert.severity).in_(
+                                existing[start : start + self.STORE_CHUNK_SIZE]
+                            )
+                        )
+                    ):
+                        stored[(row.title, row.description, row.severity)] = row
+            await db.commit()
+            return [stored[key]._asdict() for key in keys]
         except Exception as e:
-            self.logger.error(f"Error storing alerts: {e}")
-            db.rollback()
+            self.logger.error("Error storing alerts: %s", e)
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error storing alerts: {e}",
             ) from e
 
-    async def send_alerts(self, request, db):
+    async def send_alerts(
+        self, request, db, progress=None, requested_at=None, alert_ids=None
+    ):
         """
-        Send alerts to users based on request
+        Send alerts to users based on request, the most severe first.
+        The time from the request to the last delivery of every alert
+        is recorded per severity.
+        Deliveries of stored alerts are recorded, and recipients that
+        already got an alert are skipped, so sending again (a retried job
+        or an alert posted twice) only reaches the remaining recipients.
         :param request: request body
         :param db: database session
+        :param progress: optional tracker for delivery counts
+        :param requested_at: POSIX time the alerts were requested at
+        :param alert_ids: ids of the stored alerts, in request order
         :return: None
         """
-        for alert in request.alerts:
-            if alert.inform_all:
-                self.numbers = db.query(Person.phone_number).all()
-                self.emails = db.query(Person.email).all()
-            else:
-                # send alerts to all pincodes, cities, states, countries in request
-                pincodes = alert.pincodes or []
-                cities = alert.cities or []
-                states = alert.states or []
-                countries = alert.countries or []
-                locations = [pincodes, cities, states, countries]
-                types = ["pincode", "city", "state", "country"]
-                for locations_, type_ in zip(locations, types):
-                    if locations_:
-                        await self.collect_contact_information(locations_, type_, db)
-            await self.trigger_text_alerts(
-                f"Severity[{alert.severity}]: {alert.title}\n{alert.description}"
-            )
-            await self.trigger_email_alerts(
-                f"Severity[{alert.severity}]: {alert.title}", alert.description
+        pairs = sorted(
+            zip(request.alerts, alert_ids or [None] * len(request.alerts)),
+            key=lambda pair: -pair[0].priority,
+        )
+        alerts = [alert for alert, _ in pairs]
+        ids = [alert_id for _, alert_id in pairs]
+        resolved = self.resolver.resolve(db, alerts, ids, self.channels())
+        # deliveries are committed on their own session, which would
+        # otherwise close the cursor the recipients are streamed from
+        with session_local() as record_db:
+            for alert_id in ids:
+                # resolving runs the audience queries, off the event loop
+                alert, recipients = await run_in_threadpool(next, resolved)
+                recorder = alert_id and DeliveryRecorder(record_db, alert_id)
+                await self.trigger_alerts(
+                    alert, recipients, progress, recorder, alert_id
+                )
+                if requested_at is not None:
+                    metrics.observe(
+                        "dora_alert_delivery_seconds",
+                        time.time() - requested_at,
+                        severity=alert.severity.lower(),
+                    )
+
+    @staticmethod
+    def channels():
+        """
+        Channels alerts are sent over, per the SEND_TEXTS and SEND_EMAILS flags
+        :return: list of channel names
+        """
+        config = settings()
+        return [
+            channel
+            for channel, enabled in (
+                ("text", config.SEND_TEXTS),
+                ("email", config.SEND_EMAILS),
             )
+            if enabled
+        ]
 
-    async def collect_contact_information(self, locations_, type_, db):
+    def renderer(self, alert, alert_id=None):
         """
-        Collect contact information for the given locations
-        :param locations_: list of locations
-        :param type_: type of location
-        :param db: database session
-        :return: None
+        Renderer of the messages of an alert, with texts shortened to
+        SMS_MAX_SEGMENTS segments and a link to the full alert
+        :param alert: alert create request
+        :param alert_id: id of the stored alert, used in the link
+        :return: MessageRenderer
         """
-        column = self.MAPPER[type_]
-        # query and store numbers and emails
-        for email, phone_number in (
-            db.query(Person.email, Person.phone_number)
-            .filter(column.in_(locations_))
-            .all()
-        ):
-            self.numbers.add(phone_number)
-            self.emails.add(email)
-            self.logger.info(f"{email} will be alerted.")
+        config = settings()
+        link = config.SMS_LINK_URL.format(alert_id=alert_id or "") or None
+        return MessageRenderer(
+            alert, self.twilio_client.email, config.SMS_MAX_SEGMENTS, link
+        )
 
-    async def trigger_text_alerts(self, message="Alert from Dora"):
+    async def trigger_alerts(
+        self, alert, recipients, progress=None, recorder=None, alert_id=None
+    ):
         """
-        Send text alerts
-        :param message: message to send
+        Send text and email alerts to the recipients of an alert.
+        Sends of more severe alerts preempt those of less severe ones.
+        :param alert: alert to send
+        :param recipients: iterable of rows with email and phone_number
+        :param progress: optional tracker for delivery counts
+        :param recorder: optional DeliveryRecorder for the alert
+        :param alert_id: id of the stored alert
         :return: None
         """
-        # trigger texts if flag is set and numbers are present
-        if not settings().SEND_TEXTS or not self.numbers:
-            self.logger.info("Skipping text alerts")
+        channels = self.channels()
+        # every language variant of the messages is rendered once
+        renderer = self.renderer(alert, alert_id)
+        sends = {}
+        # trigger texts and emails only if their flags are set
+        if "text" in channels:
+            sends["text"] = BatchSend(
+                partial(self.send_texts, renderer), self.sms.batch_size
+            )
+        if "email" in channels:
+            sends["email"] = partial(self.send_email, renderer)
+        if not sends:
+            self.logger.info("Skipping text and email alerts")
             return
-        for number in self.numbers:
-            self.twilio_client.send_text(message, number)
-        self.logger.info(f"Text alert sent to {self.numbers}")
+        reports = await self.delivery_engine.broadcast(
+            sends, recipients, progress, alert.priority, recorder
+        )
+        for channel, report in reports.items():
+            self.logger.info(
+                "%s alert sent to %s recipients, %s failed",
+                channel.capitalize(),
+                report.sent,
+                len(report.failed),
+                extra={
+                    "channel": channel,
+                    "sent": report.sent,
+                    "failed": len(report.failed),
+                    "skipped": report.skipped,
+                },
+            )
 
-    async def trigger_email_alerts(self, title, description):
+    def send_texts(self, renderer, recipients):
         """
-        Send email alerts
-        :param title: title of the alert
-        :param description: description of the alert
+        Send a text alert to a batch of recipients over the SMS backend,
+        one send per language
+        :param renderer: MessageRenderer of the alert
+        :param recipients: rows with a phone_number and language
         :return: None
         """
-        # trigger emails if flag is set and emails are present
-        if not settings().SEND_EMAILS or not self.emails:
-            self.logger.info("Skipping email alerts")
-            return
-        for email in self.emails:
-            self.twilio_client.send_email(
-                f"Alert from Dora: {title}", description, email
+        for language, group in groupby(
+            recipients, key=lambda recipient: language_of(recipient.language)
+        ):
+            self.sms.send(
+                renderer.text(language), [recipient.phone_number for recipient in group]
             )
-        self.logger.info(f"Email alert sent to {self.emails}")
+
+    def send_email(self, renderer, recipient):
+        """
+        Send an email alert to a single recipient
+        :param renderer: MessageRenderer of the alert
+        :param recipient: row with an email and language
+        :return: None
+        """
+        self.twilio_client.send_encoded_email(
+            renderer.email(recipient.language), recipient.email
+        )
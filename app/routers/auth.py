@@ -3,12 +3,14 @@ Handle user login and authentication endpoint
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db_helper import get_db
-from ..helpers import create_jwt_token, get_user, validate_password
+from ..db_helper import get_async_db
+from ..helpers import create_jwt_token, get_user, password_hasher, password_pool_busy
 from ..logger import Logger
 from ..models import User
+from ..passwords import PasswordQueueFull
 from ..schemas import Authentication
 
 
@@ -22,23 +24,41 @@ class DoraAuth:
 
     @staticmethod
     @router.post("/login", status_code=status.HTTP_200_OK)
-    def login(credentials: Authentication, db: Session = Depends(get_db)):
+    async def login(
+        credentials: Authentication, db: AsyncSession = Depends(get_async_db)
+    ):
         """
         Authenticates the credentials in the request
         Returns a valid JWT token if authentication is successful
         Otherwise, raises an HTTP exception with error code 403
+        Passwords hashed with an outdated cost factor are rehashed.
 
         :param credentials: username, password
         :param db: db
         :return: jwt access token
         """
-        user = db.query(User).filter(User.username == credentials.username).first()
-        if not user or not validate_password(credentials.password, user.password):
+        user = await db.scalar(
+            select(User).where(User.username == credentials.username)
+        )
+        valid = False
+        if user:
+            try:
+                valid, new_hash = await password_hasher.verify(
+                    credentials.password, user.password
+                )
+            except PasswordQueueFull as e:
+                DoraAuth.logger.warning("Password pool is full, rejecting login")
+                raise password_pool_busy() from e
+        if not valid:
             DoraAuth.logger.debug("Invalid credentials!")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials!"
             )
+        if new_hash:  # the cost factor changed since the password was set
+            user.password = new_hash
+            await db.commit()
+            DoraAuth.logger.info("Rehashed password of %s", user.username)
         jwt_token = create_jwt_token({"username": user.username})
         user_username = get_user(jwt_token)
-        DoraAuth.logger.info(f"User logged in: {user_username}")
+        DoraAuth.logger.info("User logged in: %s", user_username)
         return {"access_token": jwt_token, "token_type": "Bearer"}
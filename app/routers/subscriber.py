@@ -1,14 +1,32 @@
 """
 Handles subscriber endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from .. import models
-from ..db_helper import get_db
-from ..helpers import get_user, hash_password
+from ..audience_index import audience_index
+from ..db_helper import get_async_db, get_db, get_read_db
+from ..geo import locate
+from ..helpers import get_user
 from ..logger import Logger
+from ..pagination import keyset_page, ndjson_export, parse_fields
+from ..regions import RegionIndex
 from ..schemas import *
+from ..settings import settings
+from ..subscriber_import import FORMATS, SubscriberImporter
 
 
 class DoraSubscriber:
@@ -23,7 +41,7 @@ class DoraSubscriber:
     @router.post("/subscribe", status_code=status.HTTP_201_CREATED)
     async def subscribe(
         request: Subscriber,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         username: str = Depends(get_user),
     ):
         """
@@ -36,7 +54,7 @@ class DoraSubscriber:
         :return: JSON object
         """
         DoraSubscriber.logger.info(
-            f"Registering subscriber {request.email} from {username}'s request."
+            "Registering subscriber %s from %s's request.", request.email, username
         )
         try:
             subscriber = models.Person(
@@ -49,15 +67,25 @@ class DoraSubscriber:
                 city=request.city,
                 state=request.state,
                 country=request.country,
+                latitude=request.latitude,
+                longitude=request.longitude,
+                geocell=locate(request.latitude, request.longitude),
             )
             db.add(subscriber)
-            db.commit()
-            db.refresh(subscriber)
-            DoraSubscriber.logger.info(f"Subscriber {subscriber.email} registered.")
+            await db.flush()
+            # place the subscriber in the region hierarchy
+            await db.run_sync(
+                lambda session: RegionIndex.refresh(session, [subscriber.id])
+            )
+            await db.commit()
+            await db.refresh(subscriber)
+            if audience_index:
+                audience_index.subscribe(subscriber)
+            DoraSubscriber.logger.info("Subscriber %s registered.", subscriber.email)
             return subscriber
         except Exception as e:
             DoraSubscriber.logger.error(
-                f"Subscriber {request.email} registration failed."
+                "Subscriber %s registration failed.", request.email
             )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -66,41 +94,133 @@ class DoraSubscriber:
 
     @staticmethod
     @router.get(
-        "/subscribers", response_model=Subscribers, status_code=status.HTTP_200_OK
+        "/subscribers",
+        response_model=Subscribers,
+        response_model_exclude_unset=True,
+        status_code=status.HTTP_200_OK,
     )
     async def get_subscribers(
         email: str = Query(None),
-        pin_code: str = Query(None),
+        pin_code: int = Query(None),
         city: str = Query(None),
-        db: Session = Depends(get_db),
+        cursor: int = Query(None),
+        limit: int = Query(settings().PAGE_SIZE, ge=1, le=settings().MAX_PAGE_SIZE),
+        fields: str = Query(None),
+        format: str = Query("json", regex="^(json|ndjson)$"),
+        db: AsyncSession = Depends(get_read_db),
         username: str = Depends(get_user),
     ):
         """
-        Returns all subscribers in the database.
+        Returns a page of subscribers in the database, ordered by id.
+        Pass the next_cursor of a page as cursor to get the next one.
+        With format=ndjson, every matching subscriber is streamed instead.
         Success status code: 200
-        Error status code: 500
+        Error status code: 400, 500
         :param city: city of the subscriber
         :param pin_code: pin code of the subscriber
         :param email: email of the subscriber
+        :param cursor: next_cursor of the previous page
+        :param limit: maximum number of subscribers in the page
+        :param fields: comma separated fields to return, all by default
+        :param format: json for a page, ndjson for a full export
         :param username: username of the user
         :param db: Database session
         :return: JSON object
         """
-        DoraSubscriber.logger.info(f"Retrieving subscribers for {username}'s request.")
+        DoraSubscriber.logger.info("Retrieving subscribers for %s's request.", username)
+        fields_ = parse_fields(fields, list(Subscriber.__fields__))
+        person = models.Person
+        query = select(person.id, *(getattr(person, field) for field in fields_))
+        if email:
+            query = query.where(person.email == email)
+        if pin_code:
+            query = query.where(person.pin_code == pin_code)
+        if city:
+            query = query.where(person.city == city)
+        if format == "ndjson":
+            return ndjson_export(db, query.order_by(person.id), fields_)
         try:
-            subscribers = db.query(models.Person)
-            if email:
-                subscribers = subscribers.filter(models.Person.email == email)
-            if pin_code:
-                subscribers = subscribers.filter(models.Person.pin_code == pin_code)
-            if city:
-                subscribers = subscribers.filter(models.Person.city == city)
-            subscribers = subscribers.all()
+            subscribers, next_cursor = await keyset_page(
+                db, query, person.id, fields_, cursor, limit
+            )
             DoraSubscriber.logger.info("Subscribers fetched.")
-            return {"subscribers": subscribers}
+            return {"subscribers": subscribers, "next_cursor": next_cursor}
         except Exception as e:
             DoraSubscriber.logger.error("Subscribers fetch failed.")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Subscribers fetch failed.",
             ) from e
+
+    @staticmethod
+    @router.post("/subscribers/import", status_code=status.HTTP_200_OK)
+    async def import_subscribers(
+        http_request: Request,
+        content_type: str = Header(...),
+        db: Session = Depends(get_db),
+        username: str = Depends(get_user),
+    ):
+        """
+        Imports subscribers from a streamed CSV (text/csv) or
+        NDJSON (application/x-ndjson) upload. Existing subscribers
+        with the same email are updated.
+        Success status code: 200
+        Error status code: 415, 500
+        :param http_request: request whose body is streamed
+        :param content_type: format of the upload
+        :param username: username of the user
+        :param db: Database session
+        :return: counts of inserted and updated subscribers and per-line errors
+        """
+        if not (format_ := FORMATS.get(content_type.split(";")[0].strip())):
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported upload format. Must be one of: {', '.join(FORMATS)}",
+            )
+        DoraSubscriber.logger.info("Importing subscribers for %s's request.", username)
+        importer = SubscriberImporter(db, settings().IMPORT_CHUNK_SIZE)
+        try:
+            report = await importer.run(http_request.stream(), format_)
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            DoraSubscriber.logger.error("Subscriber import failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Subscriber import failed.",
+            ) from e
+        if audience_index:  # new subscribers, and updated ones that may have moved
+            await run_in_threadpool(audience_index.catch_up, db, importer.merged_ids)
+        return report
+
+    @staticmethod
+    @router.delete(
+        "/subscribers/{subscriber_id}", status_code=status.HTTP_204_NO_CONTENT
+    )
+    async def unsubscribe(
+        subscriber_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        username: str = Depends(get_user),
+    ):
+        """
+        Removes a subscriber, who receives no further alerts.
+        Success status code: 204
+        Error status code: 404
+        :param subscriber_id: id of the subscriber
+        :param db: Database session
+        :param username: username of the user
+        :return: None
+        """
+        if not (subscriber := await db.get(models.Person, subscriber_id)):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Subscriber {subscriber_id} does not exist.",
+            )
+        DoraSubscriber.logger.info(
+            "Removing subscriber %s on %s's request.", subscriber_id, username
+        )
+        await db.run_sync(lambda session: RegionIndex.remove(session, [subscriber_id]))
+        await db.delete(subscriber)
+        await db.commit()
+        if audience_index:
+            audience_index.unsubscribe(subscriber_id)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -6,12 +6,14 @@ Handles user-related operation endpoints:
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..db_helper import get_db
-from ..helpers import hash_password
+from ..db_helper import get_async_db, get_read_db
+from ..helpers import password_hasher, password_pool_busy
 from ..logger import Logger
+from ..passwords import PasswordQueueFull
 from ..schemas import RegistrationRequest, RegistrationResponse, UserInfo
 
 
@@ -29,7 +31,7 @@ class DoraUser:
 
     @staticmethod
     @router.get("/{username}", response_model=RegistrationResponse)
-    async def get_user(username: str, db_session: Session = Depends(get_db)):
+    async def get_user(username: str, db_session: AsyncSession = Depends(get_read_db)):
         """
         Returns a user from the database.
         Success status code: 200
@@ -38,10 +40,8 @@ class DoraUser:
         :param username: username of the user
         :return: JSON object
         """
-        if (  # return user if present in the database
-            user := db_session.query(models.User)
-            .filter(models.User.username == username)
-            .first()
+        if user := await db_session.scalar(  # return user if present in the database
+            select(models.User).where(models.User.username == username)
         ):
             DoraUser.logger.info("User %s fetched.", user.username)
             return user
@@ -55,7 +55,7 @@ class DoraUser:
 
     @staticmethod
     @router.get("/", response_model=UserInfo)
-    async def get_users(db_session: Session = Depends(get_db)):
+    async def get_users(db_session: AsyncSession = Depends(get_read_db)):
         """
         Returns all registered users from the database.
         Success status code: 200
@@ -63,7 +63,7 @@ class DoraUser:
         :param db_session: Database session
         :return: JSON object
         """
-        if users := db_session.query(models.User).all():
+        if users := (await db_session.scalars(select(models.User))).all():
             return {"users": users}
         DoraUser.logger.warning("No users in the database. Return 404 Exception")
         raise HTTPException(
@@ -77,7 +77,7 @@ class DoraUser:
     async def register(
         request: RegistrationRequest,
         response: Response,
-        db_session: Session = Depends(get_db),
+        db_session: AsyncSession = Depends(get_async_db),
     ):
         """
         Registers the user
@@ -87,13 +87,17 @@ class DoraUser:
         :param db_session: Database session
         :return: JSON object
         """
-        request.password = hash_password(request.password)
+        try:
+            request.password = await password_hasher.hash(request.password)
+        except PasswordQueueFull as e:
+            DoraUser.logger.warning("Password pool is full, rejecting registration")
+            raise password_pool_busy() from e
         try:
             if user := models.User(**request.dict()):
                 response.status_code = status.HTTP_201_CREATED
                 db_session.add(user)
-                db_session.commit()
-                db_session.refresh(user)
+                await db_session.commit()
+                await db_session.refresh(user)
                 return user
         except Exception as exception:
             DoraUser.logger.warning(
@@ -1,9 +1,10 @@
 """
 Define the schemas for the API
 """
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, root_validator
 
 
 class Registration(BaseModel):
@@ -62,6 +63,36 @@ class JWTToken(BaseModel):
     username: Optional[str]
 
 
+class Area(BaseModel):
+    """
+    Schema for a geographic area:
+    a point with a radius, or a GeoJSON Polygon geometry
+    """
+
+    latitude: Optional[float]
+    longitude: Optional[float]
+    radius_km: Optional[float]
+    polygon: Optional[Dict[str, Any]]
+
+    @root_validator
+    def check_shape(cls, values):
+        circle = [values.get(f) for f in ("latitude", "longitude", "radius_km")]
+        polygon = values.get("polygon")
+        if polygon is not None:
+            if any(v is not None for v in circle):
+                raise ValueError("Provide either a point and radius or a polygon")
+            rings = polygon.get("coordinates")
+            if polygon.get("type") != "Polygon" or not rings or len(rings[0]) < 4:
+                raise ValueError("polygon must be a GeoJSON Polygon geometry")
+        elif any(v is None for v in circle) or values["radius_km"] <= 0:
+            raise ValueError("Provide latitude, longitude and a positive radius_km")
+        return values
+
+
+# alert severities, from the lowest to the highest dispatch priority
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
 class AlertCreateRequest(BaseModel):
     """
     Schema for a single alert
@@ -75,8 +106,17 @@ class AlertCreateRequest(BaseModel):
     cities: Optional[List[str]]
     states: Optional[List[str]]
     countries: Optional[List[str]]
+    area: Optional[Area]
     inform_all: Optional[bool] = False
 
+    @property
+    def priority(self) -> int:
+        """
+        Dispatch priority of the alert, higher for more severe alerts
+        """
+        severity = self.severity.lower()
+        return SEVERITIES.index(severity) if severity in SEVERITIES else 0
+
 
 class AlertsCreateRequest(BaseModel):
     """
@@ -86,6 +126,105 @@ class AlertsCreateRequest(BaseModel):
     alerts: List[AlertCreateRequest]
 
 
+class AlertFields(BaseModel):
+    """
+    Schema for a stored alert restricted to the requested fields
+    """
+
+    id: Optional[int]
+    title: Optional[str]
+    description: Optional[str]
+    severity: Optional[str]
+    created_at: Optional[datetime]
+
+
+class Alerts(BaseModel):
+    """
+    Schema for a page of alerts
+    """
+
+    alerts: List[AlertFields]
+    next_cursor: Optional[int]
+
+
+class AlertJobStatus(BaseModel):
+    """
+    Schema for the progress of an alert dispatch job
+    """
+
+    id: int
+    status: str
+    queued: int
+    sent: int
+    failed: int
+    retried: int
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class TextVariant(BaseModel):
+    """
+    Schema for one language variant of a text alert
+    """
+
+    encoding: str  # GSM-7 or UCS-2
+    segments: int  # per message
+    recipients: int
+
+
+class AlertEstimate(BaseModel):
+    """
+    Schema for the SMS cost of an alert
+    """
+
+    title: str
+    recipients: int
+    segments: int
+    variants: Dict[str, TextVariant]  # language -> variant
+
+
+class AlertsEstimate(BaseModel):
+    """
+    Schema for the dry run of an alert request
+    """
+
+    alerts: List[AlertEstimate]
+    segments: int
+    estimated_seconds: float
+
+
+class AudiencePreview(BaseModel):
+    """
+    Schema for the audience of an alert
+    """
+
+    title: str
+    recipients: int
+    channels: Dict[str, int]  # enabled channel -> recipients
+    locations: Dict[str, Dict[str, int]]  # target field -> location -> subscribers
+
+
+class AudiencePreviews(BaseModel):
+    """
+    Schema for the audiences of an alert request
+    """
+
+    alerts: List[AudiencePreview]
+
+
+class AlertDeliveries(BaseModel):
+    """
+    Schema for the delivery counts of an alert
+    """
+
+    alert_id: int
+    counts: Dict[str, Dict[str, int]]  # channel -> status -> recipients
+
+
 class Subscriber(BaseModel):
     """
     Schema for a single subscriber
@@ -100,17 +239,38 @@ class Subscriber(BaseModel):
     city: str
     state: str
     country: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
     class Config:
         orm_mode = True
 
 
+class SubscriberFields(BaseModel):
+    """
+    Schema for a subscriber restricted to the requested fields
+    """
+
+    first_name: Optional[str]
+    last_name: Optional[str]
+    email: Optional[EmailStr]
+    phone_number: Optional[str]
+    language: Optional[str]
+    pin_code: Optional[int]
+    city: Optional[str]
+    state: Optional[str]
+    country: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
 class Subscribers(BaseModel):
     """
-    Schema for subscribers
+    Schema for a page of subscribers
     """
 
-    subscribers: Optional[List[Subscriber]]
+    subscribers: Optional[List[SubscriberFields]]
+    next_cursor: Optional[int]
 
     class Config:
         orm_mode = True
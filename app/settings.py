@@ -1,10 +1,17 @@
 """
 Reads environment variables from .env file and stores them in a Settings class.
 """
+import asyncio
+import signal
+import threading
+from typing import Optional
+
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from pydantic import BaseSettings
 
+from .logger import Logger, configure_logging
+
 
 class Settings(BaseSettings):
     """
@@ -23,8 +30,51 @@ class Settings(BaseSettings):
     TWILIO_PHONE_NUMBER: str
     EMAIL: str
     APP_PASSWORD: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_REPLICAS: str = ""  # comma separated replica hosts, same credentials
+    DB_REPLICA_MAX_LAG: float = 5.0
     SEND_EMAILS: bool = True
     SEND_TEXTS: bool = True
+    TWILIO_SENDER_NUMBERS: str = ""  # comma separated, TWILIO_PHONE_NUMBER if empty
+    TEXT_RATE_PER_NUMBER: float = 1.0  # messages per second per sender number
+    SMS_BACKEND: str = "twilio"  # twilio (a request per number) or notify (bulk)
+    TWILIO_NOTIFY_SERVICE_SID: str = ""
+    SMS_BATCH_SIZE: int = 1000  # numbers per notify request, at most 10000
+    NOTIFY_RATE: float = 5.0  # notify requests per second
+    SMS_MAX_SEGMENTS: int = 0  # longer texts are shortened, 0 for no limit
+    SMS_LINK_URL: str = ""  # full alert link for shortened texts, may use {alert_id}
+    EMAIL_RATE: float = 10.0  # messages per second
+    SEND_RETRIES: int = 3
+    SEND_BACKOFF: float = 1.0
+    TEXT_CONCURRENCY: int = 10
+    EMAIL_CONCURRENCY: int = 5
+    RECIPIENT_CHUNK_SIZE: int = 1000
+    AUDIENCE_INDEX: bool = False  # in-memory audience index, needs NumPy
+    AUDIENCE_INDEX_SNAPSHOT: str = "audience_index.npz"
+    IMPORT_CHUNK_SIZE: int = 5000
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # text (colorized) or json
+    PAGE_SIZE: int = 100
+    MAX_PAGE_SIZE: int = 1000
+    SMTP_HOST: str = "smtp.gmail.com"
+    SMTP_PORT: int = 587
+    SMTP_STARTTLS: bool = True
+    SMTP_POOL_SIZE: int = 5
+    SMTP_IDLE_TIMEOUT: float = 60.0
+    JOB_WORKERS: int = 1
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_LEASE_SECONDS: int = 300
+    JOB_URGENT_SEVERITY: str = "high"  # served by a dedicated worker
+    PASSWORD_ROUNDS: int = 12
+    PASSWORD_WORKERS: int = 4
+    PASSWORD_MAX_PENDING: int = 64
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: float = 300.0
     PASSWORD_CONTEXT: CryptContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
     OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -32,9 +82,48 @@ class Settings(BaseSettings):
         env_file = ".env"
 
 
+_settings: Optional[Settings] = None
+_lock = threading.Lock()
+logger = Logger(__name__)
+
+
 def settings() -> Settings:
     """
-    Returns settings from .env file.
-    :return:
+    Returns the process-wide settings, read from .env on first use.
+    Call reload_settings to pick up changes.
+    :return: settings
+    """
+    return _settings or reload_settings()
+
+
+def reload_settings() -> Settings:
+    """
+    Re-reads .env and the environment and replaces the process-wide settings.
+    If validation fails, the current settings stay in place.
+    Loggers take the new LOG_LEVEL and LOG_FORMAT.
+    :return: new settings
+    """
+    global _settings
+    with _lock:
+        new = Settings()  # instantiate the Settings class
+        configure_logging(new.LOG_LEVEL, new.LOG_FORMAT)
+        _settings = new
+    return _settings
+
+
+def _reload_on_signal():
+    try:
+        reload_settings()
+        logger.info("Settings reloaded")
+    except ValueError as e:  # invalid settings, including LOG_LEVEL and LOG_FORMAT
+        logger.error("Settings reload failed, keeping current settings: %s", e)
+
+
+async def reload_on_sighup():
+    """
+    Reload the settings whenever the process receives SIGHUP,
+    e.g. to toggle SEND_TEXTS or SEND_EMAILS without a restart
+    :return: None
     """
-    return Settings()  # instantiate the Settings class
+    if hasattr(signal, "SIGHUP"):  # not available on Windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload_on_signal)
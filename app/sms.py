@@ -0,0 +1,132 @@
+"""
+Pluggable backends for text alerts
+"""
+import json
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, Type
+
+from .rate_limit import RateLimiter
+from .twilio_client import TwilioClient, is_retryable_text_error
+
+
+class SMSChannel(ABC):
+    """
+    Sends one text to a batch of phone numbers.
+
+    The delivery engine hands every send up to batch_size numbers.
+    A send either reaches all of its numbers or raises, in which case the
+    whole batch is reported as failed.
+    """
+
+    batch_size = 1
+
+    @abstractmethod
+    def send(self, message, numbers: List[str]):
+        """
+        Send a text to phone numbers
+        :param message: message to send
+        :param numbers: at most batch_size phone numbers
+        :return: None
+        """
+
+    @abstractmethod
+    def send_time(self, recipients, segments) -> float:
+        """
+        Estimate the time to send texts within the channel's rate limits
+        :param recipients: phone numbers to send to
+        :param segments: SMS segments sent to all of them
+        :return: seconds
+        """
+
+
+class PerNumberSMS(SMSChannel):
+    """
+    One Twilio REST request per number, spread over the sender numbers
+    within their rate limits
+    """
+
+    def __init__(self, twilio_client: TwilioClient):
+        """
+        :param twilio_client: client sending the texts
+        """
+        self.twilio_client = twilio_client
+
+    def send(self, message, numbers):
+        for number in numbers:
+            self.twilio_client.send_text(message, number)
+
+    def send_time(self, recipients, segments):
+        # providers count every segment against the rate of a sender number
+        buckets = self.twilio_client.text_limiter.buckets.values()
+        return segments / sum(bucket.max_rate for bucket in buckets)
+
+
+class NotifySMS(SMSChannel):
+    """
+    Twilio Notify: a single request sends a text to up to 10,000 numbers,
+    passed as SMS bindings, and Twilio queues the messages on its side.
+    Requests are rate limited and retried like per-number sends.
+    """
+
+    def __init__(self, twilio_client: TwilioClient, service_sid, batch_size, rate):
+        """
+        :param twilio_client: client holding the Twilio credentials
+        :param service_sid: sid of the Notify service, with a messaging service
+        :param batch_size: numbers per request
+        :param rate: requests per second
+        """
+        self.twilio_client = twilio_client
+        self.service_sid = service_sid
+        self.batch_size = batch_size
+        config = twilio_client.settings
+        self.limiter = RateLimiter(
+            "notify",
+            {service_sid: rate},
+            is_retryable_text_error,
+            retries=config.SEND_RETRIES,
+            backoff=config.SEND_BACKOFF,
+        )
+
+    def send(self, message, numbers):
+        bindings = [
+            json.dumps({"binding_type": "sms", "address": str(number)})
+            for number in numbers
+        ]
+        service = self.twilio_client.client.notify.v1.services(self.service_sid)
+        self.limiter.send(
+            lambda _: service.notifications.create(body=message, to_binding=bindings)
+        )
+
+    def send_time(self, recipients, segments):
+        # one rate limited request per batch, whatever the segments
+        rate = self.limiter.buckets[self.service_sid].max_rate
+        return math.ceil(recipients / self.batch_size) / rate
+
+
+SMS_CHANNELS: Dict[str, Type[SMSChannel]] = {
+    "twilio": PerNumberSMS,
+    "notify": NotifySMS,
+}
+
+
+def sms_channel(twilio_client: TwilioClient) -> SMSChannel:
+    """
+    Build the text backend selected by the SMS_BACKEND setting
+    :param twilio_client: client holding the Twilio credentials
+    :return: SMS channel
+    """
+    config = twilio_client.settings
+    if config.SMS_BACKEND not in SMS_CHANNELS:
+        raise ValueError(
+            f"Unknown SMS_BACKEND {config.SMS_BACKEND!r}, "
+            f"expected one of {', '.join(SMS_CHANNELS)}"
+        )
+    if config.SMS_BACKEND == "notify":
+        return NotifySMS(
+            twilio_client,
+            config.TWILIO_NOTIFY_SERVICE_SID,
+            config.SMS_BATCH_SIZE,
+            config.NOTIFY_RATE,
+        )
+    return PerNumberSMS(twilio_client)
@@ -0,0 +1,86 @@
+"""
+SMS encodings, segment counting and message compaction
+"""
+from typing import Iterator, Optional
+
+GSM7 = "GSM-7"
+UCS2 = "UCS-2"
+
+# GSM 03.38 default alphabet, one septet per character
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# extension table, an escape septet plus one septet per character
+GSM7_EXTENSION = frozenset("^{}\\[~]|€\f")
+
+# units per single message, and per segment of a concatenated message
+# (the user data header takes the rest)
+LIMITS = {GSM7: (160, 153), UCS2: (70, 67)}
+
+ELLIPSIS = "..."
+
+
+def encoding(text) -> str:
+    """
+    Encoding a text is sent with: GSM-7 if every character is in its
+    alphabet, UCS-2 otherwise
+    :param text: message
+    :return: GSM-7 or UCS-2
+    """
+    return GSM7 if all(c in GSM7_BASIC or c in GSM7_EXTENSION for c in text) else UCS2
+
+
+def _units(text, encoding_) -> Iterator[int]:
+    """
+    Units (septets or UTF-16 code units) of every character, which can
+    not be split across segments
+    """
+    for c in text:
+        if encoding_ == GSM7:
+            yield 2 if c in GSM7_EXTENSION else 1
+        else:
+            yield 2 if ord(c) > 0xFFFF else 1
+
+
+def segments(text) -> int:
+    """
+    Number of segments a text is sent in
+    :param text: message
+    :return: segments, at least one
+    """
+    encoding_ = encoding(text)
+    single, per_segment = LIMITS[encoding_]
+    units = list(_units(text, encoding_))
+    if sum(units) <= single:
+        return 1
+    count, used = 1, 0
+    for size in units:
+        if used + size > per_segment:
+            count, used = count + 1, 0
+        used += size
+    return count
+
+
+def compact(text, max_segments, link: Optional[str] = None) -> str:
+    """
+    Shorten a text to at most max_segments segments, ending it with an
+    ellipsis and the link to the full alert if one is given
+    :param text: message
+    :param max_segments: segments allowed, 0 for no limit
+    :param link: URL of the full alert
+    :return: message that fits
+    """
+    if not max_segments or segments(text) <= max_segments:
+        return text
+    suffix = f"{ELLIPSIS} {link}" if link else ELLIPSIS
+    # binary search for the longest prefix that fits with the suffix;
+    # the prefix can only get cheaper as it gets shorter
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if segments(text[:middle].rstrip() + suffix) <= max_segments:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + suffix
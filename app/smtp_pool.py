@@ -0,0 +1,198 @@
+"""
+Pool of authenticated SMTP sessions shared by all email sends
+"""
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from .logger import Logger
+
+REAP_INTERVAL_MIN = 1.0  # seconds, keeps a zero idle_timeout from spinning
+
+
+def is_connection_error(error) -> bool:
+    """
+    Whether a session can no longer be trusted after an error.
+    SMTPException is an OSError too, but a reply like a refused recipient
+    or a 4xx rate limit leaves the session usable.
+    :param error: exception raised while using a session
+    :return: True for dropped or failed connections
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """
+    Keeps up to size authenticated SMTP sessions open and reuses them
+    for many messages. Broken sessions are replaced transparently and
+    sessions that stay idle longer than idle_timeout are closed.
+    """
+
+    logger = Logger(__name__)
+
+    def __init__(
+        self,
+        host,
+        port,
+        username,
+        password,
+        size=5,
+        idle_timeout=60.0,
+        starttls=True,
+    ):
+        """
+        Set up the pool. Sessions are opened lazily.
+        :param host: SMTP server host
+        :param port: SMTP server port
+        :param username: login username
+        :param password: login password
+        :param size: maximum number of open sessions
+        :param idle_timeout: seconds after which an unused session is closed
+        :param starttls: upgrade sessions with STARTTLS before login
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.starttls = starttls
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = threading.Event()
+        self._reaper = None
+
+    def _connect(self):
+        """
+        Open and authenticate a new session
+        :return: SMTP session
+        """
+        server = smtplib.SMTP(self.host, self.port)
+        try:
+            if self.starttls:
+                server.starttls()
+            server.login(self.username, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    @staticmethod
+    def _quit(server):
+        """
+        Close a session, ignoring errors from already broken connections
+        :param server: SMTP session
+        :return: None
+        """
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _start_reaper(self):
+        """
+        Start the background thread that closes idle sessions
+        :return: None
+        """
+        if self._reaper is None:
+            self._reaper = threading.Thread(
+                target=self._reap, name="dora-smtp-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap(self):
+        """
+        Periodically close idle sessions until the pool is closed
+        :return: None
+        """
+        while not self._closed.wait(max(self.idle_timeout / 2, REAP_INTERVAL_MIN)):
+            self.close_idle()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a session, opening a new one if none is idle.
+        Sessions that raise connection errors are discarded, any other
+        session is returned to the pool.
+        :return: SMTP session
+        """
+        with self._slots:
+            with self._lock:
+                server = self._idle.pop()[0] if self._idle else None
+                self._start_reaper()
+            if server is None:
+                server = self._connect()
+            try:
+                yield server
+            except Exception as e:
+                if is_connection_error(e):
+                    self._quit(server)
+                else:
+                    with self._lock:
+                        self._idle.append((server, time.monotonic()))
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+
+    def _send(self, send):
+        """
+        Call send with a pooled session.
+        Retries once on a fresh session if the pooled one was dropped.
+        :param send: callable taking the SMTP session
+        :return: None
+        """
+        try:
+            with self.connection() as server:
+                send(server)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            self.logger.warning("SMTP session dropped, reconnecting: %s", e)
+            with self.connection() as server:
+                send(server)
+
+    def send_message(self, message):
+        """
+        Send a message over a pooled session
+        :param message: email message to send
+        :return: None
+        """
+        self._send(lambda server: server.send_message(message))
+
+    def sendmail(self, from_addr, to_addr, data):
+        """
+        Send an already encoded message over a pooled session
+        :param from_addr: envelope sender
+        :param to_addr: envelope recipient
+        :param data: message bytes, headers included
+        :return: None
+        """
+        self._send(lambda server: server.sendmail(from_addr, [to_addr], data))
+
+    def close_idle(self):
+        """
+        Close sessions that have been idle for longer than idle_timeout
+        :return: None
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [server for server, used in self._idle if used <= deadline]
+            self._idle = [(s, used) for s, used in self._idle if used > deadline]
+        for server in expired:
+            self._quit(server)
+
+    def close(self):
+        """
+        Close every idle session and stop the reaper
+        :return: None
+        """
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._quit(server)
@@ -0,0 +1,246 @@
+"""
+Bulk import of subscribers from CSV or NDJSON uploads
+"""
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict, List
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import text
+
+from .geo import locate
+from .logger import Logger
+from .regions import RegionIndex
+from .schemas import Subscriber
+
+FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson"}
+MAX_RECORD_LINES = 100  # lines a quoted CSV field may span
+
+
+class SubscriberImporter:
+    """
+    Imports subscribers from a streamed upload.
+
+    Records are validated with the Subscriber schema and copied in chunks
+    into a temporary staging table with COPY. Once the upload is read, the
+    staging table is merged into people in the same transaction, updating
+    subscribers that already exist with the same email. Only one chunk of
+    records is held in memory at a time. COPY needs the psycopg2
+    connection of a sync session, so database calls run in the threadpool.
+    """
+
+    logger = Logger(__name__)
+    COLUMNS = [*Subscriber.__fields__, "geocell"]
+
+    def __init__(self, db, chunk_size=5000):
+        """
+        :param db: database session
+        :param chunk_size: number of valid records copied at a time
+        """
+        self.db = db
+        self.chunk_size = chunk_size
+        self.received = 0
+        self.errors: List[Dict] = []
+        self.merged_ids: List[int] = []  # inserted and updated subscribers
+
+    @staticmethod
+    async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        """
+        Decode a byte stream into lines
+        :param chunks: raw upload chunks
+        :return: lines without line endings
+        """
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        buffer = ""
+        async for chunk in chunks:
+            buffer += decoder.decode(chunk)
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                yield line.rstrip("\r")
+        buffer += decoder.decode(b"", final=True)
+        if buffer.strip():
+            yield buffer.rstrip("\r")
+
+    async def read_records(self, chunks, format_):
+        """
+        Parse the upload into records.
+        csv.reader decides where a CSV record ends: lines are buffered while
+        they end inside a quoted field, so a quoted field may span lines.
+        Lines still buffered at the end of the upload, or after
+        MAX_RECORD_LINES lines, are reported as malformed one by one.
+        :param chunks: raw upload chunks
+        :param format_: csv or ndjson
+        :return: (line number, record) pairs; record is None if the line could not be parsed
+        """
+        header = None
+        line_number = 0
+        lines: List[str] = []  # lines of the CSV record being read
+        async for line in self.read_lines(chunks):
+            line_number += 1
+            if not lines and not line.strip():
+                continue
+            if format_ == "ndjson":
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_number, record if isinstance(record, dict) else None
+                continue
+            lines.append(line + "\n")
+            try:
+                [values] = csv.reader(lines, strict=True)
+            except csv.Error as e:
+                if str(e) == "unexpected end of data":  # in a quoted field
+                    if len(lines) < MAX_RECORD_LINES:
+                        continue
+                    for number in range(line_number - len(lines) + 1, line_number + 1):
+                        yield number, None
+                    lines = []
+                    continue
+                values = None
+            start, lines = line_number - len(lines) + 1, []
+            if header is None:
+                header = values or []
+            else:
+                yield start, self.csv_record(header, values)
+        for number in range(line_number - len(lines) + 1, line_number + 1):
+            yield number, None
+
+    @staticmethod
+    def csv_record(header, values):
+        """
+        Pair CSV values with the header
+        :param header: column names
+        :param values: values of a row, None if it could not be parsed
+        :return: record, None if the row does not have a value per column
+        """
+        if values is None or len(values) != len(header):
+            return None
+        return dict(zip(header, values))
+
+    async def run(self, chunks, format_):
+        """
+        Validate, stage and merge the uploaded subscribers
+        :param chunks: raw upload chunks
+        :param format_: csv or ndjson
+        :return: import report
+        """
+        await run_in_threadpool(
+            self.db.execute,
+            text(
+                "CREATE TEMP TABLE people_import (line integer, first_name varchar, "
+                "last_name varchar, email varchar, phone_number varchar, "
+                "language varchar, pin_code integer, city varchar, state varchar, "
+                "country varchar, latitude double precision, longitude double precision, "
+                "geocell bigint) ON COMMIT DROP"
+            ),
+        )
+        chunk = []
+        async for line, record in self.read_records(chunks, format_):
+            self.received += 1
+            if record is None:
+                self.errors.append({"line": line, "detail": "Malformed record"})
+                continue
+            try:
+                subscriber = Subscriber(**record)
+            except ValidationError as e:
+                self.errors.append({"line": line, "detail": e.errors()})
+                continue
+            chunk.append(
+                [
+                    line,
+                    *(getattr(subscriber, c) for c in Subscriber.__fields__),
+                    locate(subscriber.latitude, subscriber.longitude),
+                ]
+            )
+            if len(chunk) >= self.chunk_size:
+                await run_in_threadpool(self.stage, chunk)
+                chunk = []
+        if chunk:
+            await run_in_threadpool(self.stage, chunk)
+        inserted, updated = await run_in_threadpool(self.merge)
+        await run_in_threadpool(self.db.commit)
+        self.logger.info(
+            "Imported subscribers: %s inserted, %s updated, %s rejected",
+            inserted,
+            updated,
+            len(self.errors),
+        )
+        return {
+            "received": self.received,
+            "inserted": inserted,
+            "updated": updated,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+        }
+
+    def stage(self, rows):
+        """
+        Copy validated rows into the staging table
+        :param rows: rows of line number followed by the subscriber columns
+        :return: None
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY people_import (line, {', '.join(self.COLUMNS)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+    def reject(self, statement, detail):
+        """
+        Remove staged rows and report them as errors
+        :param statement: DELETE ... RETURNING line
+        :param detail: reason reported for every removed row
+        :return: None
+        """
+        for (line,) in self.db.execute(text(statement)):
+            self.errors.append({"line": line, "detail": detail})
+
+    def merge(self):
+        """
+        Merge the staging table into people, upserting on email,
+        and index the regions of the merged subscribers
+        :return: number of inserted and updated subscribers
+        """
+        for column in ("email", "phone_number"):  # the last line wins
+            self.reject(
+                "DELETE FROM people_import i USING people_import later "
+                f"WHERE later.{column} = i.{column} AND later.line > i.line "
+                "RETURNING i.line",
+                f"Duplicate {column} in upload, superseded by a later line",
+            )
+        self.db.execute(text("LOCK TABLE people IN SHARE ROW EXCLUSIVE MODE"))
+        self.reject(
+            "DELETE FROM people_import i USING people p "
+            "WHERE p.phone_number = i.phone_number AND p.email <> i.email "
+            "RETURNING i.line",
+            "Phone number already registered to another subscriber",
+        )
+        columns = ", ".join(self.COLUMNS)
+        updates = ", ".join(
+            [f"{c} = EXCLUDED.{c}" for c in self.COLUMNS if c != "email"]
+            + ["region_id = NULL"]  # re-indexed below
+            + ["updated_at = now()"]  # seen by the other processes' audience indexes
+        )
+        inserted, updated, merged_ids = self.db.execute(
+            text(
+                f"WITH merged AS (INSERT INTO people ({columns}) "
+                f"SELECT {columns} FROM people_import "
+                f"ON CONFLICT (email) DO UPDATE SET {updates} "
+                "RETURNING id, (xmax = 0) AS inserted) "
+                "SELECT count(*) FILTER (WHERE inserted), "
+                "count(*) FILTER (WHERE NOT inserted), array_agg(id) FROM merged"
+            )
+        ).one()
+        self.merged_ids = merged_ids or []
+        RegionIndex.refresh(self.db)
+        return inserted, updated
@@ -0,0 +1,102 @@
+"""
+Renders alert messages per subscriber language
+"""
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import compat32
+from typing import Dict, Tuple, Union
+
+from .sms_encoding import compact
+
+DEFAULT_LANGUAGE = "en"
+
+# fixed wording of the messages; title and description are sent as posted
+TEMPLATES = {
+    "en": {
+        "text": "Severity[{severity}]: {title}\n{description}",
+        "subject": "Alert from Dora: Severity[{severity}]: {title}",
+    },
+    "hi": {
+        "text": "गंभीरता[{severity}]: {title}\n{description}",
+        "subject": "Dora से चेतावनी: गंभीरता[{severity}]: {title}",
+    },
+    "es": {
+        "text": "Gravedad[{severity}]: {title}\n{description}",
+        "subject": "Alerta de Dora: Gravedad[{severity}]: {title}",
+    },
+}
+
+SMTP_POLICY = compat32.clone(linesep="\r\n")
+
+
+def language_of(value) -> str:
+    """
+    Template language for a subscriber's language
+    :param value: stored language, e.g. "en", "EN-us" or None
+    :return: key of TEMPLATES
+    """
+    language = (value or DEFAULT_LANGUAGE).strip().lower()[:2]
+    return language if language in TEMPLATES else DEFAULT_LANGUAGE
+
+
+class MessageRenderer:
+    """
+    Renders the messages of one alert, once per language and channel.
+
+    Texts are cached as strings, shortened to max_segments SMS segments
+    with a link to the full alert. Emails are built into a MIME message once
+    and cached as SMTP ready bytes without a To header, so sending to a
+    recipient only prepends that header.
+    Rendering is idempotent, so concurrent senders may share a renderer.
+    """
+
+    def __init__(self, alert, sender, max_segments=0, link=None):
+        """
+        :param alert: alert create request
+        :param sender: From address of the emails
+        :param max_segments: SMS segments a text may take, 0 for no limit
+        :param link: URL of the full alert, added to shortened texts
+        """
+        self.alert = alert
+        self.sender = sender
+        self.max_segments = max_segments
+        self.link = link
+        self.cache: Dict[Tuple[str, str], Union[str, bytes]] = {}
+
+    def _format(self, language, part) -> str:
+        return TEMPLATES[language][part].format(
+            severity=self.alert.severity,
+            title=self.alert.title,
+            description=self.alert.description,
+        )
+
+    def text(self, language) -> str:
+        """
+        Text alert in a language
+        :param language: subscriber language
+        :return: message
+        """
+        language = language_of(language)
+        key = (language, "text")
+        if key not in self.cache:
+            self.cache[key] = compact(
+                self._format(language, "text"), self.max_segments, self.link
+            )
+        return self.cache[key]
+
+    def email(self, language) -> bytes:
+        """
+        Email alert in a language
+        :param language: subscriber language
+        :return: encoded message without a To header
+        """
+        language = language_of(language)
+        key = (language, "email")
+        if key not in self.cache:
+            message = MIMEMultipart()
+            message["From"] = self.sender
+            message["Subject"] = Header(self._format(language, "subject"), "utf-8")
+            message.attach(MIMEText(self.alert.description, "plain", "utf-8"))
+            self.cache[key] = message.as_bytes(policy=SMTP_POLICY)
+        return self.cache[key]
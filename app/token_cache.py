@@ -0,0 +1,79 @@
+"""
+Cache of verified JWT tokens
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .metrics import metrics
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens and the usernames they carry.
+
+    Tokens are keyed by their SHA-256 digest, so the cache holds no
+    usable credentials. An entry lives for at most ttl seconds and never
+    past the token's own exp claim, so an expired token is always
+    decoded again and rejected.
+    """
+
+    def __init__(self, size=10000, ttl=300.0):
+        """
+        :param size: maximum number of cached tokens
+        :param ttl: maximum seconds a verified token is trusted without decoding
+        """
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # digest -> (username, expires)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token) -> Optional[str]:
+        """
+        Username of a cached token that has not expired
+        :param token: JWT token
+        :return: username, or None on a miss
+        """
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[1] > time.time():
+                self._entries.move_to_end(digest)
+                metrics.inc("dora_token_cache_total", result="hit")
+                return entry[0]
+            if entry:
+                del self._entries[digest]
+        metrics.inc("dora_token_cache_total", result="miss")
+        return None
+
+    def put(self, token, username, exp=None):
+        """
+        Cache a verified token
+        :param token: JWT token
+        :param username: username it carries
+        :param exp: its exp claim as a POSIX timestamp, if any
+        :return: None
+        """
+        expires = time.time() + self.ttl
+        if exp is not None:
+            expires = min(expires, exp)
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (username, expires)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget every cached token
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
@@ -6,9 +6,35 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 
+from .rate_limit import RateLimiter
 from .settings import settings
+from .smtp_pool import SMTPPool
+
+
+def is_retryable_text_error(error) -> bool:
+    """
+    Whether Twilio rejected a message because of rate limits or its own failure
+    :param error: exception raised by a send
+    :return: True if the message can be retried
+    """
+    return isinstance(error, TwilioRestException) and (
+        error.status == 429 or error.status >= 500
+    )
+
+
+def is_retryable_email_error(error) -> bool:
+    """
+    Whether the SMTP server rejected a message only temporarily (4xx),
+    e.g. because of a sending rate limit
+    :param error: exception raised by a send
+    :return: True if the message can be retried
+    """
+    return isinstance(error, smtplib.SMTPResponseException) and (
+        400 <= error.smtp_code < 500
+    )
 
 
 class TwilioClient:
@@ -24,16 +50,47 @@ class TwilioClient:
         self.client = Client(self.settings.TWILIO_SID, self.settings.TWILIO_TOKEN)
         self.email = self.settings.EMAIL
         self.password = self.settings.APP_PASSWORD
+        self.smtp_pool = SMTPPool(
+            self.settings.SMTP_HOST,
+            self.settings.SMTP_PORT,
+            self.email,
+            self.password,
+            size=self.settings.SMTP_POOL_SIZE,
+            idle_timeout=self.settings.SMTP_IDLE_TIMEOUT,
+            starttls=self.settings.SMTP_STARTTLS,
+        )
+        senders = [
+            number.strip()
+            for number in self.settings.TWILIO_SENDER_NUMBERS.split(",")
+            if number.strip()
+        ] or [self.settings.TWILIO_PHONE_NUMBER]
+        self.text_limiter = RateLimiter(
+            "text",
+            {number: self.settings.TEXT_RATE_PER_NUMBER for number in senders},
+            is_retryable_text_error,
+            retries=self.settings.SEND_RETRIES,
+            backoff=self.settings.SEND_BACKOFF,
+        )
+        self.email_limiter = RateLimiter(
+            "email",
+            {self.email: self.settings.EMAIL_RATE},
+            is_retryable_email_error,
+            retries=self.settings.SEND_RETRIES,
+            backoff=self.settings.SEND_BACKOFF,
+        )
 
     def send_text(self, message, to_number):
         """
-        Send SMS to the given number
+        Send SMS to the given number, from the sender number
+        with capacity left under its rate limit
         :param message: Message to send
         :param to_number: Number to send SMS to
         :return: None
         """
-        self.client.messages.create(
-            body=message, from_=self.settings.TWILIO_PHONE_NUMBER, to=str(to_number)
+        self.text_limiter.send(
+            lambda sender: self.client.messages.create(
+                body=message, from_=sender, to=str(to_number)
+            )
         )
 
     def send_email(self, subject, body, to_email):
@@ -49,7 +106,17 @@ class TwilioClient:
         message["To"] = to_email
         message["Subject"] = subject
         message.attach(MIMEText(body, "plain"))
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(self.email, self.password)  # email login
-            server.send_message(message)
+        # reuses an authenticated session, within the account's sending rate
+        self.email_limiter.send(lambda sender: self.smtp_pool.send_message(message))
+
+    def send_encoded_email(self, data, to_email):
+        """
+        Send an email rendered ahead of time, adding only its To header
+        :param data: encoded message without a To header
+        :param to_email: email address to send email to
+        :return: None
+        """
+        data = b"To: " + to_email.encode() + b"\r\n" + data
+        self.email_limiter.send(
+            lambda sender: self.smtp_pool.sendmail(self.email, to_email, data)
+        )
@@ -0,0 +1,106 @@
+"""
+Latency of resolving the recipients of an area alert.
+
+Compares testing every subscriber's coordinates against the area (a
+full scan) with RecipientResolver.within_area, which reads only the
+geocell ranges covering the area and tests points on its boundary.
+Subscribers are spread uniformly over India. Uses a SQLite file by
+default; the people table of a given database URL is dropped and
+recreated, so only point it at a scratch database.
+
+    python -m benchmarks.bench_area [database-url]
+"""
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.geo import Circle, Polygon, geocell
+from app.models import Person
+from app.recipients import RecipientResolver
+from app.schemas import AlertCreateRequest
+
+SIZE = 1_000_000
+BOUNDS = (68.0, 8.0, 97.0, 37.0)  # min longitude, min latitude, max ...
+# a district sized polygon around Pune and a 25 km radius around Mumbai
+AREAS = {
+    "polygon": {
+        "polygon": {
+            "type": "Polygon",
+            "coordinates": [
+                [[73.6, 18.3], [74.2, 18.35], [74.3, 18.8], [73.9, 19.0], [73.6, 18.3]]
+            ],
+        }
+    },
+    "radius": {"latitude": 19.07, "longitude": 72.88, "radius_km": 25},
+}
+
+
+def populate(url):
+    engine = create_engine(url)
+    Person.__table__.drop(engine, checkfirst=True)
+    Person.__table__.create(engine)
+    random.seed(0)
+    with engine.begin() as connection:
+        for start in range(0, SIZE, 50_000):
+            rows = []
+            for i in range(start, min(start + 50_000, SIZE)):
+                latitude = random.uniform(BOUNDS[1], BOUNDS[3])
+                longitude = random.uniform(BOUNDS[0], BOUNDS[2])
+                rows.append(
+                    {
+                        "first_name": "first",
+                        "last_name": "last",
+                        "email": f"user{i}@example.com",
+                        "phone_number": f"+1{i:010d}",
+                        "pin_code": i % 1000,
+                        "city": "city",
+                        "state": "state",
+                        "country": "country",
+                        "latitude": latitude,
+                        "longitude": longitude,
+                        "geocell": geocell(latitude, longitude),
+                    }
+                )
+            connection.execute(insert(Person), rows)
+    return engine
+
+
+def full_scan(db, area):
+    shape = (
+        Polygon(area["polygon"]["coordinates"])
+        if "polygon" in area
+        else Circle(area["latitude"], area["longitude"], area["radius_km"])
+    )
+    rows = db.execute(select(Person.email, Person.latitude, Person.longitude))
+    return sum(1 for row in rows if shape.contains(row.latitude, row.longitude))
+
+
+def covered(db, area):
+    alert = AlertCreateRequest(
+        title="Flood", description="Move to higher ground", severity="high", area=area
+    )
+    return sum(1 for _ in RecipientResolver().within_area(db, alert))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        url = sys.argv[1] if len(sys.argv) > 1 else f"sqlite:///{directory}/people.db"
+        engine = populate(url)
+        for name, area in AREAS.items():
+            for method in (full_scan, covered):
+                with Session(engine) as db:
+                    start = time.perf_counter()
+                    count = method(db, area)
+                    elapsed = time.perf_counter() - start
+                print(
+                    f"{name:<8} {method.__name__:<10} {count:>6} recipients "
+                    f"of {SIZE}: {elapsed * 1000:8.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
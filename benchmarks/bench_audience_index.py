@@ -0,0 +1,108 @@
+"""
+Latency of finding the subscribers targeted by an alert's locations.
+
+Compares the SQL audience query on region_audience with a lookup in the
+in-memory AudienceIndex, and times building the index from the people
+table against loading it from a snapshot. Subscribers are spread over
+20,000 pincodes, 2,000 cities, 29 states and 2 countries. Uses a SQLite
+file.
+
+    python -m benchmarks.bench_audience_index
+"""
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.audience_index import AudienceIndex
+from app.models import Base, Person, Region, RegionAudience
+from app.regions import RegionIndex
+from app.schemas import AlertCreateRequest
+
+SIZE = 500_000
+RUNS = 20
+ALERTS = {
+    "5 pincodes": {"pincodes": [100, 2100, 4100, 6100, 8100]},
+    "3 cities": {"cities": ["city 7", "city 70", "city 700"]},
+    "2 states + 50 pincodes": {
+        "states": ["state 3", "state 4"],
+        "pincodes": list(range(0, 20_000, 400)),
+    },
+    "country": {"countries": ["country 1"]},
+}
+
+
+def populate(engine):
+    Base.metadata.create_all(
+        engine, tables=[Region.__table__, Person.__table__, RegionAudience.__table__]
+    )
+    random.seed(0)
+    with engine.begin() as connection:
+        for start in range(0, SIZE, 50_000):
+            rows = []
+            for i in range(start, min(start + 50_000, SIZE)):
+                pin_code = random.randrange(20_000)
+                rows.append(
+                    {
+                        "first_name": "first",
+                        "last_name": "last",
+                        "email": f"user{i}@example.com",
+                        "phone_number": f"+1{i:010d}",
+                        "pin_code": pin_code,
+                        "city": f"city {pin_code // 10}",
+                        "state": f"state {pin_code // 700}",
+                        "country": f"country {pin_code // 10_000}",
+                    }
+                )
+            connection.execute(insert(Person), rows)
+        # the regions table is still empty, so give SQLite the statistics
+        # of a filled one; otherwise it scans people once per region
+        connection.exec_driver_sql("ANALYZE")
+        connection.exec_driver_sql(
+            "INSERT INTO sqlite_stat1 VALUES "
+            "('regions', 'uix_regions_path', '25000 6000 1 1')"
+        )
+        connection.exec_driver_sql("ANALYZE sqlite_schema")
+        RegionIndex.refresh(connection)
+
+
+def timed(function):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        result = function()
+    return (time.perf_counter() - start) / RUNS * 1000, result
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    populate(engine)
+    snapshot = os.path.join(directory, "index.npz")
+    with Session(engine) as db:
+        start = time.perf_counter()
+        index = AudienceIndex()
+        index.build(db)
+        print(f"build from people: {time.perf_counter() - start:6.2f}s")
+        index.save(snapshot)
+        start = time.perf_counter()
+        AudienceIndex().start(db, snapshot)
+        print(f"load snapshot:     {time.perf_counter() - start:6.2f}s")
+        for name, targets in ALERTS.items():
+            alert = AlertCreateRequest(
+                title="Flood", description="Leave", severity="high", **targets
+            )
+            query = select(Person.id).where(RegionIndex.audience_filter(alert))
+            sql_ms, ids = timed(lambda: db.scalars(query).all())
+            index_ms, found = timed(lambda: index.lookup(alert))
+            assert sorted(ids) == found.tolist()
+            print(
+                f"{name:<24} {len(ids):>7} subscribers  "
+                f"sql {sql_ms:8.2f}ms  index {index_ms:7.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Authentication overhead per request, with and without the token cache.
+
+An integration client reuses one token for every call. Without the
+cache every request decodes the token and verifies its signature.
+
+    python -m benchmarks.bench_auth
+"""
+import timeit
+
+from app.helpers import create_jwt_token, get_user, token_cache
+
+CALLS = 20_000
+
+
+def main():
+    token = create_jwt_token({"username": "integration"})
+
+    def uncached():
+        token_cache.clear()
+        get_user(token)
+
+    def cached():
+        get_user(token)
+
+    for name, call in (("uncached", uncached), ("cached", cached)):
+        elapsed = timeit.timeit(call, number=CALLS)
+        print(f"{name:<9} {elapsed / CALLS * 1e6:8.2f} us per request")
+
+
+if __name__ == "__main__":
+    main()
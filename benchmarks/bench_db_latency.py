@@ -0,0 +1,96 @@
+"""
+Request latency under concurrency with sync and async database sessions.
+
+Serves the same subscriber page from two endpoints: one queries through
+a sync Session inside an async handler, as the routers did before, the
+other awaits an AsyncSession. Concurrent requests are sent in-process
+with httpx and p50/p99 latencies are reported. With the sync session
+every query blocks the event loop, so requests queue behind each other.
+A pg_sleep of a few milliseconds stands in for a remote database.
+Requires the Postgres test database (<DATABASE>_test) configured in .env.
+
+    python -m benchmarks.bench_db_latency [requests] [concurrency]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db_helper import ASYNC_DB_URL, DB_URL, POOL_OPTIONS
+from app.models import Person
+
+DELAY = 0.005  # seconds of simulated database latency per request
+
+engine = create_engine(f"{DB_URL}_test", **POOL_OPTIONS)
+session_local = sessionmaker(bind=engine)
+async_engine = create_async_engine(f"{ASYNC_DB_URL}_test", **POOL_OPTIONS)
+async_session_local = async_sessionmaker(async_engine)
+PAGE = select(Person.id, Person.email).order_by(Person.id).limit(100)
+
+app = FastAPI()
+
+
+def get_db():
+    with session_local() as db:
+        yield db
+
+
+async def get_async_db():
+    async with async_session_local() as db:
+        yield db
+
+
+@app.get("/sync")
+async def sync_page(db: Session = Depends(get_db)):
+    db.execute(select(func.pg_sleep(DELAY)))
+    return [row.email for row in db.execute(PAGE)]
+
+
+@app.get("/async")
+async def async_page(db: AsyncSession = Depends(get_async_db)):
+    await db.execute(select(func.pg_sleep(DELAY)))
+    return [row.email for row in await db.execute(PAGE)]
+
+
+async def load(path, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+
+        async def call():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(call() for _ in range(requests)))
+    return latencies
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    async def run():
+        for path in ("/sync", "/async"):
+            await load(path, concurrency, concurrency)  # warm up the pools
+            latencies = sorted(await load(path, requests, concurrency))
+            p50 = statistics.median(latencies)
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(
+                f"{path:<7} {requests} requests, {concurrency} concurrent: "
+                f"p50 {p50 * 1000:7.1f} ms, p99 {p99 * 1000:7.1f} ms"
+            )
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
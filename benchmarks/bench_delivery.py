@@ -0,0 +1,69 @@
+"""
+Compares the serial send loop with the concurrent delivery engine.
+
+Texts go to a local fake Twilio endpoint and emails to a local fake SMTP
+server, both with a fixed per-message latency. Emails are sent once with a
+new connection per message and once over the SMTP session pool.
+
+    python -m benchmarks.bench_delivery
+"""
+import asyncio
+import smtplib
+import time
+import urllib.request
+from email.mime.text import MIMEText
+
+from app.delivery import DeliveryEngine
+from app.smtp_pool import SMTPPool
+from tests.fakes import FakeSMTPServer, FakeTwilioServer
+
+RECIPIENTS = 200
+LATENCY = 0.01
+
+
+def main():
+    engine = DeliveryEngine({"text": 10, "email": 5})
+    with FakeTwilioServer(LATENCY) as twilio, FakeSMTPServer(LATENCY) as smtp:
+        pool = SMTPPool(smtp.host, smtp.port, "dora", "secret", starttls=False)
+
+        def send_text(number):
+            data = f"Body=test&To={number}".encode()
+            urllib.request.urlopen(f"{twilio.url}/Messages.json", data).read()
+
+        def send_email(address):
+            message = MIMEText("test")
+            message["To"] = address
+            with smtplib.SMTP(smtp.host, smtp.port) as server:
+                server.send_message(message, "dora@example.com")
+
+        def send_pooled_email(address):
+            message = MIMEText("test")
+            message["From"] = "dora@example.com"
+            message["To"] = address
+            pool.send_message(message)
+
+        texts = [f"+1555{i:07d}" for i in range(RECIPIENTS)]
+        emails = [f"user{i}@example.com" for i in range(RECIPIENTS)]
+        for channel, send, recipients in (
+            ("text", send_text, texts),
+            ("email", send_email, emails),
+            ("email", send_pooled_email, emails),
+        ):
+            start = time.perf_counter()
+            for recipient in recipients:
+                send(recipient)
+            serial = time.perf_counter() - start
+
+            start = time.perf_counter()
+            asyncio.run(engine.fan_out(channel, send, recipients))
+            concurrent = time.perf_counter() - start
+            print(
+                f"{send.__name__:<18} {RECIPIENTS} recipients: serial {serial:.2f}s, "
+                f"engine {concurrent:.2f}s ({serial / concurrent:.1f}x)"
+            )
+        pool.close()
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
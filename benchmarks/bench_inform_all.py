@@ -0,0 +1,88 @@
+"""
+Peak memory of resolving the recipients of an inform_all alert.
+
+Compares loading phone numbers and emails with .all() (the previous
+behaviour) with streaming them in chunks through RecipientResolver.
+Each measurement runs in its own process so peak RSS is not shared.
+Uses a SQLite file by default; pass a Postgres URL to measure with
+server-side cursors. The people table of that database is dropped and
+recreated, so only point it at a scratch database.
+
+    python -m benchmarks.bench_inform_all [database-url]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.models import Person
+from app.recipients import RecipientResolver
+
+SIZES = (100_000, 1_000_000)
+
+
+def populate(url, size):
+    engine = create_engine(url)
+    Person.__table__.drop(engine, checkfirst=True)
+    Person.__table__.create(engine)
+    with engine.begin() as connection:
+        for start in range(0, size, 50_000):
+            connection.execute(
+                insert(Person),
+                [
+                    {
+                        "first_name": "first",
+                        "last_name": "last",
+                        "email": f"user{i}@example.com",
+                        "phone_number": f"+1{i:010d}",
+                        "pin_code": i % 1000,
+                        "city": "city",
+                        "state": "state",
+                        "country": "country",
+                    }
+                    for i in range(start, min(start + 50_000, size))
+                ],
+            )
+
+
+def measure(url, mode):
+    engine = create_engine(url)
+    start = time.perf_counter()
+    with Session(engine) as db:
+        if mode == "all":
+            numbers = db.query(Person.phone_number).all()
+            emails = db.query(Person.email).all()
+            count = sum(1 for _ in numbers) + sum(1 for _ in emails)
+        else:
+            count = 0
+            for row in RecipientResolver().everyone(db):
+                count += 2
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{mode:<7} {count // 2:>8} subscribers: {peak:7.1f} MB peak RSS, {elapsed:.2f}s"
+    )
+
+
+def main():
+    if len(sys.argv) == 3:  # child process
+        return measure(sys.argv[1], sys.argv[2])
+    with tempfile.TemporaryDirectory() as directory:
+        url = sys.argv[1] if len(sys.argv) > 1 else f"sqlite:///{directory}/people.db"
+        for size in SIZES:
+            populate(url, size)
+            for mode in ("all", "stream"):
+                subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_inform_all", url, mode],
+                    check=True,
+                    env=os.environ,
+                )
+
+
+if __name__ == "__main__":
+    main()
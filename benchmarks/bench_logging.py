@@ -0,0 +1,76 @@
+"""
+Cost of per-recipient logging to the code that sends the alerts.
+
+Logs one line for each of 100,000 recipients and times the calling
+thread, comparing a synchronous colorized StreamHandler (the handler
+every Logger used to write with) to the queue handler, sampled with a
+LogSampler, and below the configured level. Output goes to a temporary
+file in place of stderr.
+
+    python -m benchmarks.bench_logging
+"""
+import logging
+import tempfile
+import time
+from types import SimpleNamespace
+
+from app.logger import FORMATTERS, Logger, LogSampler, configure_logging, flush_logs
+
+RECIPIENTS = [
+    SimpleNamespace(email=f"user{i}@example.com", phone_number=f"+1{i:010d}")
+    for i in range(100_000)
+]
+
+
+def synchronous(stream):
+    logger = logging.Logger("bench.sync")
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(FORMATTERS["text"])
+    logger.addHandler(handler)
+    for recipient in RECIPIENTS:
+        logger.info(f"Sending alert to {recipient.email}, {recipient.phone_number}")
+
+
+def queued(logger):
+    for recipient in RECIPIENTS:
+        logger.info("Sending alert to %s, %s", recipient.email, recipient.phone_number)
+
+
+def sampled(logger):
+    sampler = LogSampler(logger)
+    for recipient in RECIPIENTS:
+        sampler.log(
+            "text", "Sending alert to %s, %s", recipient.email, recipient.phone_number
+        )
+    sampler.summary()
+
+
+def below_level(logger):
+    for recipient in RECIPIENTS:
+        logger.debug("Sending alert to %s, %s", recipient.email, recipient.phone_number)
+
+
+def timed(name, function, *args):
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<22} {elapsed * 1000:8.1f}ms  "
+        f"{elapsed / len(RECIPIENTS) * 1e6:6.2f}µs per recipient"
+    )
+
+
+def main():
+    with tempfile.TemporaryFile("w") as stream:
+        configure_logging("INFO", "text", stream)
+        logger = Logger("bench.queue")
+        timed("synchronous handler", synchronous, stream)
+        timed("queue handler", queued, logger)
+        flush_logs()  # keep the listener's backlog out of the next timings
+        timed("queue handler, sampled", sampled, logger)
+        timed("below level", below_level, logger)
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Concurrent logins: throughput and event loop stalls.
+
+Runs a burst of concurrent password verifications the way the login
+handler does, either inline on the event loop (the previous behaviour)
+or through PasswordHasher's thread pool. A ticker task measures how long
+the event loop is blocked, i.e. how late other requests would be served.
+Threads only add throughput with more than one core.
+
+    python -m benchmarks.bench_login [logins] [rounds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from app.passwords import PasswordHasher
+
+
+async def ticker(stalls, interval=0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def burst(hasher, hashed, logins, inline):
+    async def login():
+        if inline:
+            return hasher.context.verify_and_update("secret", hashed)
+        return await hasher.verify("secret", hashed)
+
+    stalls = []
+    tick = asyncio.create_task(ticker(stalls))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)  # let the ticker record a stall still in progress
+    tick.cancel()
+    return elapsed, max(stalls, default=0)
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    hasher = PasswordHasher(rounds, workers=os.cpu_count(), max_pending=logins)
+    hashed = hasher.context.hash("secret")
+    print(f"{logins} logins, cost {rounds}, {os.cpu_count()} cores")
+    for mode in ("inline", "pool"):
+        elapsed, stall = asyncio.run(burst(hasher, hashed, logins, mode == "inline"))
+        print(
+            f"{mode:<7} {logins / elapsed:7.1f} logins/s, "
+            f"longest event loop stall {stall * 1000:8.1f} ms"
+        )
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
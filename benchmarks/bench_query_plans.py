@@ -0,0 +1,98 @@
+"""
+Checks that audience resolution and GET /alerts use their indexes at 1M rows.
+
+Fills the people and alerts tables of the Postgres test database
+(<DATABASE>_test, dropped and recreated) with generated rows, then prints
+the plan and execution time of each query with and without the indexes.
+
+    python -m benchmarks.bench_query_plans
+"""
+import datetime
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.db_helper import DB_URL
+from app.models import Alert, Person
+from app.recipients import RecipientResolver
+from app.schemas import AlertCreateRequest
+
+ROWS = 1_000_000
+engine = create_engine(f"{DB_URL}_test")
+
+
+def populate(connection):
+    for table in (Person.__table__, Alert.__table__):
+        table.drop(connection, checkfirst=True)
+        table.create(connection)
+    connection.execute(
+        text(
+            "INSERT INTO people (first_name, last_name, email, phone_number, language, "
+            "pin_code, city, state, country) "
+            "SELECT 'first', 'last', 'user' || i || '@example.com', '+1' || i, 'en', "
+            "i % 20000, 'city' || i % 2000, 'state' || i % 50, 'country' || i % 5 "
+            "FROM generate_series(1, :rows) AS i"
+        ),
+        {"rows": ROWS},
+    )
+    connection.execute(
+        text(
+            "INSERT INTO alerts (title, description, severity, created_at) "
+            "SELECT 'alert ' || i, 'benchmark', 'low', now() - i * interval '1 minute' "
+            "FROM generate_series(1, :rows) AS i"
+        ),
+        {"rows": ROWS},
+    )
+    connection.execute(text("ANALYZE people, alerts"))
+
+
+def queries():
+    alert = AlertCreateRequest(
+        title="Flood",
+        description="benchmark",
+        severity="high",
+        cities=["city7", "city8"],
+        pincodes=[42],
+    )
+    now = datetime.datetime.now()
+    since = now - datetime.timedelta(days=1)
+    yield "audience", RecipientResolver().audience_query({0: alert})
+    yield "alerts", (  # first page of GET /alerts
+        select(Alert)
+        .where(Alert.created_at.between(since, now))
+        .order_by(Alert.id.desc())
+        .limit(101)
+    )
+
+
+def explain(connection, query):
+    sql = query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    return [row[0] for row in connection.execute(text(f"EXPLAIN ANALYZE {sql}"))]
+
+
+def main():
+    with engine.begin() as connection:
+        populate(connection)
+    for indexed in (False, True):
+        with engine.begin() as connection:
+            for index in (*Person.__table__.indexes, *Alert.__table__.indexes):
+                if index.name.startswith("ix_") and not index.unique:
+                    if indexed:
+                        index.create(connection, checkfirst=True)
+                    else:
+                        index.drop(connection, checkfirst=True)
+            connection.execute(text("ANALYZE people, alerts"))
+            for name, query in queries():
+                plan = explain(connection, query)
+                uses_index = any("Index" in line for line in plan)
+                print(
+                    f"--- {name}, indexes {'on' if indexed else 'off'}: "
+                    f"index used: {uses_index}, {plan[-1].strip()}"
+                )
+                print("\n".join(plan))
+
+
+if __name__ == "__main__":
+    main()
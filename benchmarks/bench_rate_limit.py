@@ -0,0 +1,61 @@
+"""
+SMS throughput against a provider that enforces a per-number rate limit.
+
+The local fake Twilio endpoint accepts RATE messages per second from each
+sender number and answers 429 beyond that. Messages are sent through the
+delivery engine once directly from a single number (the previous
+behaviour, where rejected messages are lost) and once through the rate
+limiter spread over several sender numbers.
+
+    python -m benchmarks.bench_rate_limit
+"""
+import asyncio
+import time
+
+from twilio.rest import Client
+
+from app.delivery import DeliveryEngine
+from app.rate_limit import RateLimiter
+from app.twilio_client import is_retryable_text_error
+from tests.fakes import FakeTwilioServer
+
+RECIPIENTS = 300
+RATE = 10  # accepted messages per second and sender number
+NUMBERS = ["+15550000001", "+15550000002", "+15550000003"]
+
+
+def main():
+    engine = DeliveryEngine({"text": 10})
+    for mode in ("unlimited", "limited"):
+        with FakeTwilioServer(latency=0.01, rate_limit=RATE) as twilio:
+            client = Client("ACxxx", "token")
+            client.api.base_url = twilio.url
+            limiter = RateLimiter(
+                "text", {number: RATE for number in NUMBERS}, is_retryable_text_error
+            )
+
+            def send(number):
+                if mode == "unlimited":
+                    return client.messages.create(
+                        body="test", from_=NUMBERS[0], to=number
+                    )
+                return limiter.send(
+                    lambda sender: client.messages.create(
+                        body="test", from_=sender, to=number
+                    )
+                )
+
+            recipients = [f"+1555{i:07d}" for i in range(RECIPIENTS)]
+            start = time.perf_counter()
+            report = asyncio.run(engine.fan_out("text", send, recipients))
+            elapsed = time.perf_counter() - start
+            print(
+                f"{mode:<9} {report.sent:>4} delivered, {len(report.failed):>4} lost, "
+                f"{twilio.rejected:>4} 429s in {elapsed:5.2f}s "
+                f"({report.sent / elapsed:5.1f} delivered/s)"
+            )
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
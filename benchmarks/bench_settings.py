@@ -0,0 +1,24 @@
+"""
+Cost of reading the settings on a hot path.
+
+Compares building Settings() on every call (the previous behaviour,
+which re-reads and re-validates .env each time) with the cached
+settings() provider.
+
+    python -m benchmarks.bench_settings
+"""
+import timeit
+
+from app.settings import Settings, settings
+
+CALLS = 2_000
+
+
+def main():
+    for name, read in (("Settings()", Settings), ("settings()", settings)):
+        elapsed = timeit.timeit(lambda: read().SEND_TEXTS, number=CALLS)
+        print(f"{name:<11} {elapsed / CALLS * 1e6:9.2f} us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares the per-number SMS backend with the bulk Twilio Notify backend.
+
+Both send the same text to every recipient through the delivery engine and
+the Twilio client, against a local fake Twilio endpoint with a fixed
+latency per request. Reports the requests made per recipient and the total
+dispatch time.
+
+    python -m benchmarks.bench_sms
+"""
+import asyncio
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from twilio.rest import Client
+
+from app.delivery import BatchSend, DeliveryEngine
+from app.settings import settings
+from app.sms import NotifySMS
+from tests.fakes import FakeTwilioServer
+
+RECIPIENTS = 5000
+LATENCY = 0.02
+CONCURRENCY = 10
+BATCH_SIZE = 1000
+
+
+def per_number(client, message, batch):
+    for number in batch:
+        client.messages.create(body=message, from_="+15550000000", to=number)
+
+
+def main():
+    numbers = [f"+1555{i:07d}" for i in range(RECIPIENTS)]
+    engine = DeliveryEngine({"text": CONCURRENCY})
+    for backend in ("twilio", "notify"):
+        with FakeTwilioServer(LATENCY) as twilio:
+            client = Client("ACxxx", "token")
+            client.api.base_url = client.notify.base_url = twilio.url
+            if backend == "notify":
+                twilio_client = SimpleNamespace(settings=settings(), client=client)
+                channel = NotifySMS(twilio_client, "ISxxx", BATCH_SIZE, rate=100)
+                send = BatchSend(partial(channel.send, "test"), BATCH_SIZE)
+            else:
+                send = BatchSend(partial(per_number, client, "test"), 1)
+            start = time.perf_counter()
+            report = asyncio.run(engine.fan_out("text", send, numbers))
+            elapsed = time.perf_counter() - start
+            print(
+                f"{backend:<6} {report.sent} texts in {elapsed:6.2f}s, "
+                f"{twilio.requests:>5} requests "
+                f"({twilio.requests / twilio.recipients:.4f} per recipient)"
+            )
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
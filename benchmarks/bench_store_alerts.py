@@ -0,0 +1,123 @@
+"""
+Compares per-alert storage with the batched store_alerts path.
+
+Counts statements and commits (database round trips) and wall time for
+batches of 1, 100 and 10k alerts. Requires the Postgres test database
+(<DATABASE>_test) configured in .env.
+
+    python -m benchmarks.bench_store_alerts
+"""
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import create_engine, delete, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import models
+from app.db_helper import ASYNC_DB_URL, DB_URL
+from app.models import Alert
+from app.routers.alerts import DoraAlert
+from app.schemas import AlertsCreateRequest
+
+engine = create_engine(f"{DB_URL}_test")
+session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# every measurement runs in its own event loop, so connections are not pooled
+async_engine = create_async_engine(f"{ASYNC_DB_URL}_test", poolclass=NullPool)
+round_trips = 0
+
+
+def count_round_trip(*args):
+    global round_trips
+    round_trips += 1
+
+
+for engine_ in (engine, async_engine.sync_engine):
+    event.listen(engine_, "before_cursor_execute", count_round_trip)
+    event.listen(engine_, "commit", count_round_trip)
+
+
+def store_one_by_one(request, db):
+    """
+    The previous implementation: SELECT, INSERT, COMMIT and REFRESH per alert
+    """
+    response = []
+    for alert in request.alerts:
+        if existing := (
+            db.query(Alert)
+            .filter_by(
+                title=alert.title,
+                description=alert.description,
+                severity=alert.severity,
+            )
+            .first()
+        ):
+            response.append(existing)
+            continue
+        alert_ = Alert(
+            title=alert.title, description=alert.description, severity=alert.severity
+        )
+        db.add(alert_)
+        db.commit()
+        db.refresh(alert_)
+        response.append(alert_)
+    return response
+
+
+def batched(request, db):
+    """
+    The current implementation, on an async session
+    """
+
+    async def store():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await DoraAlert().store_alerts(request, session)
+
+    return asyncio.run(store())
+
+
+def make_request(size):
+    prefix = f"bench-{uuid.uuid4()}"
+    return AlertsCreateRequest(
+        alerts=[
+            {
+                "title": f"{prefix}-{i}",
+                "description": "benchmark",
+                "severity": "low",
+                "inform_all": True,
+            }
+            for i in range(size)
+        ]
+    )
+
+
+def measure(store, size):
+    global round_trips
+    db = session_local()
+    try:
+        round_trips = 0
+        request = make_request(size)
+        start = time.perf_counter()
+        store(request, db)
+        return round_trips, time.perf_counter() - start
+    finally:
+        db.execute(delete(Alert).where(Alert.description == "benchmark"))
+        db.commit()
+        db.close()
+
+
+def main():
+    models.Base.metadata.create_all(bind=engine)
+    for size in (1, 100, 10_000):
+        old_trips, old_time = measure(store_one_by_one, size)
+        new_trips, new_time = measure(batched, size)
+        print(
+            f"{size:>6} alerts: per-alert {old_trips} round trips {old_time:.2f}s, "
+            f"batched {new_trips} round trips {new_time:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
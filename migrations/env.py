@@ -6,6 +6,7 @@ from sqlalchemy import engine_from_config, pool
 from app.models import Base
 from app.settings import settings
 
+settings = settings()
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
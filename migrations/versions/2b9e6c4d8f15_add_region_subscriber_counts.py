@@ -0,0 +1,35 @@
+"""Add region subscriber counts
+
+Audience previews read the number of subscribers under each targeted
+region instead of counting people. The counts are backfilled from the
+region audience and kept up to date when subscribers are indexed.
+
+Revision ID: 2b9e6c4d8f15
+Revises: 7a2f94c0d1b3
+Create Date: 2026-10-18 15:32:54.208113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2b9e6c4d8f15"
+down_revision = "7a2f94c0d1b3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "regions",
+        sa.Column("subscribers", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        "UPDATE regions SET subscribers = counts.subscribers FROM "
+        "(SELECT region_id, count(*) AS subscribers FROM region_audience "
+        "GROUP BY region_id) AS counts WHERE counts.region_id = regions.id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("regions", "subscribers")
@@ -0,0 +1,127 @@
+"""Create schema
+
+Tables used to be created by create_all at startup, so existing
+databases may already have some of them; only missing tables are created.
+
+Revision ID: 45e1fe52c5c0
+Revises: 8e551baa8c88
+Create Date: 2026-10-18 10:12:43.519204
+
+"""
+import sqlalchemy as sa
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision = "45e1fe52c5c0"
+down_revision = "8e551baa8c88"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = (
+        []  # offline (--sql) mode has no database to inspect
+        if context.is_offline_mode()
+        else sa.inspect(op.get_bind()).get_table_names()
+    )
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("username", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("first_name", sa.String(), nullable=False),
+            sa.Column("last_name", sa.String(), nullable=False),
+            sa.Column("password", sa.String(), nullable=False),
+            sa.Column(
+                "created_at",
+                sa.TIMESTAMP(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_users_id"), "users", ["id"])
+        op.create_index(op.f("ix_users_username"), "users", ["username"], unique=True)
+        op.create_index(op.f("ix_users_email"), "users", ["email"], unique=True)
+    if "people" not in existing:
+        op.create_table(
+            "people",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("first_name", sa.String(), nullable=False),
+            sa.Column("last_name", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("phone_number", sa.String(), nullable=False),
+            sa.Column("language", sa.String(), nullable=True),
+            sa.Column("pin_code", sa.Integer(), nullable=False),
+            sa.Column("city", sa.String(), nullable=False),
+            sa.Column("state", sa.String(), nullable=False),
+            sa.Column("country", sa.String(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_people_id"), "people", ["id"])
+        op.create_index(op.f("ix_people_email"), "people", ["email"], unique=True)
+        op.create_index(
+            op.f("ix_people_phone_number"), "people", ["phone_number"], unique=True
+        )
+    if "regions" not in existing:
+        op.create_table(
+            "regions",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("geocode", sa.String(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_regions_id"), "regions", ["id"])
+    if "alerts" not in existing:
+        op.create_table(
+            "alerts",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("title", sa.String(), nullable=True),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("severity", sa.String(), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.TIMESTAMP(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("title", "description", "severity", name="uix_1"),
+        )
+    if "alert_jobs" not in existing:
+        op.create_table(
+            "alert_jobs",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("payload", sa.JSON(), nullable=False),
+            sa.Column("requested_by", sa.String(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("queued", sa.Integer(), nullable=False),
+            sa.Column("sent", sa.Integer(), nullable=False),
+            sa.Column("failed", sa.Integer(), nullable=False),
+            sa.Column("retried", sa.Integer(), nullable=False),
+            sa.Column("error", sa.String(), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.TIMESTAMP(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "updated_at",
+                sa.TIMESTAMP(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_alert_jobs_status"), "alert_jobs", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_table("alert_jobs")
+    op.drop_table("alerts")
+    op.drop_table("regions")
+    op.drop_table("people")
+    op.drop_table("users")
@@ -0,0 +1,28 @@
+"""Add alert job priority
+
+Jobs are claimed by priority, the highest severity among their alerts.
+
+Revision ID: 5d81f0b3a6e4
+Revises: c3a7d51e2f08
+Create Date: 2026-10-18 13:20:41.118305
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d81f0b3a6e4"
+down_revision = "c3a7d51e2f08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "alert_jobs",
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("alert_jobs", "priority")
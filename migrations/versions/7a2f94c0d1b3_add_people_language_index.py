@@ -0,0 +1,36 @@
+"""Add people language index
+
+Alerts to every subscriber stream people grouped by language, so each
+message variant is sent in a row. Built concurrently so people stays
+writable.
+
+Revision ID: 7a2f94c0d1b3
+Revises: e84c2b6f1a97
+Create Date: 2026-10-18 14:48:33.917042
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7a2f94c0d1b3"
+down_revision = "e84c2b6f1a97"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_people_language",
+            "people",
+            ["language", "id"],
+            postgresql_include=["email", "phone_number"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_people_language", table_name="people", postgresql_concurrently=True
+        )
@@ -0,0 +1,133 @@
+"""Add region hierarchy and audience index
+
+Regions become a pincode -> city -> state -> country hierarchy, people
+point at their pincode region and region_audience lists every
+subscriber under every region of its path. Existing subscribers are
+indexed during the upgrade.
+
+Revision ID: 9162d0f73a35
+Revises: bd526ef679fd
+Create Date: 2026-10-18 11:04:52.830117
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9162d0f73a35"
+down_revision = "bd526ef679fd"
+branch_labels = None
+depends_on = None
+
+# the hierarchy and key normalization as of this revision, from the top
+# down: (region kind, subscriber column)
+LEVELS = [
+    ("country", "country"),
+    ("state", "state"),
+    ("city", "city"),
+    ("pincode", "pin_code"),
+]
+
+
+def _key(column):
+    return f"lower(trim(CAST(p.{column} AS VARCHAR)))"
+
+
+def _path(depth):
+    # joins matching the regions r0 .. r{depth - 1} on the path of subscriber p
+    joins = []
+    for level, (kind, column) in enumerate(LEVELS[:depth]):
+        parent = (
+            f"r{level}.parent_id = r{level - 1}.id" if level else "r0.parent_id IS NULL"
+        )
+        joins.append(
+            f"JOIN regions r{level} ON r{level}.kind = '{kind}' "
+            f"AND r{level}.key = {_key(column)} AND {parent}"
+        )
+    return " ".join(joins)
+
+
+def _index_subscribers():
+    """
+    Create the regions of every subscriber level by level, list them in
+    region_audience and link them to their pincode region
+    """
+    for depth, (kind, column) in enumerate(LEVELS):
+        parent = f"r{depth - 1}.id" if depth else "NULL"
+        group = f"{_key(column)}, {parent}" if depth else _key(column)
+        op.execute(
+            "INSERT INTO regions (kind, key, name, parent_id) "
+            f"SELECT '{kind}', {_key(column)}, "
+            f"min(trim(CAST(p.{column} AS VARCHAR))), {parent} "
+            f"FROM people p {_path(depth)} WHERE p.region_id IS NULL "
+            f"GROUP BY {group} "
+            "ON CONFLICT (kind, key, (coalesce(parent_id, 0))) DO NOTHING"
+        )
+    audience = " UNION ALL ".join(
+        f"SELECT r{level}.id, p.id FROM people p {_path(len(LEVELS))} "
+        "WHERE p.region_id IS NULL"
+        for level in range(len(LEVELS))
+    )
+    op.execute(
+        "INSERT INTO region_audience (region_id, person_id) "
+        f"{audience} ON CONFLICT DO NOTHING"
+    )
+    op.execute(
+        f"UPDATE people SET region_id = (SELECT r{len(LEVELS) - 1}.id "
+        f"FROM people p {_path(len(LEVELS))} WHERE p.id = people.id) "
+        "WHERE region_id IS NULL"
+    )
+
+
+def upgrade() -> None:
+    op.add_column("regions", sa.Column("kind", sa.String(), nullable=True))
+    op.add_column("regions", sa.Column("key", sa.String(), nullable=True))
+    op.add_column("regions", sa.Column("parent_id", sa.Integer(), nullable=True))
+    # regions were unused so far; keep any existing rows out of the hierarchy
+    op.execute("UPDATE regions SET kind = 'legacy', key = CAST(id AS VARCHAR)")
+    op.alter_column("regions", "kind", nullable=False)
+    op.alter_column("regions", "key", nullable=False)
+    op.alter_column("regions", "geocode", nullable=True)
+    op.create_foreign_key(
+        "regions_parent_id_fkey", "regions", "regions", ["parent_id"], ["id"]
+    )
+    op.create_index(
+        "uix_regions_path",
+        "regions",
+        ["kind", "key", sa.text("coalesce(parent_id, 0)")],
+        unique=True,
+    )
+    op.add_column("people", sa.Column("region_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "people_region_id_fkey", "people", "regions", ["region_id"], ["id"]
+    )
+    op.create_index(
+        "ix_people_unindexed",
+        "people",
+        ["id"],
+        postgresql_where=sa.text("region_id IS NULL"),
+    )
+    op.create_table(
+        "region_audience",
+        sa.Column("region_id", sa.Integer(), nullable=False),
+        sa.Column("person_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["region_id"], ["regions.id"]),
+        sa.ForeignKeyConstraint(["person_id"], ["people.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("region_id", "person_id"),
+    )
+    op.create_index("ix_region_audience_person_id", "region_audience", ["person_id"])
+    _index_subscribers()
+
+
+def downgrade() -> None:
+    op.drop_table("region_audience")
+    op.drop_index("ix_people_unindexed", table_name="people")
+    op.drop_constraint("people_region_id_fkey", "people", type_="foreignkey")
+    op.drop_column("people", "region_id")
+    op.drop_index("uix_regions_path", table_name="regions")
+    op.drop_constraint("regions_parent_id_fkey", "regions", type_="foreignkey")
+    op.execute("DELETE FROM regions WHERE kind <> 'legacy'")
+    op.alter_column("regions", "geocode", nullable=False)
+    op.drop_column("regions", "parent_id")
+    op.drop_column("regions", "key")
+    op.drop_column("regions", "kind")
@@ -0,0 +1,50 @@
+"""Add location and alert date indexes
+
+Audience resolution filters people by pin_code, city, state and country
+and only reads email and phone_number, so those are included in each
+location index for index-only scans. GET /alerts scans created_at by range.
+Indexes are built concurrently so the tables stay writable.
+
+Revision ID: bd526ef679fd
+Revises: 45e1fe52c5c0
+Create Date: 2026-10-18 10:31:07.284611
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "bd526ef679fd"
+down_revision = "45e1fe52c5c0"
+branch_labels = None
+depends_on = None
+
+LOCATIONS = ["pin_code", "city", "state", "country"]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in LOCATIONS:
+            op.create_index(
+                f"ix_people_{column}",
+                "people",
+                [column],
+                postgresql_include=["email", "phone_number"],
+                postgresql_concurrently=True,
+            )
+        op.create_index(
+            "ix_alerts_created_at",
+            "alerts",
+            ["created_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_alerts_created_at", table_name="alerts", postgresql_concurrently=True
+        )
+        for column in LOCATIONS:
+            op.drop_index(
+                f"ix_people_{column}", table_name="people", postgresql_concurrently=True
+            )
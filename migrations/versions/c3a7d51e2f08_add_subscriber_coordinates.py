@@ -0,0 +1,38 @@
+"""Add subscriber coordinates and the geocell index
+
+People get a latitude, a longitude and their geocell, the Z-order code
+of the coordinates that area alerts look up by range.
+
+Revision ID: c3a7d51e2f08
+Revises: 9162d0f73a35
+Create Date: 2026-10-18 11:52:16.402938
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3a7d51e2f08"
+down_revision = "9162d0f73a35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("people", sa.Column("latitude", sa.Float(), nullable=True))
+    op.add_column("people", sa.Column("longitude", sa.Float(), nullable=True))
+    op.add_column("people", sa.Column("geocell", sa.BigInteger(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_people_geocell", "people", ["geocell"], postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_people_geocell", table_name="people", postgresql_concurrently=True
+        )
+    op.drop_column("people", "geocell")
+    op.drop_column("people", "longitude")
+    op.drop_column("people", "latitude")
@@ -0,0 +1,51 @@
+"""Add deliveries
+
+Records the outcome of every send so retried alerts only reach the
+recipients that did not get them yet.
+
+Revision ID: e84c2b6f1a97
+Revises: 5d81f0b3a6e4
+Create Date: 2026-10-18 14:05:12.604371
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e84c2b6f1a97"
+down_revision = "5d81f0b3a6e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "deliveries",
+        sa.Column("alert_id", sa.Integer(), sa.ForeignKey("alerts.id"), nullable=False),
+        sa.Column("channel", sa.String(), nullable=False),
+        sa.Column(
+            "person_id",
+            sa.Integer(),
+            sa.ForeignKey("people.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+        sa.PrimaryKeyConstraint("alert_id", "channel", "person_id"),
+    )
+    op.create_index(
+        "ix_deliveries_status", "deliveries", ["alert_id", "channel", "status"]
+    )
+    op.create_index("ix_deliveries_person_id", "deliveries", ["person_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_deliveries_person_id", table_name="deliveries")
+    op.drop_index("ix_deliveries_status", table_name="deliveries")
+    op.drop_table("deliveries")
@@ -0,0 +1,45 @@
+"""Add people updated_at
+
+The audience index of every process reads the subscribers updated since
+its last lookup, e.g. moved by an import in another process.
+
+Revision ID: f1c8e27a4d53
+Revises: 2b9e6c4d8f15
+Create Date: 2026-10-18 16:20:41.508317
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f1c8e27a4d53"
+down_revision = "2b9e6c4d8f15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "people",
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_people_updated_at",
+            "people",
+            ["updated_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_people_updated_at", table_name="people", postgresql_concurrently=True
+        )
+    op.drop_column("people", "updated_at")
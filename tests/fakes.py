@@ -0,0 +1,163 @@
+"""
+Local stand-ins for the Twilio REST API and an SMTP server.
+Used by tests and benchmarks so nothing leaves the machine.
+"""
+import json
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeTwilioServer:
+    """
+    Accepts Twilio style message creation requests, and Notify
+    notifications to a list of SMS bindings, after a fixed latency.
+    With a rate limit, requests beyond rate_limit per second from one
+    sender number (or Notify service) are rejected with 429 like Twilio's
+    queue overflow.
+    """
+
+    def __init__(self, latency=0.01, rate_limit=None):
+        """
+        :param latency: seconds to wait before answering each request
+        :param rate_limit: messages per second accepted per From number
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.recipients = 0  # numbers accepted requests were addressed to
+        self.rejected = 0
+        self.sent = Counter()  # From number -> accepted messages
+        self.buckets = {}  # From number -> (tokens, updated)
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                if self.path.endswith("/Notifications"):
+                    sender = self.path.split("/")[-2]  # notify service sid
+                    recipients = len(form.get("ToBinding", []))
+                else:
+                    sender = form.get("From", [""])[0]
+                    recipients = 1
+                with fake.lock:
+                    fake.requests += 1
+                    accepted = fake.take(sender)
+                    if accepted:
+                        fake.sent[sender] += 1
+                        fake.recipients += recipients
+                    else:
+                        fake.rejected += 1
+                time.sleep(fake.latency)
+                if accepted:
+                    status, payload = 201, {"sid": f"SM{fake.requests}"}
+                else:
+                    status = 429
+                    payload = {"code": 20429, "message": "Too Many Requests"}
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def take(self, sender) -> bool:
+        """
+        Take a token from the sender's bucket, holding the lock
+        :param sender: From number
+        :return: whether the message is within the rate limit
+        """
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(sender, (self.rate_limit, now))
+        tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit)
+        self.buckets[sender] = (tokens - 1 if tokens >= 1 else tokens, now)
+        return tokens >= 1
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeSMTPServer:
+    """
+    Minimal plaintext SMTP server that accepts every message
+    """
+
+    def __init__(self, latency=0.0, refused=()):
+        """
+        :param latency: seconds to wait before accepting each message
+        :param refused: recipient addresses rejected with a 550
+        """
+        self.latency = latency
+        self.refused = set(refused)
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                with fake.lock:
+                    fake.connections += 1
+                self.reply("220 fake ESMTP")
+                while line := self.rfile.readline():
+                    command = line.decode().strip().upper()
+                    if command.startswith(("EHLO", "HELO")):
+                        self.reply("250-fake")
+                        self.reply("250 AUTH PLAIN LOGIN")
+                    elif command.startswith("AUTH"):
+                        with fake.lock:
+                            fake.logins += 1
+                        self.reply("235 Authenticated")
+                    elif command.startswith("DATA"):
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = []
+                        while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                            data.append(chunk)
+                        time.sleep(fake.latency)
+                        with fake.lock:
+                            fake.messages.append(b"".join(data))
+                        self.reply("250 OK")
+                    elif command.startswith("QUIT"):
+                        self.reply("221 Bye")
+                        return
+                    elif command.startswith("RCPT") and any(
+                        address.upper() in command for address in fake.refused
+                    ):
+                        self.reply("550 No such user")
+                    else:  # MAIL, RCPT, RSET, NOOP
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,183 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.models import Base, Person, Region, RegionAudience
+from app.recipients import RecipientResolver
+from app.regions import RegionIndex
+from app.schemas import AlertCreateRequest
+
+np = pytest.importorskip("numpy")
+
+from app.audience_index import AudienceIndex  # noqa: E402
+
+PLACES = [
+    (411001, "Pune", "Maharashtra", "India"),
+    (411002, "Pune", "Maharashtra", "India"),
+    (400001, "Mumbai", "Maharashtra", "India"),
+    (560001, "Bengaluru", "Karnataka", "India"),
+    (94103, "San Francisco", "California", "USA"),
+]
+RARE_PLACE = (10001, "New York", "New York", "USA")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine, tables=[Region.__table__, Person.__table__, RegionAudience.__table__]
+    )
+    rng = random.Random(7)
+    with Session(engine) as session:
+        for i in range(500):
+            pin_code, city, state, country = (
+                RARE_PLACE if i % 100 == 0 else rng.choice(PLACES)
+            )
+            session.add(
+                Person(
+                    first_name="first",
+                    last_name="last",
+                    email=f"{i}@example.com",
+                    phone_number=f"+1{i:05d}",
+                    pin_code=pin_code,
+                    city=city,
+                    state=state,
+                    country=country,
+                )
+            )
+        session.flush()
+        RegionIndex.refresh(session)
+        session.commit()
+        yield session
+
+
+def make_alert(**targets):
+    return AlertCreateRequest(
+        title="Flood", description="Move to higher ground", severity="high", **targets
+    )
+
+
+ALERTS = [
+    make_alert(cities=["Pune"]),
+    make_alert(cities=[" MUMBAI"], pincodes=[411001, 94103]),
+    make_alert(states=["Maharashtra", "Karnataka"], cities=["Pune"]),
+    make_alert(countries=["India"], pincodes=[94103]),
+    make_alert(cities=["New York", "Pune"], pincodes=[10001]),
+    make_alert(countries=["USA"]),
+    make_alert(cities=["Atlantis"]),
+]
+
+
+def audience(db, alert):
+    return sorted(
+        db.scalars(select(Person.id).where(RegionIndex.audience_filter(alert)))
+    )
+
+
+@pytest.mark.parametrize("alert", ALERTS)
+def test_lookup_matches_sql_targeting(db, alert):
+    """
+    Test that the index finds the subscribers the SQL audience query finds,
+    through both its sparse and dense containers
+    :return: None
+    """
+    index = AudienceIndex()
+    index.build(db)
+    assert index.sets[("country", "india")].dtype == np.uint8  # dense
+    assert index.sets[("pincode", "10001")].dtype == np.uint32  # sparse
+    assert index.lookup(alert).tolist() == audience(db, alert)
+
+
+def test_hooks_keep_index_in_sync(db):
+    """
+    Test that subscribing, moving and unsubscribing update the index
+    :return: None
+    """
+    index = AudienceIndex()
+    index.build(db)
+    pune = make_alert(cities=["Pune"])
+    newcomer = SimpleNamespace(
+        id=1000, pin_code=411001, city="Pune", state="Maharashtra", country="India"
+    )
+    index.subscribe(newcomer)
+    assert 1000 in index.lookup(pune)
+    assert 1000 in index.lookup(make_alert(countries=["India"]))
+    newcomer.pin_code, newcomer.city = 400001, "Mumbai"
+    index.subscribe(newcomer)
+    assert 1000 not in index.lookup(pune)
+    assert 1000 in index.lookup(make_alert(cities=["Mumbai"]))
+    index.unsubscribe(1000)
+    assert 1000 not in index.lookup(make_alert(countries=["India"]))
+
+
+def test_catch_up_sees_other_processes(db):
+    """
+    Test that subscribers moved by another process are re-indexed by the
+    next catch up, and removed ones are left out of the recipients
+    :return: None
+    """
+    index = AudienceIndex()
+    index.build(db)
+    mumbai = make_alert(cities=["Mumbai"])
+    with Session(db.get_bind()) as other:
+        moved = other.scalar(select(Person).where(Person.city == "Pune").limit(1))
+        moved.pin_code, moved.city = 400001, "Mumbai"
+        removed = other.scalar(select(Person).where(Person.city == "Mumbai").limit(1))
+        other.delete(removed)
+        other.commit()
+        moved_id, removed_id = moved.id, removed.id
+    assert moved_id not in index.lookup(mumbai)
+    resolver = RecipientResolver(chunk_size=64, index=index)
+    _, recipients = next(resolver.resolve(db, [mumbai]))
+    ids = {row.id for row in recipients}
+    assert moved_id in ids and removed_id not in ids
+    assert moved_id not in index.lookup(make_alert(cities=["Pune"]))
+
+
+def test_snapshot_round_trip_and_catch_up(db, tmp_path):
+    """
+    Test that a loaded snapshot answers like the index it was saved from
+    and picks up subscribers added after it
+    :return: None
+    """
+    built = AudienceIndex()
+    built.build(db)
+    built.save(tmp_path / "index.npz")
+    db.add(
+        Person(
+            first_name="first",
+            last_name="last",
+            email="late@example.com",
+            phone_number="+199999",
+            pin_code=94103,
+            city="San Francisco",
+            state="California",
+            country="USA",
+        )
+    )
+    db.commit()
+    loaded = AudienceIndex()
+    loaded.start(db, tmp_path / "index.npz")
+    late = db.scalar(select(Person.id).where(Person.email == "late@example.com"))
+    for alert in ALERTS:
+        expected = set(built.lookup(alert).tolist())
+        if 94103 in (alert.pincodes or []) or "USA" in (alert.countries or []):
+            expected.add(late)
+        assert set(loaded.lookup(alert).tolist()) == expected
+
+
+def test_resolver_reads_indexed_ids(db):
+    """
+    Test that a resolver with an index returns the same recipients
+    :return: None
+    """
+    index = AudienceIndex()
+    index.build(db)
+    for alert in ALERTS:
+        _, recipients = next(
+            RecipientResolver(chunk_size=64, index=index).resolve(db, [alert])
+        )
+        assert sorted(row.id for row in recipients) == audience(db, alert)
@@ -1,8 +1,16 @@
+import asyncio
+from collections import namedtuple
+
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
 
 from app.main import app, app_factory
-from app.settings import settings
+from app.routers.alerts import DoraAlert
+from app.schemas import AlertsCreateRequest
+from app.settings import reload_settings, settings
 
 client = TestClient(app)
 
@@ -12,6 +20,13 @@ def settings_():
     return settings()
 
 
+@pytest.fixture
+def reloaded(monkeypatch):
+    yield monkeypatch
+    monkeypatch.undo()
+    reload_settings()  # leave the original settings for other tests
+
+
 def test_read_main():
     """
     Test the index route.
@@ -56,3 +71,117 @@ def test_settings(settings_):
     ]
     for attr in attributes:
         assert hasattr(settings_, attr)
+
+
+def test_settings_are_cached(settings_):
+    """
+    Test that settings are read once and shared by every caller
+    :return: None
+    """
+    assert settings() is settings_
+
+
+def test_reload_settings(reloaded):
+    """
+    Test that a reload picks up changed flags
+    :return: None
+    """
+    reloaded.setenv("SEND_TEXTS", "false")
+    assert settings().SEND_TEXTS is True  # not re-read until reloaded
+    reload_settings()
+    assert settings().SEND_TEXTS is False
+
+
+def test_failed_reload_keeps_settings(reloaded, settings_):
+    """
+    Test that invalid settings do not replace the current ones
+    :return: None
+    """
+    reloaded.setenv("SMTP_PORT", "not a port")
+    with pytest.raises(ValidationError):
+        reload_settings()
+    assert settings() is settings_
+
+
+def test_empty_alert_batch_is_rejected():
+    """
+    Test that a request without alerts fails validation with a 400
+    :return: None
+    """
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(DoraAlert()._validate_alerts(AlertsCreateRequest(alerts=[])))
+    assert error.value.status_code == 400
+
+
+def test_store_alerts_in_chunks(monkeypatch):
+    """
+    Test that alerts are inserted and read back a chunk at a time, so no
+    statement goes over the driver's bind parameter limit
+    :return: None
+    """
+    Row = namedtuple("Row", "id title description severity")
+
+    class Session:
+        def __init__(self, existing):
+            self.existing = existing
+            self.statements = []
+
+        async def execute(self, statement):
+            params = statement.compile(dialect=postgresql.dialect()).params
+            self.statements.append(params)
+            if "param_1" in params:  # read back
+                keys = params["param_1"]
+            else:
+                keys = [
+                    tuple(params[f"{column}_m{i}"] for column in Row._fields[1:])
+                    for i in range(len(params) // 3)
+                ]
+                keys = [key for key in keys if key not in self.existing]
+            return [Row(hash(key), *key) for key in keys]
+
+        async def commit(self):
+            pass
+
+    monkeypatch.setattr(DoraAlert, "STORE_CHUNK_SIZE", 2)
+    request = AlertsCreateRequest(
+        alerts=[
+            {
+                "title": f"Flood {i}",
+                "description": "Leave",
+                "severity": "high",
+                "cities": ["Pune"],
+            }
+            for i in range(5)
+        ]
+    )
+    db = Session({("Flood 0", "Leave", "high"), ("Flood 3", "Leave", "high")})
+    stored = asyncio.run(DoraAlert().store_alerts(request, db))
+    assert [alert["title"] for alert in stored] == [f"Flood {i}" for i in range(5)]
+    assert [len(params) for params in db.statements] == [6, 6, 3, 1]
+    assert db.statements[-1]["param_1"] == sorted(db.existing)
+
+
+def test_estimate_measures_texts_with_a_full_alert_link(reloaded, mocker):
+    """
+    Test that estimated texts carry a link as long as the one sent, which
+    needs an alert id that is not known yet
+    :return: None
+    """
+    reloaded.setenv("SMS_LINK_URL", "https://dora.example/alerts/{alert_id}")
+    reload_settings()
+    alert = DoraAlert()
+    renderer = mocker.spy(alert, "renderer")
+    db = mocker.MagicMock(run_sync=mocker.AsyncMock(return_value=[{"en": 1}]))
+    request = AlertsCreateRequest(
+        alerts=[
+            {
+                "title": "Flood",
+                "description": "Leave",
+                "severity": "high",
+                "cities": ["Pune"],
+            }
+        ]
+    )
+    asyncio.run(alert.estimate(request, db))
+    link = renderer.spy_return.link
+    assert link == f"https://dora.example/alerts/{2**31 - 1}"
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.deliveries import DeliveryRecorder
+from app.delivery import DeliveryEngine
+from app.models import Alert, Base, Delivery, Person, Region, RegionAudience
+from app.recipients import RecipientResolver
+from app.regions import RegionIndex
+from app.schemas import AlertCreateRequest
+
+
+@pytest.fixture
+def db():
+    # recipients are read and deliveries written in the threadpool
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    event.listen(  # now() is used as a column default
+        engine,
+        "connect",
+        lambda connection, _: connection.create_function(
+            "now", 0, lambda: datetime.now(timezone.utc).isoformat(" ")
+        ),
+    )
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            Region.__table__,
+            Person.__table__,
+            RegionAudience.__table__,
+            Alert.__table__,
+            Delivery.__table__,
+        ],
+    )
+    with Session(engine) as session:
+        for i in range(5):
+            session.add(
+                Person(
+                    first_name="first",
+                    last_name="last",
+                    email=f"{i}@example.com",
+                    phone_number=f"+10{i}",
+                    pin_code=411001,
+                    city="Pune",
+                    state="Maharashtra",
+                    country="India",
+                )
+            )
+        session.flush()
+        RegionIndex.refresh(session)
+        session.add(Alert(id=1, title="Flood", description="Leave", severity="high"))
+        session.commit()
+        yield session
+
+
+def statuses(db):
+    return {
+        (row.channel, row.person_id): (row.status, row.attempts)
+        for row in db.scalars(select(Delivery))
+    }
+
+
+def test_recorder_upserts_in_batches(db):
+    """
+    Test that outcomes are written every batch_size records and that
+    recording a recipient again replaces its status and counts the attempt
+    :return: None
+    """
+    people = db.scalars(select(Person).order_by(Person.id)).all()
+    recorder = DeliveryRecorder(db, 1, batch_size=2)
+    asyncio.run(recorder.record("text", people[0], False))
+    assert statuses(db) == {}
+    asyncio.run(recorder.record("text", people[1], True))
+    assert statuses(db) == {("text", 1): ("failed", 1), ("text", 2): ("sent", 1)}
+    asyncio.run(recorder.record("text", people[0], True))
+    asyncio.run(recorder.flush())
+    assert statuses(db)[("text", 1)] == ("sent", 2)
+
+
+def test_retry_resumes_undelivered_recipients(db):
+    """
+    Test that sending an alert again only reaches the recipients it was not
+    delivered to, on each channel
+    :return: None
+    """
+    alert = AlertCreateRequest(
+        title="Flood", description="Leave", severity="high", cities=["Pune"]
+    )
+    engine = DeliveryEngine({"text": 2, "email": 2})
+    texts, emails, failing = [], [], {3}
+
+    def send_text(recipient):
+        if recipient.id in failing:
+            raise RuntimeError("provider down")
+        texts.append(recipient.id)
+
+    async def send():
+        _, recipients = next(
+            RecipientResolver().resolve(db, [alert], [1], ["text", "email"])
+        )
+        with Session(db.get_bind()) as record_db:
+            return await engine.broadcast(
+                {"text": send_text, "email": lambda r: emails.append(r.id)},
+                recipients,
+                recorder=DeliveryRecorder(record_db, 1),
+            )
+
+    try:
+        first = asyncio.run(send())
+        texts.clear()
+        emails.clear()
+        failing.clear()
+        second = asyncio.run(send())
+    finally:
+        engine.shutdown()
+    assert len(first["text"].failed) == 1 and first["email"].sent == 5
+    assert texts == [3] and emails == []
+    # people delivered on every channel are not even read again
+    assert second["text"].queued == 1 and second["email"].skipped == 1
+    assert statuses(db)[("text", 3)] == ("sent", 2)
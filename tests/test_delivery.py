@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.delivery import BatchSend, DeliveryEngine, PriorityGate
+
+
+@pytest.fixture
+def engine():
+    engine = DeliveryEngine({"text": 4, "email": 2})
+    yield engine
+    engine.shutdown()
+
+
+def test_fan_out_delivers_to_every_recipient(engine):
+    """
+    Test that every recipient is sent to exactly once
+    :return: None
+    """
+    delivered = []
+    report = asyncio.run(engine.fan_out("text", delivered.append, range(100)))
+    assert report.sent == 100
+    assert not report.failed
+    assert sorted(delivered) == list(range(100))
+
+
+def test_fan_out_respects_channel_limit(engine):
+    """
+    Test that no more than the configured number of sends run at once
+    :return: None
+    """
+    lock = threading.Lock()
+    active, peak = 0, 0
+
+    def send(_):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+
+    asyncio.run(engine.fan_out("email", send, range(20)))
+    assert peak == 2
+
+
+def test_fan_out_reports_failures(engine):
+    """
+    Test that a failing recipient does not stop the rest of the fan-out
+    :return: None
+    """
+
+    def send(recipient):
+        if recipient == 3:
+            raise RuntimeError("provider error")
+
+    report = asyncio.run(engine.fan_out("text", send, range(10)))
+    assert report.sent == 9
+    assert report.failed == [3]
+
+
+def test_broadcast_reaches_every_channel(engine):
+    """
+    Test that every recipient is delivered to over every channel
+    :return: None
+    """
+    texts, emails = [], []
+    reports = asyncio.run(
+        engine.broadcast({"text": texts.append, "email": emails.append}, range(50))
+    )
+    assert sorted(texts) == sorted(emails) == list(range(50))
+    assert reports["text"].queued == reports["email"].sent == 50
+
+
+def test_recipients_are_read_off_the_event_loop():
+    """
+    Test that recipients are pulled in chunks from the threadpool, so a
+    database cursor never blocks the event loop
+    :return: None
+    """
+    engine = DeliveryEngine({"text": 2}, chunk_size=10)
+    readers = set()
+
+    def recipients():
+        for i in range(25):
+            readers.add(threading.current_thread())
+            yield i
+
+    try:
+        report = asyncio.run(engine.fan_out("text", lambda _: None, recipients()))
+    finally:
+        engine.shutdown()
+    assert report.sent == 25
+    assert threading.main_thread() not in readers
+
+
+def test_recorder_error_fails_the_broadcast():
+    """
+    Test that a recorder error stops the broadcast with that error rather
+    than leaving it waiting on the queue of its dead workers
+    :return: None
+    """
+
+    class BrokenRecorder:
+        async def record(self, channel, recipient, delivered):
+            raise RuntimeError("database down")
+
+        async def flush(self):
+            pass
+
+    engine = DeliveryEngine({"text": 2})
+    broadcast = engine.broadcast(
+        {"text": lambda _: None}, range(100), recorder=BrokenRecorder()
+    )
+    try:
+        with pytest.raises(RuntimeError, match="database down"):
+            asyncio.run(asyncio.wait_for(broadcast, timeout=5))
+    finally:
+        engine.shutdown()
+
+
+def test_batch_failure_fails_every_recipient_of_the_batch(engine):
+    """
+    Test that a batch send is handed batches and a failing batch is
+    reported for each of its recipients
+    :return: None
+    """
+    batches = []
+
+    def send(batch):
+        batches.append(batch)
+        if 4 in batch:
+            raise RuntimeError("provider down")
+
+    report = asyncio.run(engine.fan_out("email", BatchSend(send, 4), range(10)))
+    assert max(len(batch) for batch in batches) <= 4
+    assert sorted(report.failed) == sorted(
+        next(batch for batch in batches if 4 in batch)
+    )
+    assert report.sent == 10 - len(report.failed)
+
+
+def test_gate_serves_highest_priority_first():
+    """
+    Test that a freed slot goes to the most urgent waiter
+    :return: None
+    """
+    gate = PriorityGate(1)
+    served = []
+
+    async def wait(priority, name):
+        async with gate.slot(priority):
+            served.append(name)
+
+    async def run():
+        await gate.acquire()
+        waiters = [
+            asyncio.create_task(wait(0, "low")),
+            asyncio.create_task(wait(3, "critical")),
+            asyncio.create_task(wait(0, "low again")),
+            asyncio.create_task(wait(2, "high")),
+        ]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(run())
+    assert served == ["critical", "high", "low", "low again"]
+
+
+def test_critical_broadcast_preempts_low_fan_out(engine):
+    """
+    Test that a critical alert is delivered before an in-flight low one finishes
+    :return: None
+    """
+    delivered = []
+
+    def send(recipient):
+        time.sleep(0.005)
+        delivered.append(recipient)
+
+    async def run():
+        low = asyncio.create_task(
+            engine.fan_out("email", send, [f"low{i}" for i in range(40)], priority=0)
+        )
+        await asyncio.sleep(0.02)
+        await engine.fan_out("email", send, ["critical0", "critical1"], priority=3)
+        await low
+
+    asyncio.run(run())
+    last_critical = delivered.index("critical1")
+    assert len(delivered) == 42
+    assert last_critical < 20  # not queued behind the rest of the low fan-out
@@ -0,0 +1,58 @@
+import random
+
+from app.geo import Circle, Cover, Polygon, cell_bounds, cell_range, geocell
+
+# lower Manhattan, as GeoJSON [longitude, latitude] with a hole
+POLYGON = [
+    [
+        [-74.02, 40.70],
+        [-73.97, 40.70],
+        [-73.97, 40.75],
+        [-74.02, 40.75],
+        [-74.02, 40.70],
+    ],
+    [[-74.00, 40.72], [-73.99, 40.72], [-73.99, 40.73], [-74.00, 40.72]],
+]
+
+
+def test_geocell_prefix_is_its_cell():
+    """
+    Test that a point's geocell lies in the range of every cell containing it
+    :return: None
+    """
+    cell = geocell(18.52, 73.85)
+    for level in (1, 8, 20):
+        prefix = cell >> (2 * (26 - level))
+        start, end = cell_range(level, prefix)
+        min_lon, min_lat, max_lon, max_lat = cell_bounds(level, prefix)
+        assert start <= cell < end
+        assert min_lon <= 73.85 < max_lon and min_lat <= 18.52 < max_lat
+
+
+def test_cover_matches_exact_test():
+    """
+    Test that the cover finds exactly the points inside circles and polygons
+    :return: None
+    """
+    random.seed(7)
+    for shape in (Circle(40.72, -73.99, 3.0), Polygon(POLYGON)):
+        cover = Cover(shape)
+        assert len(cover.ranges) <= 256
+        for _ in range(5000):
+            lat, lon = random.uniform(40.65, 40.80), random.uniform(-74.07, -73.92)
+            cell = geocell(lat, lon)
+            in_cover = any(start <= cell < end for start, end in cover.ranges)
+            expected = shape.contains(lat, lon)
+            assert not expected or in_cover
+            assert (in_cover and cover.contains(lat, lon, cell)) == expected
+
+
+def test_polygon_excludes_hole():
+    """
+    Test that points in a polygon's hole are outside it
+    :return: None
+    """
+    polygon = Polygon(POLYGON)
+    assert polygon.contains(40.71, -74.01)
+    assert not polygon.contains(40.7210, -73.9920)
+    assert not polygon.contains(40.76, -74.01)
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.delivery import DeliveryReport
+from app.jobs import JobQueue
+from app.models import AlertJob
+
+
+@pytest.fixture
+def job():
+    return SimpleNamespace(
+        id=1, payload={}, status="running", attempts=1, retried=0, error=None
+    )
+
+
+def test_run_records_delivery_counts(mocker, job):
+    """
+    Test that a successful job is marked as done with its delivery counts
+    :return: None
+    """
+
+    async def dispatch(payload, db, progress):
+        progress.track(DeliveryReport("text", queued=3, sent=2, failed=["+1"]))
+        progress.track(DeliveryReport("email", queued=2, sent=2))
+
+    asyncio.run(JobQueue(dispatch).run(job, mocker.MagicMock()))
+    assert job.status == "done"
+    assert (job.queued, job.sent, job.failed) == (5, 4, 1)
+
+
+@pytest.mark.parametrize(
+    "attempts, status, retried",
+    [
+        (1, "queued", 1),
+        (3, "failed", 0),
+    ],
+)
+def test_run_retries_failed_jobs(mocker, job, attempts, status, retried):
+    """
+    Test that failed jobs are queued again until they run out of attempts
+    :return: None
+    """
+
+    async def dispatch(payload, db, progress):
+        raise RuntimeError("provider down")
+
+    job.attempts = attempts
+    asyncio.run(JobQueue(dispatch, max_attempts=3).run(job, mocker.MagicMock()))
+    assert job.status == status
+    assert job.retried == retried
+    assert job.error == "provider down"
+
+
+def test_claim_prefers_urgent_jobs():
+    """
+    Test that jobs are claimed by priority, then age, and an urgent
+    worker leaves less urgent jobs alone
+    :return: None
+    """
+    engine = create_engine("sqlite://")
+    event.listen(  # now() is used as a column default
+        engine,
+        "connect",
+        lambda connection, _: connection.create_function(
+            "now", 0, lambda: datetime.now(timezone.utc).isoformat(" ")
+        ),
+    )
+    AlertJob.__table__.create(engine)
+    with Session(engine) as db:
+        db.add_all(
+            AlertJob(status="queued", payload={}, requested_by="u", priority=priority)
+            for priority in (0, 3, 1, 3)
+        )
+        db.commit()
+        queue = JobQueue(None)
+        assert [queue.claim(db, min_priority=2).id for _ in range(2)] == [2, 4]
+        assert queue.claim(db, min_priority=2) is None
+        assert [queue.claim(db).id for _ in range(2)] == [3, 1]
+
+
+@pytest.mark.parametrize(
+    "fails, status, attempts", [(False, "done", 1), (True, "failed", 3)]
+)
+def test_worker_keeps_queries_off_the_event_loop(mocker, fails, status, attempts):
+    """
+    Test that a worker claims, dispatches and records a job without a
+    query on the event loop thread, whether the dispatch succeeds or fails
+    until the job is out of attempts
+    :return: None
+    """
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    event.listen(
+        engine,
+        "connect",
+        lambda connection, _: connection.create_function(
+            "now", 0, lambda: datetime.now(timezone.utc).isoformat(" ")
+        ),
+    )
+    AlertJob.__table__.create(engine)
+    with Session(engine) as db:
+        db.add(AlertJob(status="queued", payload={"n": 1}, requested_by="u"))
+        db.commit()
+    threads = set()
+
+    def record_thread(*_):
+        threads.add(threading.current_thread())
+
+    event.listen(engine, "before_cursor_execute", record_thread)
+    mocker.patch("app.jobs.session_local", sessionmaker(bind=engine))
+    dispatched = []
+
+    async def dispatch(payload, db, progress):
+        dispatched.append(payload)
+        if fails:
+            raise RuntimeError("provider down")
+
+    async def work():
+        task = asyncio.create_task(JobQueue(dispatch, poll_interval=0.01).work())
+        while len(dispatched) < attempts:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(work())
+    event.remove(engine, "before_cursor_execute", record_thread)
+    assert threads and threading.main_thread() not in threads
+    with Session(engine) as db:
+        job = db.get(AlertJob, 1)
+        assert (job.status, job.attempts) == (status, attempts)
+    assert dispatched == [{"n": 1}] * attempts
@@ -0,0 +1,101 @@
+import io
+import json
+import logging
+import sys
+
+import pytest
+
+from app.logger import Logger, LogSampler, configure_logging, flush_logs
+
+
+@pytest.fixture
+def stream():
+    stream = io.StringIO()
+    configure_logging("INFO", "json", stream)
+    yield stream
+    flush_logs()
+    configure_logging("INFO", "text", sys.stderr)
+
+
+def lines(stream):
+    flush_logs()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_lines_carry_extra_fields(stream):
+    """
+    Test that records are written by the listener as JSON with their extras
+    :return: None
+    """
+    logger = Logger("test.json")
+    logger.info("%s alert sent to %s recipients", "Text", 3, extra={"sent": 3})
+    [entry] = lines(stream)
+    assert entry["message"] == "Text alert sent to 3 recipients"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "test.json"
+    assert entry["sent"] == 3
+
+
+def test_exceptions_are_written(stream):
+    """
+    Test that the traceback of a logged exception reaches the listener
+    :return: None
+    """
+    logger = Logger("test.exception")
+    try:
+        raise ValueError("bad recipient")
+    except ValueError:
+        logger.exception("Delivery to %s failed", "a")
+    [entry] = lines(stream)
+    assert entry["message"] == "Delivery to a failed"
+    assert "ValueError: bad recipient" in entry["exception"]
+
+
+def test_level_drops_records_before_formatting(stream):
+    """
+    Test that records below the configured level are not formatted
+    :return: None
+    """
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted")
+
+    logger = Logger("test.level")
+    logger.debug("recipient %s", Expensive())
+    configure_logging("WARNING", "json")
+    logger.info("recipient %s", Expensive())
+    logger.warning("kept")
+    assert [entry["message"] for entry in lines(stream)] == ["kept"]
+
+
+def test_sampler_logs_first_then_every_nth(stream):
+    """
+    Test that a repeated event is logged a few times, with the count of
+    the occurrences left out, and summarized at the end
+    :return: None
+    """
+    sampler = LogSampler(Logger("test.sampler"), logging.ERROR, first=2, every=5)
+    for i in range(10):
+        sampler.log("text", "Delivery to %s failed", i)
+    sampler.log("email", "Delivery to %s failed", "a")
+    sampler.summary()
+    messages = [entry["message"] for entry in lines(stream)]
+    assert messages == [
+        "Delivery to 0 failed",
+        "Delivery to 1 failed",
+        "Delivery to 6 failed (4 similar not logged)",
+        "Delivery to a failed",
+        "3 more text events not logged",
+    ]
+
+
+def test_invalid_configuration_is_rejected():
+    """
+    Test that an unknown level or format raises instead of being applied
+    :return: None
+    """
+    with pytest.raises(ValueError):
+        configure_logging("LOUD", "text")
+    with pytest.raises(ValueError):
+        configure_logging("INFO", "xml")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.models import Person
+from app.pagination import keyset_page, ndjson_export, parse_fields
+
+
+@pytest.fixture
+def db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def populate():
+        async with engine.begin() as connection:
+            await connection.run_sync(Person.__table__.create)
+        async with AsyncSession(engine) as session:
+            session.add_all(
+                Person(
+                    first_name="first",
+                    last_name="last",
+                    email=f"user{i}@example.com",
+                    phone_number=f"+1555000{i:04d}",
+                    pin_code=411001,
+                    city="Pune",
+                    state="Maharashtra",
+                    country="India",
+                )
+                for i in range(25)
+            )
+            await session.commit()
+
+    asyncio.run(populate())
+    return engine
+
+
+def test_parse_fields():
+    """
+    Test that projections are validated against the allowed fields
+    :return: None
+    """
+    assert parse_fields(None, ["email", "city"]) == ["email", "city"]
+    assert parse_fields("city, email", ["email", "city"]) == ["city", "email"]
+    with pytest.raises(HTTPException) as error:
+        parse_fields("email,password", ["email", "city"])
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_page_walks_every_row_once(db, descending):
+    """
+    Test that following next_cursor visits every row exactly once
+    :return: None
+    """
+    query = select(Person.id, Person.email)
+
+    async def walk():
+        emails, cursor = [], None
+        async with AsyncSession(db) as session:
+            while True:
+                page, cursor = await keyset_page(
+                    session, query, Person.id, ["email"], cursor, 10, descending
+                )
+                assert len(page) <= 10
+                emails.extend(row["email"] for row in page)
+                if cursor is None:
+                    return emails
+
+    emails = asyncio.run(walk())
+    assert len(emails) == len(set(emails)) == 25
+    assert emails[0] == ("user24@example.com" if descending else "user0@example.com")
+
+
+def test_ndjson_export(db):
+    """
+    Test that an export streams one JSON object per row
+    :return: None
+    """
+
+    async def read():
+        async with AsyncSession(db) as session:
+            response = ndjson_export(
+                session, select(Person.id, Person.city), ["city"], 4
+            )
+            return [line async for line in response.body_iterator]
+
+    lines = asyncio.run(read())
+    assert len(lines) == 25
+    assert json.loads(lines[0]) == {"city": "Pune"}
@@ -0,0 +1,55 @@
+import asyncio
+
+from app.metrics import metrics
+from app.passwords import PasswordHasher, PasswordQueueFull
+
+
+def test_hash_and_verify():
+    """
+    Test that hashes made in the pool verify without needing a rehash
+    :return: None
+    """
+    hasher = PasswordHasher(rounds=4, workers=2)
+
+    async def check():
+        hashed = await hasher.hash("secret")
+        assert hashed.startswith("$2b$04$")
+        assert await hasher.verify("secret", hashed) == (True, None)
+        assert (await hasher.verify("wrong", hashed))[0] is False
+
+    asyncio.run(check())
+    assert hasher.pending == 0
+
+
+def test_verify_rehashes_on_cost_change():
+    """
+    Test that a password hashed with another cost factor is rehashed on login
+    :return: None
+    """
+    old, new = PasswordHasher(rounds=4), PasswordHasher(rounds=5)
+    rehashed = metrics.value("dora_password_rehashed_total")
+
+    async def check():
+        valid, new_hash = await new.verify("secret", await old.hash("secret"))
+        assert valid and new_hash.startswith("$2b$05$")
+        assert await new.verify("secret", new_hash) == (True, None)
+
+    asyncio.run(check())
+    assert metrics.value("dora_password_rehashed_total") == rehashed + 1
+
+
+def test_full_queue_rejects():
+    """
+    Test that operations beyond max_pending are rejected, not queued
+    :return: None
+    """
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2)
+
+    async def check():
+        results = await asyncio.gather(
+            *(hasher.hash("secret") for _ in range(3)), return_exceptions=True
+        )
+        assert sum(isinstance(r, PasswordQueueFull) for r in results) == 1
+        assert sum(isinstance(r, str) for r in results) == 2
+
+    asyncio.run(check())
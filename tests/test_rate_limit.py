@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from twilio.base.exceptions import TwilioRestException
+from twilio.rest import Client
+
+from app.metrics import metrics
+from app.rate_limit import RateLimiter, TokenBucket
+from app.twilio_client import is_retryable_text_error
+from tests.fakes import FakeTwilioServer
+
+
+def test_bucket_spaces_out_reservations():
+    """
+    Test that tokens beyond the burst are handed out at the bucket's rate
+    :return: None
+    """
+    bucket = TokenBucket(rate=10, burst=1)
+    delays = [bucket.reserve() for _ in range(3)]
+    assert delays[0] == 0
+    assert delays[1] == pytest.approx(0.1, abs=0.01)
+    assert delays[2] == pytest.approx(0.2, abs=0.01)
+
+
+def test_limiter_spreads_over_senders():
+    """
+    Test that sends go to the sender that can send the soonest
+    :return: None
+    """
+    limiter = RateLimiter("text", {"+1": 1, "+2": 1, "+3": 1}, lambda e: False)
+    senders = [limiter.send(lambda sender: sender) for _ in range(3)]
+    assert sorted(senders) == ["+1", "+2", "+3"]
+
+
+def test_limiter_backs_off_on_429():
+    """
+    Test that a rate limited send slows its sender down and is retried
+    :return: None
+    """
+    limiter = RateLimiter("text", {"+1": 8}, is_retryable_text_error, backoff=0)
+    throttled = metrics.value("dora_send_throttled_total", channel="text")
+    responses = iter([TwilioRestException(429, "/Messages.json"), "SM1"])
+
+    def deliver(sender):
+        if isinstance(response := next(responses), Exception):
+            raise response
+        return response
+
+    assert limiter.send(deliver) == "SM1"
+    assert limiter.buckets["+1"].rate == pytest.approx(4.25)  # halved, then recovering
+    assert metrics.value("dora_send_throttled_total", channel="text") == throttled + 1
+
+    def reject(sender):
+        raise TwilioRestException(400, "/Messages.json")
+
+    with pytest.raises(TwilioRestException):  # client errors are not retried
+        limiter.send(reject)
+
+
+def test_limiter_stays_under_provider_limit():
+    """
+    Test that concurrent sends through the limiter are all accepted by a
+    provider enforcing the same per-number limit
+    :return: None
+    """
+    with FakeTwilioServer(latency=0, rate_limit=20) as twilio:
+        client = Client("ACxxx", "token")
+        client.api.base_url = twilio.url
+        limiter = RateLimiter(
+            "text", {"+1": 20, "+2": 20}, is_retryable_text_error, backoff=0.1
+        )
+
+        def send(i):
+            limiter.send(
+                lambda sender: client.messages.create(
+                    body="test", from_=sender, to=f"+1555{i:07d}"
+                )
+            )
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(send, range(60)))
+    assert sum(twilio.sent.values()) == 60
+    assert set(twilio.sent) == {"+1", "+2"}
@@ -0,0 +1,300 @@
+from itertools import groupby
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.geo import geocell
+from app.models import Base, Person, Region, RegionAudience
+from app.recipients import RecipientResolver
+from app.regions import RegionIndex
+from app.schemas import AlertCreateRequest
+
+PEOPLE = [
+    ("a@example.com", "+100", 411001, "Pune", "Maharashtra", "India"),
+    ("b@example.com", "+101", 411002, "Pune", "Maharashtra", "India"),
+    ("c@example.com", "+102", 400001, "Mumbai", "Maharashtra", "India"),
+    ("d@example.com", "+103", 94103, "San Francisco", "California", "USA"),
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine, tables=[Region.__table__, Person.__table__, RegionAudience.__table__]
+    )
+    with Session(engine) as session:
+        for email, phone, pin_code, city, state, country in PEOPLE:
+            session.add(
+                Person(
+                    first_name="first",
+                    last_name="last",
+                    email=email,
+                    phone_number=phone,
+                    pin_code=pin_code,
+                    city=city,
+                    state=state,
+                    country=country,
+                )
+            )
+        session.flush()
+        RegionIndex.refresh(session)
+        session.commit()
+        yield session
+
+
+def make_alert(**targets):
+    return AlertCreateRequest(
+        title="Flood", description="Move to higher ground", severity="high", **targets
+    )
+
+
+def test_resolve_dedupes_overlapping_locations(db):
+    """
+    Test that a subscriber matching several targets is returned once
+    :return: None
+    """
+    alert = make_alert(cities=["Pune"], states=["Maharashtra"], pincodes=[411001])
+    resolved, recipients = next(RecipientResolver().resolve(db, [alert]))
+    assert resolved is alert
+    assert sorted(row.email for row in recipients) == [
+        "a@example.com",
+        "b@example.com",
+        "c@example.com",
+    ]
+
+
+def test_resolve_keeps_request_order(db):
+    """
+    Test that every alert of a batch gets its own recipients, in order
+    :return: None
+    """
+    alerts = [
+        make_alert(countries=["USA"]),
+        make_alert(inform_all=True),
+        make_alert(cities=["Atlantis"]),
+        make_alert(pincodes=[400001]),
+    ]
+    resolved = [
+        (alert, sorted(row.phone_number for row in recipients))
+        for alert, recipients in RecipientResolver(chunk_size=2).resolve(db, alerts)
+    ]
+    assert [alert for alert, _ in resolved] == alerts
+    assert [phones for _, phones in resolved] == [
+        ["+103"],
+        ["+100", "+101", "+102", "+103"],
+        [],
+        ["+102"],
+    ]
+
+
+def test_refresh_builds_region_hierarchy(db):
+    """
+    Test that subscribers are linked to a shared region hierarchy
+    :return: None
+    """
+    pune = db.query(Region).filter_by(kind="city", key="pune").one()
+    maharashtra = db.get(Region, pune.parent_id)
+    assert (maharashtra.kind, maharashtra.name) == ("state", "Maharashtra")
+    assert db.get(Region, maharashtra.parent_id).name == "India"
+    assert db.query(Region).filter_by(kind="state").count() == 2
+    assert all(person.region_id for person in db.query(Person))
+    assert db.query(RegionAudience).count() == 4 * len(PEOPLE)
+
+
+def test_resolve_matches_normalized_names(db):
+    """
+    Test that targets match regions regardless of case and padding
+    :return: None
+    """
+    alert = make_alert(cities=[" PUNE"], countries=["usa"])
+    _, recipients = next(RecipientResolver().resolve(db, [alert]))
+    assert sorted(row.email for row in recipients) == [
+        "a@example.com",
+        "b@example.com",
+        "d@example.com",
+    ]
+
+
+def locate_people(db):
+    coordinates = {  # a and b in Pune, c in Mumbai, d in San Francisco
+        "a@example.com": (18.5204, 73.8567),
+        "b@example.com": (18.5590, 73.7868),
+        "c@example.com": (18.9388, 72.8354),
+        "d@example.com": (37.7749, -122.4194),
+    }
+    for person in db.query(Person):
+        person.latitude, person.longitude = coordinates[person.email]
+        person.geocell = geocell(*coordinates[person.email])
+    db.commit()
+
+
+def test_resolve_area_radius(db):
+    """
+    Test that an area alert reaches subscribers within the radius
+    :return: None
+    """
+    locate_people(db)
+    alert = make_alert(area={"latitude": 18.52, "longitude": 73.85, "radius_km": 5})
+    _, recipients = next(RecipientResolver().resolve(db, [alert]))
+    assert [row.email for row in recipients] == ["a@example.com"]
+
+
+def test_resolve_area_polygon_with_regions(db):
+    """
+    Test that an area alert also reaches subscribers in its targeted regions
+    :return: None
+    """
+    locate_people(db)
+    around_pune = [
+        [[73.7, 18.4], [74.0, 18.4], [74.0, 18.7], [73.7, 18.7], [73.7, 18.4]]
+    ]
+    alerts = [
+        make_alert(
+            area={"polygon": {"type": "Polygon", "coordinates": around_pune}},
+            countries=["USA"],
+        ),
+        make_alert(pincodes=[400001]),
+    ]
+    resolved = [
+        sorted(row.email for row in recipients)
+        for _, recipients in RecipientResolver().resolve(db, alerts)
+    ]
+    assert resolved == [
+        ["a@example.com", "b@example.com", "d@example.com"],
+        ["c@example.com"],
+    ]
+
+
+def test_resolve_groups_recipients_by_language(db):
+    """
+    Test that the recipients of an alert come grouped by language
+    :return: None
+    """
+    for person, language in zip(db.query(Person).order_by(Person.id), "ehed"):
+        person.language = {"e": "en", "h": "hi", "d": None}[language]
+    db.commit()
+    for alert in (make_alert(countries=["India", "USA"]), make_alert(inform_all=True)):
+        _, recipients = next(RecipientResolver().resolve(db, [alert]))
+        runs = [language for language, _ in groupby(row.language for row in recipients)]
+        assert len(runs) == len(set(runs)) == 3
+
+
+def test_language_counts(db):
+    """
+    Test that audiences are counted per language for every kind of alert
+    :return: None
+    """
+    for person, language in zip(db.query(Person).order_by(Person.id), "ehed"):
+        person.language = {"e": "en", "h": "hi", "d": None}[language]
+    db.commit()
+    locate_people(db)
+    counts = RecipientResolver().language_counts(
+        db,
+        [
+            make_alert(states=["Maharashtra"]),
+            make_alert(inform_all=True),
+            make_alert(area={"latitude": 18.52, "longitude": 73.85, "radius_km": 20}),
+            make_alert(cities=["Atlantis"]),
+        ],
+    )
+    assert counts == [
+        {"en": 2, "hi": 1},
+        {"en": 2, "hi": 1, None: 1},
+        {"en": 1, "hi": 1},
+        {},
+    ]
+
+
+def test_refresh_counts_region_subscribers(db):
+    """
+    Test that region subscriber counts follow subscribers as they are
+    indexed and move
+    :return: None
+    """
+
+    def subscribers(kind, key):
+        return db.query(Region).filter_by(kind=kind, key=key).one().subscribers
+
+    assert subscribers("country", "india") == 3
+    assert subscribers("city", "pune") == 2
+    moved = db.query(Person).filter_by(email="a@example.com").one()
+    moved.city, moved.pin_code, moved.region_id = "Mumbai", 400001, None
+    db.flush()
+    RegionIndex.refresh(db)
+    assert subscribers("city", "pune") == 1
+    assert subscribers("city", "mumbai") == 2
+    assert subscribers("state", "maharashtra") == 3
+    assert db.query(Region).filter_by(key="411001").one().subscribers == 0
+
+
+def test_refresh_given_subscribers_only(db):
+    """
+    Test that a refresh of given subscribers indexes and counts only them
+    :return: None
+    """
+
+    def subscriber(email, city, pin_code):
+        person = Person(
+            first_name="first",
+            last_name="last",
+            email=email,
+            phone_number=email,
+            pin_code=pin_code,
+            city=city,
+            state="Maharashtra",
+            country="India",
+        )
+        db.add(person)
+        db.flush()
+        return person
+
+    added = subscriber("e@example.com", "Nagpur", 440001)
+    waiting = subscriber("f@example.com", "Nashik", 422001)
+    RegionIndex.refresh(db, [added.id])
+    india = db.query(Region).filter_by(kind="country", key="india").one()
+    assert india.subscribers == 4
+    assert db.query(Region).filter_by(kind="city", key="nagpur").one().subscribers
+    assert not db.query(Region).filter_by(kind="city", key="nashik").all()
+    db.expire_all()
+    assert added.region_id is not None and waiting.region_id is None
+    RegionIndex.refresh(db)
+    db.expire_all()
+    assert india.subscribers == 5
+
+
+def test_preview_counts_nested_targets_once(db):
+    """
+    Test that previews count subscribers per location and in total, once
+    even when their targets are nested
+    :return: None
+    """
+    total, locations = RegionIndex.preview(
+        db,
+        make_alert(
+            cities=["Pune", "Atlantis"], states=["Maharashtra"], pincodes=[94103]
+        ),
+    )
+    assert total == 4
+    assert locations == {
+        "pincodes": {"94103": 1},
+        "cities": {"Pune": 2, "Atlantis": 0},
+        "states": {"Maharashtra": 3},
+    }
+    assert RegionIndex.preview(db, make_alert(inform_all=True))[0] == 4
+    assert RegionIndex.preview(db, make_alert(pincodes=[411001, 411002]))[0] == 2
+
+
+def test_remove_takes_subscribers_out_of_regions(db):
+    """
+    Test that removed subscribers leave the audience and region counts
+    :return: None
+    """
+    removed = db.query(Person).filter_by(email="a@example.com").one()
+    RegionIndex.remove(db, [removed.id])
+    db.delete(removed)
+    db.commit()
+    assert db.query(Region).filter_by(kind="city", key="pune").one().subscribers == 1
+    assert db.query(Region).filter_by(key="india").one().subscribers == 2
+    assert db.query(RegionAudience).count() == 4 * (len(PEOPLE) - 1)
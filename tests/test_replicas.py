@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.replicas import ReplicaRouter
+
+
+def make_engine(path, name):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE role (name varchar)"))
+            await connection.execute(text(f"INSERT INTO role VALUES ('{name}')"))
+
+    asyncio.run(create())
+    return engine
+
+
+@pytest.fixture
+def engines(tmp_path):
+    return (
+        make_engine(tmp_path / "primary.db", "primary"),
+        make_engine(tmp_path / "replica1.db", "replica1"),
+        make_engine(tmp_path / "replica2.db", "replica2"),
+    )
+
+
+def read_roles(router, reads=4):
+    async def read():
+        roles = []
+        for _ in range(reads):
+            async with await router.session() as db:
+                roles.append(await db.scalar(text("SELECT name FROM role")))
+        return roles
+
+    return asyncio.run(read())
+
+
+def test_reads_alternate_between_replicas(engines):
+    """
+    Test that read sessions are spread over the replicas, not the primary
+    :return: None
+    """
+    primary, *replicas = engines
+    roles = read_roles(ReplicaRouter(primary, replicas))
+    assert sorted(set(roles)) == ["replica1", "replica2"]
+    assert roles.count("replica1") == roles.count("replica2")
+
+
+def test_unreachable_replica_falls_back(engines, tmp_path):
+    """
+    Test that a replica that cannot be reached is skipped, then the primary is used
+    :return: None
+    """
+    primary, replica, _ = engines
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db")
+    router = ReplicaRouter(primary, [broken, replica])
+    assert set(read_roles(router)) == {"replica1"}
+    assert broken in router.down_until
+    assert read_roles(ReplicaRouter(primary, [broken])) == ["primary"] * 4
+
+
+def test_lagging_replica_is_skipped(engines):
+    """
+    Test that a replica lagging behind the primary is not read from
+    :return: None
+    """
+    primary, replica, _ = engines
+    router = ReplicaRouter(primary, [replica], max_lag=5.0)
+    router.lag[replica] = (time.monotonic(), 60.0)
+    assert read_roles(router) == ["primary"] * 4
+    router.lag[replica] = (time.monotonic(), 1.0)
+    assert read_roles(router, 1) == ["replica1"]
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from twilio.rest import Client
+
+from app.delivery import BatchSend, DeliveryEngine
+from app.settings import settings
+from app.sms import NotifySMS, PerNumberSMS, sms_channel
+from tests.fakes import FakeTwilioServer
+
+
+def twilio_client(**overrides):
+    return SimpleNamespace(
+        settings=settings().copy(update=overrides), client=Client("ACxxx", "token")
+    )
+
+
+def test_sms_channel_follows_setting():
+    """
+    Test that the SMS backend is chosen by SMS_BACKEND
+    :return: None
+    """
+    assert isinstance(sms_channel(twilio_client()), PerNumberSMS)
+    channel = sms_channel(
+        twilio_client(
+            SMS_BACKEND="notify", TWILIO_NOTIFY_SERVICE_SID="IS1", SMS_BATCH_SIZE=50
+        )
+    )
+    assert isinstance(channel, NotifySMS) and channel.batch_size == 50
+    with pytest.raises(ValueError):
+        sms_channel(twilio_client(SMS_BACKEND="pigeon"))
+
+
+def test_notify_sends_a_request_per_batch(mocker):
+    """
+    Test that the delivery engine hands the notify backend full batches
+    and every number becomes an SMS binding
+    :return: None
+    """
+    client = twilio_client()
+    mock_client = mocker.patch.object(client, "client")
+    create = mock_client.notify.v1.services.return_value.notifications.create
+    channel = NotifySMS(client, "IS1", batch_size=10, rate=100)
+    engine = DeliveryEngine({"text": 1})
+    try:
+        report = asyncio.run(
+            engine.fan_out(
+                "text",
+                BatchSend(lambda batch: channel.send("Flood", batch), 10),
+                [f"+1555{i:07d}" for i in range(25)],
+            )
+        )
+    finally:
+        engine.shutdown()
+    assert report.sent == 25
+    assert [len(call.kwargs["to_binding"]) for call in create.call_args_list] == [
+        10,
+        10,
+        5,
+    ]
+    assert json.loads(create.call_args.kwargs["to_binding"][0]) == {
+        "binding_type": "sms",
+        "address": "+15550000020",
+    }
+
+
+def test_notify_against_fake_twilio():
+    """
+    Test a notify send through the Twilio client and the local fake
+    :return: None
+    """
+    with FakeTwilioServer(latency=0) as twilio:
+        client = twilio_client()
+        client.client.notify.base_url = twilio.url
+        NotifySMS(client, "IS1", batch_size=100, rate=100).send(
+            "Flood", [f"+1555{i:07d}" for i in range(100)]
+        )
+    assert twilio.requests == 1 and twilio.recipients == 100
+
+
+def test_send_time_follows_the_backend():
+    """
+    Test that per number sends are timed by segment over the sender numbers'
+    rates and notify sends by request over the notify rate
+    :return: None
+    """
+    client = twilio_client()
+    client.text_limiter = SimpleNamespace(
+        buckets={"+1": SimpleNamespace(max_rate=1), "+2": SimpleNamespace(max_rate=3)}
+    )
+    assert PerNumberSMS(client).send_time(100, 400) == 100
+    channel = NotifySMS(client, "IS1", batch_size=1000, rate=2)
+    assert channel.send_time(10_001, 40_004) == 5.5
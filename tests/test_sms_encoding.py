@@ -0,0 +1,66 @@
+import pytest
+
+from app.sms_encoding import GSM7, UCS2, compact, encoding, segments
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Flood warning: move to higher ground", GSM7),
+        ("Price {high} ~ 5€", GSM7),
+        ("बाढ़ की चेतावनी", UCS2),
+        ("Flood 🌊", UCS2),
+    ],
+)
+def test_encoding(text, expected):
+    """
+    Test GSM-7 detection, extension characters included
+    :return: None
+    """
+    assert encoding(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("a" * 160, 1),
+        ("a" * 161, 2),
+        ("a" * 306, 2),
+        ("a" * 307, 3),
+        ("{" * 80, 1),  # escaped characters take two septets
+        ("{" * 81, 2),
+        ("a" * 152 + "{" + "a" * 10, 2),  # an escape is not split
+        ("अ" * 70, 1),
+        ("अ" * 71, 2),
+        ("अ" * 134, 2),
+        ("अ" * 135, 3),
+    ],
+)
+def test_segments(text, expected):
+    """
+    Test segment counts at the single and concatenated message limits
+    :return: None
+    """
+    assert segments(text) == expected
+
+
+def test_compact_keeps_short_texts():
+    """
+    Test that texts within the limit are sent unchanged
+    :return: None
+    """
+    assert compact("a" * 300, 2) == "a" * 300
+    assert compact("a" * 1000, 0) == "a" * 1000
+
+
+@pytest.mark.parametrize("text", ["Move to higher ground " * 40, "बाढ़ " * 200])
+def test_compact_links_out(text):
+    """
+    Test that long texts are cut to the segment limit and link to the alert
+    :return: None
+    """
+    link = "https://dora.example.org/alerts/42"
+    compacted = compact(text, 2, link)
+    assert segments(compacted) == 2
+    assert compacted.endswith(f"... {link}")
+    assert text.startswith(compacted[: -len(f"... {link}")])
@@ -0,0 +1,83 @@
+import smtplib
+import socket
+from email.mime.text import MIMEText
+
+import pytest
+
+from app.smtp_pool import SMTPPool
+from tests.fakes import FakeSMTPServer
+
+
+@pytest.fixture
+def smtp_server():
+    with FakeSMTPServer() as server:
+        yield server
+
+
+def make_pool(server, **kwargs):
+    return SMTPPool(
+        server.host, server.port, "dora", "secret", starttls=False, **kwargs
+    )
+
+
+def make_message(to):
+    message = MIMEText("test")
+    message["From"] = "dora@example.com"
+    message["To"] = to
+    return message
+
+
+def test_sessions_are_reused(smtp_server):
+    """
+    Test that many messages share a single authenticated session
+    :return: None
+    """
+    pool = make_pool(smtp_server)
+    for i in range(20):
+        pool.send_message(make_message(f"user{i}@example.com"))
+    pool.close()
+    assert len(smtp_server.messages) == 20
+    assert smtp_server.connections == 1
+    assert smtp_server.logins == 1
+
+
+def test_reconnects_after_dropped_session(smtp_server):
+    """
+    Test that a dropped session is replaced and the message still sent
+    :return: None
+    """
+    pool = make_pool(smtp_server)
+    pool.send_message(make_message("first@example.com"))
+    with pool.connection() as server:
+        server.sock.shutdown(socket.SHUT_RDWR)  # simulate the server hanging up
+    pool.send_message(make_message("second@example.com"))
+    pool.close()
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
+
+
+def test_idle_sessions_are_closed(smtp_server):
+    """
+    Test that sessions idle past the timeout are closed
+    :return: None
+    """
+    pool = make_pool(smtp_server, idle_timeout=0)
+    pool.send_message(make_message("user@example.com"))
+    pool.close_idle()
+    assert not pool._idle
+    pool.close()
+
+
+def test_refused_recipient_keeps_session():
+    """
+    Test that an SMTP error reply is raised without dropping the session
+    :return: None
+    """
+    with FakeSMTPServer(refused=["gone@example.com"]) as smtp_server:
+        pool = make_pool(smtp_server)
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.sendmail("dora@example.com", "gone@example.com", b"Subject: x\r\n")
+        pool.sendmail("dora@example.com", "user@example.com", b"Subject: x\r\n")
+        pool.close()
+        assert len(smtp_server.messages) == 1
+        assert smtp_server.connections == 1
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from app.subscriber_import import SubscriberImporter
+
+SUBSCRIBER = {
+    "first_name": "Ada",
+    "last_name": "Lovelace",
+    "email": "ada@example.com",
+    "phone_number": "+15550000001",
+    "language": "en",
+    "pin_code": 411001,
+    "city": "Pune",
+    "state": "Maharashtra",
+    "country": "India",
+}
+
+
+async def stream(data, size=7):
+    """Yield the upload in small chunks to split lines and characters"""
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.fixture
+def importer(mocker):
+    importer = SubscriberImporter(mocker.MagicMock(), chunk_size=2)
+    mocker.patch.object(importer, "stage")
+    mocker.patch.object(importer, "merge", return_value=(3, 0))
+    return importer
+
+
+def test_import_csv(importer):
+    """
+    Test that valid CSV rows are staged in chunks and invalid ones reported
+    :return: None
+    """
+    header = ",".join(SUBSCRIBER)
+
+    def row(i):
+        subscriber = {
+            **SUBSCRIBER,
+            "email": f"ada{i}@example.com",
+            "phone_number": f"+1555000000{i}",
+        }
+        return ",".join(str(value) for value in subscriber.values())
+
+    data = "\n".join([header, row(1), row(2), "not,enough", row(3)]).encode()
+    report = asyncio.run(importer.run(stream(data), "csv"))
+    assert report["received"] == 4
+    assert report["inserted"] == 3
+    assert report["errors"] == [{"line": 4, "detail": "Malformed record"}]
+    assert [len(call.args[0]) for call in importer.stage.call_args_list] == [2, 1]
+
+
+def test_import_csv_quoted_newlines(importer):
+    """
+    Test that a quoted field spanning lines stays in its record, which is
+    reported by its first line
+    :return: None
+    """
+    header = ",".join(SUBSCRIBER)
+    values = [f'"{value}"' for value in SUBSCRIBER.values()]
+    values[0] = '"Ada\r\n""Countess"""'
+    data = "\r\n".join([header, ",".join(values), "", '"not,""closed\n']).encode()
+    report = asyncio.run(importer.run(stream(data), "csv"))
+    assert report["received"] == 2
+    assert report["errors"] == [{"line": 5, "detail": "Malformed record"}]
+    [rows] = importer.stage.call_args.args
+    assert rows[0][:2] == [2, 'Ada\n"Countess"']
+
+
+def test_import_csv_stray_quotes(importer):
+    """
+    Test that a quote inside an unquoted field is kept as text, and that
+    every line after a quote that is never closed is reported
+    :return: None
+    """
+    header = ",".join(SUBSCRIBER)
+
+    def row(i, last_name):
+        subscriber = {
+            **SUBSCRIBER,
+            "last_name": last_name,
+            "email": f"ada{i}@example.com",
+            "phone_number": f"+1555000000{i}",
+        }
+        return ",".join(str(value) for value in subscriber.values())
+
+    lines = [header, row(1, 'O"Brien'), row(2, "Lovelace"), row(3, '"Byron')]
+    data = "\n".join(lines + [row(4, "King"), row(5, "Lovelace")]).encode()
+    report = asyncio.run(importer.run(stream(data), "csv"))
+    assert report["received"] == 5
+    assert [error["line"] for error in report["errors"]] == [4, 5, 6]
+    [rows] = importer.stage.call_args.args
+    assert [row[:3] for row in rows] == [[2, "Ada", 'O"Brien'], [3, "Ada", "Lovelace"]]
+
+
+def test_import_ndjson_reports_invalid_rows(importer):
+    """
+    Test that NDJSON records failing schema validation are reported by line
+    :return: None
+    """
+    lines = [
+        json.dumps(SUBSCRIBER),
+        json.dumps({**SUBSCRIBER, "email": "not-an-email"}),
+        "{broken",
+    ]
+    report = asyncio.run(importer.run(stream("\n".join(lines).encode()), "ndjson"))
+    assert report["received"] == 3
+    assert [error["line"] for error in report["errors"]] == [2, 3]
+    assert report["errors"][0]["detail"][0]["loc"] == ("email",)
+    [rows] = importer.stage.call_args.args
+    assert rows[0][0] == 1
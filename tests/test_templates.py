@@ -0,0 +1,65 @@
+from email import message_from_bytes
+from email.header import decode_header, make_header
+
+from app.schemas import AlertCreateRequest
+from app.smtp_pool import SMTPPool
+from app.templates import MessageRenderer, language_of
+from tests.fakes import FakeSMTPServer
+
+ALERT = AlertCreateRequest(
+    title="Flood", description="Move to higher ground", severity="high"
+)
+
+
+def test_language_of_falls_back_to_default():
+    """
+    Test that stored languages map to a template language
+    :return: None
+    """
+    assert language_of("HI") == "hi"
+    assert language_of("es-MX") == "es"
+    assert language_of(None) == "en"
+    assert language_of("xx") == "en"
+
+
+def test_variants_are_rendered_once():
+    """
+    Test that every (language, channel) variant is rendered a single time
+    :return: None
+    """
+    renderer = MessageRenderer(ALERT, "dora@example.com")
+    assert renderer.text("en") == "Severity[high]: Flood\nMove to higher ground"
+    assert renderer.text("hi").startswith("गंभीरता[high]")
+    assert renderer.email("en") is renderer.email("EN")
+    assert renderer.text("xx") is renderer.text("en")
+    assert sorted(renderer.cache) == [
+        ("en", "email"),
+        ("en", "text"),
+        ("hi", "text"),
+    ]
+
+
+def test_encoded_email_only_needs_a_to_header():
+    """
+    Test that a cached email sent with a prepended To header arrives intact
+    :return: None
+    """
+    renderer = MessageRenderer(ALERT, "dora@example.com")
+    with FakeSMTPServer() as server:
+        pool = SMTPPool(server.host, server.port, "dora", "secret", starttls=False)
+        for address in ("a@example.com", "b@example.com"):
+            pool.sendmail(
+                "dora@example.com",
+                address,
+                b"To: " + address.encode() + b"\r\n" + renderer.email("hi"),
+            )
+        pool.close()
+    messages = [message_from_bytes(data) for data in server.messages]
+    assert [message["To"] for message in messages] == [
+        "a@example.com",
+        "b@example.com",
+    ]
+    subject = str(make_header(decode_header(messages[0]["Subject"])))
+    assert subject == "Dora से चेतावनी: गंभीरता[high]: Flood"
+    body = messages[0].get_payload()[0].get_payload(decode=True).decode()
+    assert body == "Move to higher ground"
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.helpers import create_jwt_token, get_user, token_cache
+from app.metrics import metrics
+from app.token_cache import TokenCache
+
+
+def test_cache_is_lru_bounded():
+    """
+    Test that the least recently used token is evicted first
+    :return: None
+    """
+    cache = TokenCache(size=2)
+    cache.put("a", "alice")
+    cache.put("b", "bob")
+    assert cache.get("a") == "alice"
+    cache.put("c", "carol")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("alice", None, "carol")
+
+
+def test_cache_expires_with_token():
+    """
+    Test that an entry is not trusted past the token's exp or the ttl
+    :return: None
+    """
+    cache = TokenCache(ttl=60)
+    cache.put("expired", "alice", exp=time.time() - 1)
+    cache.put("stale", "bob")
+    assert cache.get("expired") is None
+    cache.ttl = 0
+    cache.put("stale", "bob")
+    assert cache.get("stale") is None
+
+
+def test_get_user_uses_cache():
+    """
+    Test that a token is decoded once and then served from the cache
+    :return: None
+    """
+    token_cache.clear()
+    token = create_jwt_token({"username": "alice"})
+    hits = metrics.value("dora_token_cache_total", result="hit")
+    assert get_user(token) == "alice"
+    assert get_user(token) == "alice"
+    assert metrics.value("dora_token_cache_total", result="hit") == hits + 1
+    with pytest.raises(HTTPException):
+        get_user(token + "x")
@@ -2,10 +2,11 @@
 This file contains the database helper functions.
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from app import models
-from app.db_helper import get_db
+from app.db_helper import get_async_db, get_db, get_read_db
 from app.main import app
 from app.settings import settings
 
@@ -14,6 +15,12 @@ DB_URL = f"postgresql://{settings.USERNAME}:{settings.PASSWORD}@{settings.HOST}/
 
 engine = create_engine(DB_URL)
 session_local_test = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    DB_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+async_session_local_test = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -29,5 +36,16 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    """
+    Returns an async database session
+    :return: async database session
+    """
+    async with async_session_local_test() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_read_db] = override_get_async_db
 models.Base.metadata.create_all(bind=engine)